@@ -0,0 +1,179 @@
+"""
+Time the compute part of every processor algorithm without a database.
+
+Each algorithm runs on prebuilt window frames (the read is stubbed) and
+emitted windows are counted rather than sent. Building the frame is timed
+separately, as it happens once per window.
+
+    python benchmarks/bench_algorithms.py --output results.json
+    python benchmarks/bench_algorithms.py --baseline results.json --tolerance 0.2
+"""
+
+import datetime as dt
+import functools
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List
+
+from harness import load_processor, main as run
+from fixtures import START, telemetry_rows, window_end
+
+processor = load_processor()
+
+from orca_python import Window  # noqa: E402
+from accumulators import TripAccumulators  # noqa: E402
+from geo import GeoIndex, Geofence, SEGMENT, ZONE  # noqa: E402
+from timebase import build_window_frame  # noqa: E402
+from windows import EveryMinutePerTripPerBus, StopVisit  # noqa: E402
+
+FIXTURES: Dict[str, List[Dict[str, Any]]] = {
+    "minute": telemetry_rows(60),
+    "minute_gaps": telemetry_rows(60, gap_every=15, duplicate_every=20),
+    "all_brake": telemetry_rows(60, all_brake=True),
+    "trip": telemetry_rows(5400, gap_every=600, duplicate_every=251, jitter_s=0.2),
+    "empty": [],
+}
+
+METRICS: Dict[str, Callable[..., Any]] = {
+    "ambient_temperature": processor._ambient_temperature,
+    "energy_efficiency": processor._energy_efficiency,
+    "service_efficiency": processor._service_efficiency,
+    "comfort_and_safety": processor._comfort_and_safety,
+    "asset_stress": processor._asset_stress,
+    "wheel_dynamics": processor._wheel_dynamics,
+}
+
+
+def _params(rows: List[Dict[str, Any]]) -> SimpleNamespace:
+    return SimpleNamespace(
+        window=Window(
+            time_from=rows[0]["time"] if rows else START,
+            time_to=window_end(rows),
+            name=EveryMinutePerTripPerBus.name,
+            version=EveryMinutePerTripPerBus.version,
+            origin="benchmark",
+            metadata={"trip_id": 1, "bus_id": 1, "route_id": 83},
+        )
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _lookback(time_from: dt.datetime, time_to: dt.datetime) -> List[Dict[str, Any]]:
+    # the brake was held for the minute before the window and released before that
+    n = int((time_to - time_from).total_seconds())
+    held = time_from >= START - dt.timedelta(minutes=1)
+    return telemetry_rows(n, start=time_from, all_brake=held)
+
+
+def _stub_lookback(params: Any, conn: Any) -> List[Dict[str, Any]]:
+    return _lookback(params["time_from"], params["time_to"])
+
+
+processor.ReadTelemetryForTripAndTime = _stub_lookback
+processor._load_trip_window = lambda trip_id, time_from, time_to: _lookback(
+    time_from, time_to
+)
+
+
+def _geo_index(fences: int) -> GeoIndex:
+    """
+    `fences` square zones of 200 m on a 400 m pitch around the fixtures'
+    positions, with a road segment across them
+    """
+    import numpy as np
+
+    side = int(np.ceil(np.sqrt(fences)))
+    squares = [
+        Geofence(
+            f"zone_{ii}",
+            ZONE,
+            np.array(
+                [
+                    [x, y, x + 200, y],
+                    [x + 200, y, x + 200, y + 200],
+                    [x + 200, y + 200, x, y + 200],
+                    [x, y + 200, x, y],
+                ],
+                dtype=float,
+            ),
+        )
+        for ii in range(fences)
+        for x, y in [((ii % side - side / 2) * 400.0, (ii // side - side / 2) * 400.0)]
+    ]
+    road = Geofence(
+        "road", SEGMENT, np.array([[-side * 200.0, 0, side * 200.0, 0]]), 10.0
+    )
+    return GeoIndex(squares + [road], origin=(47.37, 8.54), cell_m=100.0)
+
+
+def _fleet_rows(buses: int) -> List[Dict[str, Any]]:
+    """A minute of every bus, with the columns of `ReadFleetTelemetry`"""
+    columns = processor.ReadFleetTelemetryRow.__annotations__
+    return [
+        dict({key: row[key] for key in columns if key in row}, bus_id=ii)
+        for ii in range(buses)
+        for row in telemetry_rows(60, trip_id=ii, seed=ii)
+    ]
+
+
+def _accumulated(minutes: int) -> Callable[[], Any]:
+    """Add the latest minute of a trip that has already run for `minutes`"""
+    accumulators = TripAccumulators()
+    sums = processor._energy_sums(build_window_frame(FIXTURES["minute"]))
+    for minute in range(minutes):
+        time_from = START + dt.timedelta(minutes=minute)
+        accumulators.add(1, time_from, time_from - dt.timedelta(minutes=1), sums)
+    latest = START + dt.timedelta(minutes=minutes - 1)
+    return functools.partial(
+        accumulators.add, 1, latest, latest - dt.timedelta(minutes=1), sums
+    )
+
+
+def cases() -> Dict[str, Callable[[], Any]]:
+    out: Dict[str, Callable[[], Any]] = {}
+    for fixture, rows in FIXTURES.items():
+        time_to = window_end(rows)
+        frame = build_window_frame(rows, time_to)
+        params = _params(rows)
+
+        out[f"frame/{fixture}"] = functools.partial(build_window_frame, rows, time_to)
+        for metric, fn in METRICS.items():
+            out[f"{metric}/{fixture}"] = functools.partial(fn, frame)
+        out[f"stop_visits/{fixture}"] = functools.partial(
+            processor._stop_visits, frame, params
+        )
+        if rows:
+            out[f"contiguous_chunks/{fixture}"] = functools.partial(
+                processor._find_contiguous_chunks_and_emit,
+                frame.df,
+                "status_halt_brake_is_active",
+                "time",
+                1,
+                params,
+                StopVisit,
+                "benchmark",
+                None,
+            )
+
+    for buses in (2, 100, 1000):
+        rows = [{"trip_id": ii, "bus_id": ii, "route_id": 83} for ii in range(buses)]
+        out[f"active_bus_windows/{buses}"] = functools.partial(
+            processor._emit_active_bus_windows, rows, _params(FIXTURES["minute"])
+        )
+    for buses in (2, 10, 100, 1000):
+        rows = _fleet_rows(buses)
+        out[f"fleet_kpis/{buses}"] = functools.partial(
+            processor._fleet_kpis, rows, window_end(rows)
+        )
+    for fences in (10, 1000):
+        out[f"geofences/{fences}"] = functools.partial(
+            processor._geofences,
+            build_window_frame(FIXTURES["minute"]),
+            _geo_index(fences),
+        )
+    for minutes in (1, 90, 1000):
+        out[f"trip_accumulators/{minutes}"] = _accumulated(minutes)
+    return out
+
+
+if __name__ == "__main__":
+    run(cases(), __doc__.splitlines()[1])
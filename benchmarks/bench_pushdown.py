@@ -0,0 +1,108 @@
+"""
+Compare SQL pushdown against reading raw telemetry for the per-minute metrics.
+
+For one minute of the fleet, the Python path reads every active trip's raw
+telemetry, builds its frame and computes the four reduction-only metrics; the
+pushdown path runs the single `SqlPushdown` query for the window. Both run
+uncached against the database configured by the ZTBUS_* variables (set
+VIRTUAL_FLEET_SIZE to scale the fleet), and the bytes each sends back are
+measured by running its queries through `COPY ... TO STDOUT`.
+
+    PUSHDOWN_BENCH_FROM=2021-03-09T14:20 python benchmarks/bench_pushdown.py
+"""
+
+import os
+import datetime as dt
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+from harness import load_processor, main as run
+
+os.environ["PREFETCH_ENABLED"] = "false"
+processor = load_processor()
+
+from pushdown import FLEET  # noqa: E402
+from timebase import build_window_frame  # noqa: E402
+
+TIME_FROM = dt.datetime.fromisoformat(
+    os.environ.get("PUSHDOWN_BENCH_FROM", "2021-03-09T14:20")
+)
+TIME_TO = TIME_FROM + dt.timedelta(minutes=1)
+WINDOW = {"time_from": TIME_FROM, "time_to": TIME_TO}
+
+METRICS = {
+    "AmbientTemperature": processor._ambient_temperature,
+    "EnergyEfficiencyPerMinute": processor._energy_efficiency,
+    "ServiceEfficiencyPerMinute": processor._service_efficiency,
+    "AssetStressPerMinute": processor._asset_stress,
+}
+
+with processor.db_pool.connection() as conn:
+    TRIPS = [int(bus["trip_id"]) for bus in processor.ReadActiveBusses(WINDOW, conn)]
+
+
+def python_path() -> List[Dict[str, Any]]:
+    results = []
+    with processor.db_pool.connection() as conn:
+        for trip_id in TRIPS:
+            rows = processor.ReadTelemetryForTripAndTime(
+                {"trip_id": trip_id, **WINDOW}, conn
+            )
+            frame = build_window_frame(rows, TIME_TO)
+            results.append({name: fn(frame) for name, fn in METRICS.items()})
+    return results
+
+
+def pushdown_path() -> List[Dict[str, Any]]:
+    processor.pushdown._cache.evict_trip(FLEET)
+    processor.pushdown.enabled = True
+    results = []
+    for trip_id in TRIPS:
+        params = SimpleNamespace(
+            window=SimpleNamespace(
+                time_from=TIME_FROM, time_to=TIME_TO, metadata={"trip_id": trip_id}
+            )
+        )
+        results.append(
+            {name: processor.pushdown.result(name, params) for name in METRICS}
+        )
+    return results
+
+
+class _Counter:
+    def __init__(self) -> None:
+        self.bytes = 0
+
+    def write(self, data: bytes) -> None:
+        self.bytes += len(data)
+
+
+def _copied_bytes(conn: Any, query: str, params: Dict[str, Any]) -> int:
+    counter = _Counter()
+    with conn.cursor() as cur:
+        inlined = cur.mogrify(query, params).decode()
+        cur.copy_expert(f"COPY ({inlined}) TO STDOUT", counter)
+    return counter.bytes
+
+
+def transferred_bytes() -> Dict[str, int]:
+    if processor.is_virtual_fleet():
+        query_for = processor._get_virtual_telemetry_query_and_params
+    else:
+        query_for = processor._get_telemetry_query_and_params
+    with processor.db_pool.connection() as conn:
+        raw = 0
+        for trip_id in TRIPS:
+            query, params = query_for({"trip_id": trip_id, **WINDOW})
+            raw += _copied_bytes(conn, query, params)
+        pushed = _copied_bytes(conn, processor.pushdown.query(), WINDOW)
+    return {"python": raw, "pushdown": pushed}
+
+
+print(f"{len(TRIPS)} active trips in {TIME_FROM} - {TIME_TO}")
+print(f"bytes returned: {transferred_bytes()}\n")
+
+run(
+    {"python/minute": python_path, "pushdown/minute": pushdown_path},
+    __doc__.splitlines()[1],
+)
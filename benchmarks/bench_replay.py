@@ -0,0 +1,122 @@
+"""
+Replay a recorded cassette through the processor's analytics at full speed.
+
+Every per-trip window read in the cassette is turned into a frame and run
+through each per-minute algorithm, with reads served from the cassette and
+emitted windows counted rather than sent. Record a cassette by running the
+processor with DB_CASSETTE_MODE=record (and PREFETCH_ENABLED=false, so that
+only the windows themselves are read).
+
+    python benchmarks/bench_replay.py cassette.npz [--profile replay.pstats]
+"""
+
+import os
+import sys
+import time
+import argparse
+import cProfile
+import datetime as dt
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Any, Callable, Dict
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+parser.add_argument("cassette")
+parser.add_argument("--profile", help="write a cProfile of the replay here")
+args = parser.parse_args()
+
+os.environ["DB_CASSETTE_MODE"] = "replay"
+os.environ["DB_CASSETTE_PATH"] = os.path.abspath(args.cassette)
+os.environ["PREFETCH_ENABLED"] = "false"
+
+from harness import load_processor  # noqa: E402
+
+processor = load_processor()
+
+from orca_python import Window  # noqa: E402
+from windows import EveryMinute, EveryMinutePerTripPerBus  # noqa: E402
+
+ALGORITHMS: Dict[str, Callable[[Any], Any]] = {
+    "ambient_temperature": processor._ambient_temperature,
+    "energy_efficiency": processor._energy_efficiency,
+    "service_efficiency": processor._service_efficiency,
+    "comfort_and_safety": processor._comfort_and_safety,
+    "asset_stress": processor._asset_stress,
+}
+
+
+def _params(window_type: Any, call: Dict[str, Any]) -> SimpleNamespace:
+    return SimpleNamespace(
+        window=Window(
+            time_from=dt.datetime.fromisoformat(call["time_from"]),
+            time_to=dt.datetime.fromisoformat(call["time_to"]),
+            name=window_type.name,
+            version=window_type.version,
+            origin="replay",
+            metadata={"trip_id": call.get("trip_id")},
+        )
+    )
+
+
+def replay() -> None:
+    seconds: Dict[str, float] = defaultdict(float)
+    cassette = processor.cassette
+
+    def timed(name: str, fn: Callable[[], Any]) -> Any:
+        start = time.perf_counter()
+        result = fn()
+        seconds[name] += time.perf_counter() - start
+        return result
+
+    minutes = [
+        _params(EveryMinute, call)
+        for call in cassette.recorded_params("ReadActiveBusses")
+    ]
+    windows = [
+        _params(EveryMinutePerTripPerBus, call)
+        for call in cassette.recorded_params("ReadTelemetryForTripAndTime")
+        if call.get("trip_id") is not None
+    ]
+
+    start = time.perf_counter()
+    for params in minutes:
+        buses = timed(
+            "read_active_buses",
+            lambda: processor.ReadActiveBusses(
+                {
+                    "time_from": params.window.time_from,
+                    "time_to": params.window.time_to,
+                },
+                None,
+            ),
+        )
+        timed(
+            "emit_active_bus_windows",
+            lambda: processor._emit_active_bus_windows(buses, params),
+        )
+    for params in windows:
+        frame = timed(
+            "read_and_build_frame", lambda: processor._read_trip_frame(params)
+        )
+        for name, fn in ALGORITHMS.items():
+            timed(name, lambda: fn(frame))
+        timed("stop_visits", lambda: processor._stop_visits(frame, params))
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"Replayed {len(minutes)} minutes and {len(windows)} trip windows in "
+        f"{elapsed:.2f}s ({len(windows) / elapsed:.0f} windows/s), "
+        f"{processor.window_emitter.emitted} windows emitted"
+    )
+    for name, total in sorted(seconds.items(), key=lambda item: -item[1]):
+        print(f"{name:<26}{total * 1000:>10.1f}ms{total / elapsed * 100:>7.1f}%")
+    print(cassette.stats)
+
+
+if args.profile:
+    profile = cProfile.Profile()
+    profile.runcall(replay)
+    profile.dump_stats(args.profile)
+    sys.stderr.write(f"Profile written to {args.profile}\n")
+else:
+    replay()
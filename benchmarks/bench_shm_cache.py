@@ -0,0 +1,184 @@
+"""
+Check and time the shared-memory telemetry cache across processes.
+
+Several worker processes read the same telemetry windows through one
+`SharedTelemetryCache` at the same time, with fewer slots than windows so
+that eviction runs while others read. Every window read is compared with the
+rows the loader produced, and the number of loads is compared with the number
+of windows: without the shared cache each worker would load every window.
+A hit is then timed as the processor uses it, building the window's frame
+from the attached columns, against decoding it into rows first. Exits
+non-zero when a worker reads a wrong window or the two frames differ.
+
+    python benchmarks/bench_shm_cache.py [--workers 8] [--windows 64] [--slots 32]
+"""
+
+import os
+import sys
+import time
+import argparse
+import datetime as dt
+import multiprocessing as mp
+from typing import Any, Dict, List, Tuple
+
+from harness import PROCESSOR_DIR
+from fixtures import START, telemetry_rows
+
+sys.path.insert(0, PROCESSOR_DIR)
+
+from shm_cache import SharedTelemetryCache  # noqa: E402
+from timebase import build_window_frame, window_frame  # noqa: E402
+
+ROWS_PER_WINDOW = 60
+
+
+def window(index: int) -> Tuple[int, dt.datetime, dt.datetime]:
+    trip_id = index % 8 + 1
+    time_from = START + dt.timedelta(minutes=index // 8)
+    return trip_id, time_from, time_from + dt.timedelta(minutes=1)
+
+
+def rows_for(index: int) -> List[Dict[str, Any]]:
+    trip_id, time_from, _ = window(index)
+    return telemetry_rows(ROWS_PER_WINDOW, trip_id, time_from, seed=index)
+
+
+def worker(
+    name: str,
+    slots: int,
+    windows: int,
+    rounds: int,
+    load_ms: float,
+    loads: Any,
+    results: Any,
+) -> None:
+    cache = SharedTelemetryCache(name, slots=slots)
+    expected = {index: rows_for(index) for index in range(windows)}
+    wrong = 0
+    start = time.perf_counter()
+    for round_ in range(rounds):
+        # every worker walks the windows from a different starting point
+        offset = (os.getpid() + round_) % windows
+        for step in range(windows):
+            index = (offset + step) % windows
+
+            def load() -> List[Dict[str, Any]]:
+                with loads.get_lock():
+                    loads.value += 1
+                time.sleep(load_ms / 1000.0)
+                return expected[index]
+
+            rows = cache.get_or_load(window(index), load)
+            if rows != expected[index]:
+                wrong += 1
+    elapsed = time.perf_counter() - start
+    results.put((os.getpid(), elapsed, wrong, cache.stats))
+    cache.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--windows", type=int, default=64)
+    parser.add_argument("--slots", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument(
+        "--load-ms", type=float, default=5.0, help="simulated query latency"
+    )
+    args = parser.parse_args()
+
+    name = f"orca-bench-{os.getpid()}"
+    owner = SharedTelemetryCache(name, slots=args.slots)
+    context = mp.get_context("spawn")
+    loads = context.Value("i", 0)
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=worker,
+            args=(
+                name,
+                args.slots,
+                args.windows,
+                args.rounds,
+                args.load_ms,
+                loads,
+                results,
+            ),
+        )
+        for _ in range(args.workers)
+    ]
+    start = time.perf_counter()
+    try:
+        for process in processes:
+            process.start()
+        reports = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+    finally:
+        owner.close()
+        owner.unlink()
+    elapsed = time.perf_counter() - start
+
+    reads = args.workers * args.windows * args.rounds
+    wrong = sum(report[2] for report in reports)
+    print(
+        f"{args.workers} workers read {reads} windows ({args.windows} distinct, "
+        f"{args.slots} slots) in {elapsed:.2f}s"
+    )
+    print(
+        f"loads: {loads.value} shared, "
+        f"{args.workers * args.windows * args.rounds} without the shared cache"
+    )
+    for pid, seconds, worker_wrong, stats in sorted(reports):
+        per_read = seconds / (args.windows * args.rounds) * 1e6
+        print(f"  worker {pid}: {per_read:.0f}us per read, {stats}")
+
+    with_cache = SharedTelemetryCache(f"{name}-timing", slots=4)
+    try:
+        key = window(0)
+        rows = rows_for(0)
+        with_cache.get_or_load(key, lambda: rows)
+        repeat = 2000
+        start = time.perf_counter()
+        for _ in range(repeat):
+            with with_cache.attach(key) as arrays:
+                assert arrays is not None
+        attach_us = (time.perf_counter() - start) / repeat * 1e6
+        start = time.perf_counter()
+        for _ in range(repeat):
+            with_cache.get(key)
+        get_us = (time.perf_counter() - start) / repeat * 1e6
+        print(
+            f"hit latency for {ROWS_PER_WINDOW} rows: attach {attach_us:.1f}us, "
+            f"decoded to rows {get_us:.1f}us"
+        )
+
+        # what the processor does on a hit: build the window's frame
+        start = time.perf_counter()
+        for _ in range(repeat):
+            window_frame(with_cache.get_frame(key), key[2])
+        columns_us = (time.perf_counter() - start) / repeat * 1e6
+        start = time.perf_counter()
+        for _ in range(repeat):
+            build_window_frame(with_cache.get(key), key[2])
+        rows_us = (time.perf_counter() - start) / repeat * 1e6
+        if not window_frame(with_cache.get_frame(key), key[2]).df.equals(
+            build_window_frame(rows, key[2]).df
+        ):
+            print("the frame built from the columns differs from the rows")
+            wrong += 1
+        print(
+            f"frame from a hit: from the columns {columns_us:.1f}us, "
+            f"through rows {rows_us:.1f}us"
+        )
+    finally:
+        with_cache.close()
+        with_cache.unlink()
+
+    if wrong:
+        print(f"{wrong} reads returned the wrong window")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Check and time the result sink against Postgres.
+
+Every per-minute metric runs on the benchmark fixtures and on one-row
+windows, whose variances and quantiles come out NaN, and each result is
+recorded through a `ResultSink` and flushed with `COPY`. Exits non-zero when
+a row is dropped or a result does not read back from `algorithm_results`.
+The rows are written under a `bench:` algorithm prefix and deleted after.
+Reads the `ZTBUS_*` variables.
+
+    python benchmarks/bench_sink.py [--rounds 20] [--batch 5000]
+"""
+
+import sys
+import json
+import time
+import argparse
+from typing import Any, List, Tuple
+
+from harness import load_processor
+from fixtures import telemetry_rows
+
+processor = load_processor()
+
+from orca_python import StructResult  # noqa: E402
+from db import db_pool  # noqa: E402
+from sink import ResultSink  # noqa: E402
+from timebase import build_window_frame  # noqa: E402
+
+from bench_algorithms import FIXTURES, METRICS, _params  # noqa: E402
+
+PREFIX = "bench:"
+
+
+def results() -> List[Tuple[str, Any, StructResult]]:
+    fixtures = dict(FIXTURES, one_row=telemetry_rows(1))
+    out = []
+    for fixture, rows in fixtures.items():
+        frame = build_window_frame(rows)
+        params = _params(rows)
+        for metric, fn in METRICS.items():
+            out.append((f"{PREFIX}{metric}/{fixture}", params, StructResult(fn(frame))))
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--batch", type=int, default=5000)
+    args = parser.parse_args()
+
+    computed = results()
+    sink = ResultSink(db_pool, max_rows=args.batch, max_latency_ms=60_000)
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        for name, params, result in computed:
+            sink.record(name, "1.0.0", params, result)
+    sink.flush()
+    elapsed = time.perf_counter() - start
+
+    with db_pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT result::text FROM algorithm_results WHERE algorithm LIKE %s",
+                (PREFIX + "%",),
+            )
+            stored = [json.loads(row[0]) for row in cur]
+            cur.execute(
+                "DELETE FROM algorithm_results WHERE algorithm LIKE %s",
+                (PREFIX + "%",),
+            )
+        conn.commit()
+
+    recorded = len(computed) * args.rounds
+    print(
+        f"recorded {recorded} results in {elapsed:.2f}s "
+        f"({recorded / elapsed:.0f} results/s): {sink.stats}"
+    )
+    if sink.stats.rows_dropped or len(stored) != recorded:
+        print(f"{sink.stats.rows_dropped} dropped, {len(stored)} of {recorded} stored")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark the shared per-window timebase.
+
+Times building a window frame once and running the time-weighted metrics on
+it, against every metric building its own frame, on windows with gaps,
+duplicate timestamps and jittered sampling. Also reports how far the old
+fixed 1 s assumption is off on each window.
+
+    python benchmarks/bench_timebase.py [--repeat 200] [--baseline ...]
+"""
+
+from typing import Any, Callable, Dict, List
+
+from harness import load_processor, main as run
+from fixtures import telemetry_rows, window_end
+
+processor = load_processor()
+
+from timebase import build_window_frame  # noqa: E402
+
+METRICS = (
+    processor._energy_efficiency,
+    processor._service_efficiency,
+    processor._comfort_and_safety,
+)
+
+CASES: Dict[str, Dict[str, Any]] = {
+    "minute": dict(n=60),
+    "minute_gaps": dict(n=60, gap_every=15),
+    "minute_duplicates": dict(n=60, duplicate_every=10),
+    "minute_jitter": dict(n=60, jitter_s=0.4),
+    "trip_gaps": dict(n=3600, gap_every=300, duplicate_every=97, jitter_s=0.2),
+}
+
+
+def _shared(rows: List[Dict[str, Any]], time_to: Any) -> None:
+    frame = build_window_frame(rows, time_to)
+    for metric in METRICS:
+        metric(frame)
+
+
+def _per_metric(rows: List[Dict[str, Any]], time_to: Any) -> None:
+    for metric in METRICS:
+        metric(build_window_frame(rows, time_to))
+
+
+def _grid(rows: List[Dict[str, Any]], time_to: Any) -> None:
+    build_window_frame(rows, time_to).grid_1hz()
+
+
+def cases() -> Dict[str, Callable[[], Any]]:
+    out: Dict[str, Callable[[], Any]] = {}
+    for name, kwargs in CASES.items():
+        rows = telemetry_rows(**kwargs)
+        time_to = window_end(rows)
+        out[f"shared/{name}"] = lambda r=rows, t=time_to: _shared(r, t)
+        out[f"per_metric/{name}"] = lambda r=rows, t=time_to: _per_metric(r, t)
+        out[f"grid_1hz/{name}"] = lambda r=rows, t=time_to: _grid(r, t)
+    return out
+
+
+def fixed_step_error() -> None:
+    """How far the old fixed 1 s integration is off on each case"""
+    for name, kwargs in CASES.items():
+        rows = telemetry_rows(**kwargs)
+        kwh = processor._energy_efficiency(build_window_frame(rows, window_end(rows)))[
+            "kwh"
+        ]
+        kwh_1s = sum(row["electric_power_demand"] for row in rows) / 3600.0
+        print(f"{name:<20}1 s kWh error {abs(kwh_1s - kwh) / kwh * 100:>5.1f}%")
+
+
+if __name__ == "__main__":
+    fixed_step_error()
+    print()
+    run(cases(), __doc__.splitlines()[1])
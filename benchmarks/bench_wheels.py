@@ -0,0 +1,104 @@
+"""
+Benchmark the wheel dynamics channel matrix as channels are added.
+
+Evaluates 10 (the default set) up to 160 derived wheel channels per window,
+once through `ChannelMatrix` and once column by column with pandas, on a
+one-minute window and a full trip. The matrix cost should stay roughly
+flat while the per-column cost grows with the channel count.
+
+    python benchmarks/bench_wheels.py [--repeat 100] [--baseline ...]
+"""
+
+import random
+import functools
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from harness import load_processor, main as run
+from fixtures import telemetry_rows, window_end
+
+load_processor()
+
+from timebase import build_window_frame  # noqa: E402
+from wheels import (  # noqa: E402
+    N_INPUTS,
+    SPEED_COLUMN,
+    WHEEL_COLUMNS,
+    ChannelMatrix,
+    DerivedChannel,
+    default_channels,
+    wheel_dynamics,
+    wheel_inputs,
+)
+
+COUNTS = (10, 20, 40, 80, 160)
+INPUT_COLUMNS = list(WHEEL_COLUMNS) + [SPEED_COLUMN]
+
+
+def channels(count: int) -> List[DerivedChannel]:
+    """The default channels padded with random ratios of the inputs"""
+    rng = random.Random(count)
+    out = default_channels()
+    while len(out) < count:
+        out.append(
+            DerivedChannel(
+                f"extra_{len(out)}",
+                tuple(rng.uniform(-1, 1) for _ in range(N_INPUTS)),
+                tuple(rng.uniform(0, 1) for _ in range(N_INPUTS)),
+                0.1,
+            )
+        )
+    return out
+
+
+def per_column(
+    df: pd.DataFrame, dt_s: np.ndarray, derived: List[DerivedChannel]
+) -> Dict[str, Any]:
+    """Each channel computed on its own with pandas"""
+    weights = pd.Series(dt_s, index=df.index)
+    out = {}
+    for channel in derived:
+        numerator = sum(
+            df[col] * w for col, w in zip(INPUT_COLUMNS, channel.numerator) if w
+        )
+        denominator = sum(
+            df[col] * w for col, w in zip(INPUT_COLUMNS, channel.denominator) if w
+        )
+        values = (numerator / denominator).where(denominator.abs() >= 1.0)
+        valid = values.notna()
+        valid_s = weights[valid].sum()
+        out[channel.name] = (
+            (values[valid] * weights[valid]).sum() / valid_s,
+            values.abs().max(),
+            weights[valid & (values.abs() > channel.threshold)].sum() / valid_s,
+        )
+    return out
+
+
+def cases() -> Dict[str, Callable[[], Any]]:
+    out: Dict[str, Callable[[], Any]] = {}
+    fixtures = {
+        "minute": telemetry_rows(60),
+        "trip": telemetry_rows(5400, gap_every=600),
+    }
+    for fixture, rows in fixtures.items():
+        frame = build_window_frame(rows, window_end(rows))
+        for count in COUNTS:
+            derived = channels(count)
+            matrix = ChannelMatrix(derived)
+            out[f"matrix/{fixture}/{count}"] = functools.partial(
+                lambda df, dt_s, m: wheel_dynamics(wheel_inputs(df), dt_s, m),
+                frame.df,
+                frame.timebase.dt_s,
+                matrix,
+            )
+            out[f"per_column/{fixture}/{count}"] = functools.partial(
+                per_column, frame.df, frame.timebase.dt_s, derived
+            )
+    return out
+
+
+if __name__ == "__main__":
+    run(cases(), __doc__.splitlines()[1])
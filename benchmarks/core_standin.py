@@ -0,0 +1,469 @@
+"""
+Load-test the processor end to end against a local stand-in for Orca-core.
+
+The stand-in serves the core's gRPC API: it accepts the processor's
+registration, then dispatches `EveryMinute` windows over `ExecuteDagPart`, one
+minute after another from `--from`, at `--rate` windows a second with at most
+`--concurrency` requests in flight. Each request carries every registered
+algorithm for the window's type, as the core sends them. Windows the processor
+emits are collected and, as in the core, dispatched to the algorithms
+registered for their type, so `FindActiveBusses` drives the
+`EveryMinutePerTripPerBus` algorithms. `--trip` dispatches per-trip windows
+for the given trips directly as well.
+
+At the end it reports the throughput, the latency percentiles per window type
+and per algorithm, the windows emitted and the errors. Latency is measured
+from when a window was due, so a processor that falls behind the rate shows
+it. Exits non-zero when any request or algorithm failed.
+
+    python benchmarks/core_standin.py --spawn --from 2021-03-09T14:00 --minutes 30
+
+Without `--spawn`, start the processor yourself with ORCA_CORE pointing at
+`--listen` (default localhost:5377).
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+import subprocess
+import datetime as dt
+from collections import Counter, defaultdict
+from concurrent import futures
+from typing import Any, Dict, List, Optional, Tuple
+
+import grpc
+import service_pb2 as pb
+import service_pb2_grpc
+import google.protobuf.struct_pb2 as struct_pb2
+from google.protobuf import json_format, timestamp_pb2
+
+from harness import PROCESSOR_DIR
+
+ORIGIN = "core_standin"
+EVERY_MINUTE = ("EveryMinute", "1.0.0")
+PER_TRIP = ("EveryMinutePerTripPerBus", "1.0.0")
+
+WindowTypeKey = Tuple[str, str]
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """Nearest-rank percentile of sorted samples"""
+    if not samples:
+        return float("nan")
+    return samples[min(int(len(samples) * q), len(samples) - 1)]
+
+
+def make_window(
+    window_type: WindowTypeKey,
+    time_from: dt.datetime,
+    time_to: dt.datetime,
+    metadata: Optional[Dict[str, Any]] = None,
+) -> pb.Window:
+    _time_from = timestamp_pb2.Timestamp()
+    _time_from.FromDatetime(time_from)
+    _time_to = timestamp_pb2.Timestamp()
+    _time_to.FromDatetime(time_to)
+
+    window = pb.Window()
+    window.time_from.CopyFrom(_time_from)
+    window.time_to.CopyFrom(_time_to)
+    window.window_type_name, window.window_type_version = window_type
+    window.origin = ORIGIN
+    struct_value = struct_pb2.Struct()
+    json_format.ParseDict(metadata or {}, struct_value)
+    window.metadata.CopyFrom(struct_value)
+    return window
+
+
+class Stats:
+    """Latencies, statuses and errors collected from every request"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.windows: Dict[str, List[float]] = defaultdict(list)
+        self.algorithms: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.rpc_errors: Counter = Counter()
+        self.missing_results = 0
+        self.emitted: Counter = Counter()
+        self.emitted_unhandled: Counter = Counter()
+
+    def window_done(self, window_type: str, latency_s: float) -> None:
+        with self._lock:
+            self.windows[window_type].append(latency_s)
+
+    def result(self, algorithm: str, status: str, latency_s: float) -> None:
+        with self._lock:
+            self.algorithms[algorithm].append(latency_s)
+            self.statuses[algorithm][status] += 1
+
+    def rpc_error(self, window_type: str, code: str) -> None:
+        with self._lock:
+            self.rpc_errors[f"{window_type}: {code}"] += 1
+
+    def missing(self, count: int) -> None:
+        with self._lock:
+            self.missing_results += count
+
+    def emit(self, window_type: str, handled: bool) -> None:
+        with self._lock:
+            self.emitted[window_type] += 1
+            if not handled:
+                self.emitted_unhandled[window_type] += 1
+
+    def errors(self) -> int:
+        failed = sum(
+            count
+            for statuses in self.statuses.values()
+            for status, count in statuses.items()
+            if status != "RESULT_STATUS_SUCEEDED"
+        )
+        return failed + sum(self.rpc_errors.values()) + self.missing_results
+
+    def summary(self, elapsed_s: float) -> Dict[str, Any]:
+        def latencies(samples: List[float]) -> Dict[str, float]:
+            samples = sorted(samples)
+            return {
+                "count": len(samples),
+                "p50_ms": percentile(samples, 0.50) * 1000,
+                "p95_ms": percentile(samples, 0.95) * 1000,
+                "p99_ms": percentile(samples, 0.99) * 1000,
+                "max_ms": (samples[-1] if samples else float("nan")) * 1000,
+            }
+
+        with self._lock:
+            windows = sum(len(samples) for samples in self.windows.values())
+            results = sum(len(samples) for samples in self.algorithms.values())
+            return {
+                "elapsed_s": elapsed_s,
+                "windows": windows,
+                "windows_per_s": windows / elapsed_s if elapsed_s else 0.0,
+                "results": results,
+                "results_per_s": results / elapsed_s if elapsed_s else 0.0,
+                "errors": self.errors(),
+                "rpc_errors": dict(self.rpc_errors),
+                "missing_results": self.missing_results,
+                "window_latency": {
+                    name: latencies(samples) for name, samples in self.windows.items()
+                },
+                "algorithm_latency": {
+                    name: latencies(samples)
+                    for name, samples in sorted(self.algorithms.items())
+                },
+                "statuses": {
+                    name: dict(statuses)
+                    for name, statuses in sorted(self.statuses.items())
+                },
+                "emitted": dict(self.emitted),
+                "emitted_unhandled": dict(self.emitted_unhandled),
+            }
+
+
+class Dispatcher:
+    """Sends windows to the processor's `ExecuteDagPart` from a thread pool"""
+
+    def __init__(self, stats: Stats, concurrency: int, timeout_s: float) -> None:
+        self.stats = stats
+        self.timeout_s = timeout_s
+        self.algorithms: Dict[WindowTypeKey, List[pb.Algorithm]] = {}
+        self._stub: Optional[service_pb2_grpc.OrcaProcessorStub] = None
+        self._channel: Optional[grpc.Channel] = None
+        self._pool = futures.ThreadPoolExecutor(max_workers=concurrency)
+        self._outstanding = 0
+        self._idle = threading.Condition()
+        self.last_done = time.perf_counter()
+
+    def connect(self, address: str, timeout_s: float) -> None:
+        self._channel = grpc.insecure_channel(
+            address, options=[("grpc.max_receive_message_length", 50 * 1024 * 1024)]
+        )
+        grpc.channel_ready_future(self._channel).result(timeout=timeout_s)
+        self._stub = service_pb2_grpc.OrcaProcessorStub(self._channel)
+
+    def handles(self, window_type: WindowTypeKey) -> bool:
+        return bool(self.algorithms.get(window_type))
+
+    def submit(self, window: pb.Window, due: Optional[float] = None) -> None:
+        """Queue a window; its latency counts from `due`, by default now"""
+        with self._idle:
+            self._outstanding += 1
+        self._pool.submit(self._execute, window, due or time.perf_counter())
+
+    def wait(self, settle_s: float = 1.0) -> None:
+        """
+        Block until every queued window, and any it emitted, has completed.
+        Windows the emitter flushes in the background can arrive after the
+        request that emitted them, so the dispatcher must stay idle for
+        `settle_s` too
+        """
+        with self._idle:
+            while True:
+                self._idle.wait_for(lambda: self._outstanding == 0)
+                if not self._idle.wait_for(lambda: self._outstanding > 0, settle_s):
+                    return
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+        if self._channel is not None:
+            self._channel.close()
+
+    def _execute(self, window: pb.Window, due: float) -> None:
+        window_type = (window.window_type_name, window.window_type_version)
+        algorithms = self.algorithms.get(window_type, [])
+        name = window.window_type_name
+        try:
+            assert self._stub is not None
+            request = pb.ExecutionRequest(
+                exec_id=str(uuid.uuid4()), window=window, algorithms=algorithms
+            )
+            received = 0
+            for response in self._stub.ExecuteDagPart(request, timeout=self.timeout_s):
+                result = response.algorithm_result
+                self.stats.result(
+                    f"{result.algorithm.name}@{result.algorithm.version}",
+                    pb.ResultStatus.Name(result.result.status),
+                    time.perf_counter() - due,
+                )
+                received += 1
+            if received < len(algorithms):
+                self.stats.missing(len(algorithms) - received)
+            self.stats.window_done(name, time.perf_counter() - due)
+        except grpc.RpcError as e:
+            self.stats.rpc_error(name, e.code().name)
+        finally:
+            with self._idle:
+                self._outstanding -= 1
+                self.last_done = time.perf_counter()
+                self._idle.notify_all()
+
+
+class CoreStandIn(service_pb2_grpc.OrcaCoreServicer):
+    """The registration and window emission half of Orca-core"""
+
+    def __init__(self, dispatcher: Dispatcher, follow_emitted: bool) -> None:
+        self.dispatcher = dispatcher
+        self.follow_emitted = follow_emitted
+        self.registration: Optional[pb.ProcessorRegistration] = None
+        self.registered = threading.Event()
+
+    def RegisterProcessor(
+        self, request: pb.ProcessorRegistration, context: grpc.ServicerContext
+    ) -> pb.Status:
+        algorithms: Dict[WindowTypeKey, List[pb.Algorithm]] = defaultdict(list)
+        for algorithm in request.supported_algorithms:
+            window_type = (algorithm.window_type.name, algorithm.window_type.version)
+            algorithms[window_type].append(algorithm)
+        self.dispatcher.algorithms = dict(algorithms)
+        self.registration = request
+        self.registered.set()
+        return pb.Status(
+            received=True,
+            message=f"Registered {len(request.supported_algorithms)} algorithms",
+        )
+
+    def EmitWindow(
+        self, request: pb.Window, context: grpc.ServicerContext
+    ) -> pb.WindowEmitStatus:
+        window_type = (request.window_type_name, request.window_type_version)
+        handled = self.follow_emitted and self.dispatcher.handles(window_type)
+        self.dispatcher.stats.emit(request.window_type_name, handled)
+        if not handled:
+            return pb.WindowEmitStatus(
+                status=pb.WindowEmitStatus.StatusEnum.NO_TRIGGERED_ALGORITHMS
+            )
+        self.dispatcher.submit(request)
+        return pb.WindowEmitStatus(
+            status=pb.WindowEmitStatus.StatusEnum.PROCESSING_TRIGGERED
+        )
+
+
+def spawn_processor(core: str, processor: str, log: Any) -> subprocess.Popen:
+    env = dict(os.environ, ORCA_CORE=core, PROCESSOR_ADDRESS=processor)
+    # the stand-in only speaks plaintext gRPC
+    env.pop("ENV", None)
+    env.pop("PROCESSOR_EXTERNAL_PORT", None)
+    return subprocess.Popen(
+        [sys.executable, "main.py"],
+        cwd=PROCESSOR_DIR,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+
+
+def dispatch(
+    dispatcher: Dispatcher,
+    start: dt.datetime,
+    minutes: int,
+    rate: float,
+    trips: List[int],
+) -> None:
+    """Send the source windows, paced at `rate` windows a second"""
+    windows = []
+    for minute in range(minutes):
+        time_from = start + dt.timedelta(minutes=minute)
+        time_to = time_from + dt.timedelta(minutes=1)
+        if dispatcher.handles(EVERY_MINUTE):
+            windows.append(make_window(EVERY_MINUTE, time_from, time_to))
+        for trip_id in trips:
+            windows.append(
+                make_window(PER_TRIP, time_from, time_to, {"trip_id": trip_id})
+            )
+
+    began = time.perf_counter()
+    for index, window in enumerate(windows):
+        due = began + index / rate if rate > 0 else time.perf_counter()
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        dispatcher.submit(window, due)
+
+
+def print_summary(summary: Dict[str, Any]) -> None:
+    print(
+        f"{summary['windows']} windows, {summary['results']} results in "
+        f"{summary['elapsed_s']:.2f}s: {summary['windows_per_s']:.1f} windows/s, "
+        f"{summary['results_per_s']:.1f} results/s, {summary['errors']} errors"
+    )
+    rows = [
+        (f"window {name}", stats) for name, stats in summary["window_latency"].items()
+    ]
+    rows += list(summary["algorithm_latency"].items())
+    width = max([len(name) for name, _ in rows] + [9])
+    print(
+        f"\n{'latency':<{width}}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}"
+        f"{'p99 ms':>10}{'max ms':>10}"
+    )
+    for name, stats in rows:
+        print(
+            f"{name:<{width}}{stats['count']:>8}{stats['p50_ms']:>10.1f}"
+            f"{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['max_ms']:>10.1f}"
+        )
+    print(f"\nemitted: {summary['emitted']}")
+    if summary["emitted_unhandled"]:
+        print(f"emitted without algorithms: {summary['emitted_unhandled']}")
+    failed = {
+        name: statuses
+        for name, statuses in summary["statuses"].items()
+        if set(statuses) != {"RESULT_STATUS_SUCEEDED"}
+    }
+    if failed:
+        print(f"failed results: {failed}")
+    if summary["rpc_errors"]:
+        print(f"rpc errors: {summary['rpc_errors']}")
+    if summary["missing_results"]:
+        print(f"algorithms without a result: {summary['missing_results']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--listen", default="localhost:5377", help="core address")
+    parser.add_argument(
+        "--processor",
+        help="processor address, by default the one it registers with",
+    )
+    parser.add_argument(
+        "--spawn",
+        action="store_true",
+        help="start processor/main.py against the stand-in",
+    )
+    parser.add_argument(
+        "--spawn-address",
+        default="localhost:5378",
+        help="PROCESSOR_ADDRESS of the spawned processor",
+    )
+    parser.add_argument("--spawn-log", default="processor.log")
+    parser.add_argument(
+        "--from",
+        dest="start",
+        type=dt.datetime.fromisoformat,
+        default=dt.datetime(2021, 3, 9, 14, 0),
+    )
+    parser.add_argument("--minutes", type=int, default=10)
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=10.0,
+        help="source windows a second, 0 for no limit",
+    )
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--trip",
+        type=int,
+        action="append",
+        default=[],
+        help="also dispatch EveryMinutePerTripPerBus windows for this trip",
+    )
+    parser.add_argument(
+        "--no-follow",
+        action="store_true",
+        help="collect emitted windows without dispatching them",
+    )
+    parser.add_argument("--timeout", type=float, default=60.0, help="per request")
+    parser.add_argument("--register-timeout", type=float, default=120.0)
+    parser.add_argument("--output", help="write the summary to this JSON file")
+    args = parser.parse_args()
+
+    stats = Stats()
+    dispatcher = Dispatcher(stats, args.concurrency, args.timeout)
+    core = CoreStandIn(dispatcher, follow_emitted=not args.no_follow)
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=16))
+    service_pb2_grpc.add_OrcaCoreServicer_to_server(core, server)
+    server.add_insecure_port(args.listen)
+    server.start()
+
+    processor: Optional[subprocess.Popen] = None
+    log = None
+    try:
+        if args.spawn:
+            log = open(args.spawn_log, "w")
+            processor = spawn_processor(args.listen, args.spawn_address, log)
+            print(
+                f"started processor (pid {processor.pid}), logging to {args.spawn_log}"
+            )
+        else:
+            print(f"waiting for a processor to register at {args.listen}")
+        if not core.registered.wait(args.register_timeout):
+            sys.exit("no processor registered")
+        registration = core.registration
+        assert registration is not None
+        address = args.processor or (
+            args.spawn_address if args.spawn else registration.connection_str
+        )
+        print(
+            f"{registration.name} registered {len(registration.supported_algorithms)} "
+            f"algorithms, serving at {address}"
+        )
+        dispatcher.connect(address, args.register_timeout)
+
+        start = time.perf_counter()
+        dispatch(dispatcher, args.start, args.minutes, args.rate, args.trip)
+        dispatcher.wait()
+        elapsed = dispatcher.last_done - start
+    finally:
+        dispatcher.close()
+        server.stop(grace=1)
+        if processor is not None:
+            processor.terminate()
+            try:
+                processor.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                processor.kill()
+        if log is not None:
+            log.close()
+
+    summary = stats.summary(elapsed)
+    print_summary(summary)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+    if summary["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
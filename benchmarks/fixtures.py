@@ -0,0 +1,90 @@
+import datetime as dt
+from typing import Any, Dict, List
+
+import numpy as np
+
+# Synthetic ZTBus telemetry shaped like `ReadTelemResultRow`, for running the
+# processor's analytics without a database
+
+START = dt.datetime(2022, 3, 1, 8, 0, 0)
+# wheel speeds are angular [rad/s], as in ZTBus; matches the processor's
+# default `WHEEL_RADIUS_M`
+WHEEL_RADIUS_M = 0.478
+STOPS = ("Hauptbahnhof", "Central", "Bellevue", "Stadelhofen", "Kreuzplatz")
+
+
+def telemetry_rows(
+    n: int,
+    trip_id: int = 1,
+    start: dt.datetime = START,
+    gap_every: int = 0,
+    gap_s: float = 12.0,
+    duplicate_every: int = 0,
+    jitter_s: float = 0.0,
+    all_brake: bool = False,
+    seed: int = 0,
+) -> List[Dict[str, Any]]:
+    """
+    `n` rows sampled at 1 Hz.
+    Every `gap_every`th step is stretched to `gap_s` seconds, every
+    `duplicate_every`th row repeats the previous timestamp, and `jitter_s`
+    adds uniform noise to the sample spacing
+    """
+    rng = np.random.default_rng(seed)
+    step = np.ones(n)
+    if jitter_s:
+        step += rng.uniform(-jitter_s, jitter_s, n)
+    if gap_every:
+        step[gap_every::gap_every] = gap_s
+    if duplicate_every:
+        step[duplicate_every::duplicate_every] = 0.0
+    step[0] = 0.0
+    offsets = np.cumsum(step)
+
+    # drive between stops with the doors open while stationary
+    phase = (np.arange(n) // 45) % 2
+    speed = np.where(phase == 0, 8.0 + rng.normal(0, 1.5, n), 0.0).clip(0)
+    wheel = speed / WHEEL_RADIUS_M
+    door_open = (phase == 1) & (np.arange(n) % 45 > 5)
+    # as in ZTBus, the stop name stays set while driving: the next stop
+    stop = np.array(STOPS)[(np.arange(n) // 90) % len(STOPS)]
+    brake = np.full(n, 4.5) if all_brake else rng.uniform(0, 2.0, n)
+
+    return [
+        {
+            "id": ii,
+            "trip_id": trip_id,
+            "time": start + dt.timedelta(seconds=float(offsets[ii])),
+            "electric_power_demand": float(speed[ii] * 20 + rng.normal(5, 2)),
+            "temperature_ambient": float(rng.normal(285, 1)),
+            "traction_brake_pressure": float(brake[ii]),
+            "traction_traction_force": float(rng.normal(1000, 200)),
+            "gnss_altitude": float(rng.normal(420, 2)),
+            "gnss_course": float(rng.uniform(0, 6.28)),
+            "gnss_latitude": 47.37 + float(rng.normal(0, 0.001)),
+            "gnss_longitude": 8.54 + float(rng.normal(0, 0.001)),
+            "itcs_bus_route_id": 83,
+            "itcs_number_of_passengers": int(rng.integers(0, 60)),
+            "itcs_stop_name": str(stop[ii]),
+            "odometry_articulation_angle": float(rng.normal(0, 0.05)),
+            "odometry_steering_angle": float(rng.normal(0, 0.1)),
+            "odometry_vehicle_speed": float(speed[ii]),
+            "odometry_wheel_speed_fl": float(wheel[ii]),
+            "odometry_wheel_speed_fr": float(wheel[ii]),
+            "odometry_wheel_speed_ml": float(wheel[ii]),
+            "odometry_wheel_speed_mr": float(wheel[ii]),
+            "odometry_wheel_speed_rl": float(wheel[ii]),
+            "odometry_wheel_speed_rr": float(wheel[ii]),
+            "status_door_is_open": bool(door_open[ii]),
+            "status_grid_is_available": False,
+            "status_halt_brake_is_active": bool(all_brake or not speed[ii]),
+            "status_park_brake_is_active": False,
+        }
+        for ii in range(n)
+    ]
+
+
+def window_end(rows: List[Dict[str, Any]]) -> dt.datetime:
+    if not rows:
+        return START + dt.timedelta(minutes=1)
+    return max(row["time"] for row in rows) + dt.timedelta(seconds=1)
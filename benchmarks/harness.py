@@ -0,0 +1,172 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import contextlib
+from dataclasses import asdict, dataclass
+from types import ModuleType
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+PROCESSOR_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "processor"
+)
+
+
+@dataclass
+class BenchResult:
+    name: str
+    repeat: int
+    min_us: float
+    median_us: float
+    p95_us: float
+    mean_us: float
+
+
+class StubEmitter:
+    """Stands in for `window_emitter`, counting windows instead of sending them"""
+
+    def __init__(self) -> None:
+        self.emitted = 0
+
+    def emit(self, window: Any) -> None:
+        self.emitted += 1
+
+    @contextlib.contextmanager
+    def batch(self) -> Iterator[None]:
+        yield
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+def load_processor() -> ModuleType:
+    """
+    Import processor/main.py without a database or an Orca core.
+    Windows go to a `StubEmitter`; reads are left to each benchmark to stub
+    """
+    if PROCESSOR_DIR not in sys.path:
+        sys.path.insert(0, PROCESSOR_DIR)
+    os.environ.setdefault("ORCA_CORE", "localhost:5377")
+    os.environ.setdefault("PROCESSOR_ADDRESS", "localhost:5378")
+
+    import main
+
+    main.window_emitter = StubEmitter()
+    return main
+
+
+def measure(
+    name: str, fn: Callable[[], Any], repeat: int = 100, warmup: int = 3
+) -> BenchResult:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return BenchResult(
+        name=name,
+        repeat=repeat,
+        min_us=samples[0],
+        median_us=statistics.median(samples),
+        p95_us=samples[min(int(len(samples) * 0.95), len(samples) - 1)],
+        mean_us=statistics.fmean(samples),
+    )
+
+
+def save(results: List[BenchResult], path: str) -> None:
+    import numpy as np
+    import pandas as pd
+
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "pandas": pd.__version__,
+                "machine": platform.machine(),
+                "results": [asdict(result) for result in results],
+            },
+            f,
+            indent=2,
+        )
+
+
+def load(path: str) -> Dict[str, BenchResult]:
+    with open(path) as f:
+        data = json.load(f)
+    return {result["name"]: BenchResult(**result) for result in data["results"]}
+
+
+def regressions(
+    results: List[BenchResult], baseline: Dict[str, BenchResult], tolerance: float
+) -> List[str]:
+    """Benchmarks whose median is more than `tolerance` slower than the baseline"""
+    return [
+        result.name
+        for result in results
+        if result.name in baseline
+        and result.median_us > baseline[result.name].median_us * (1 + tolerance)
+    ]
+
+
+def report(
+    results: List[BenchResult], baseline: Optional[Dict[str, BenchResult]] = None
+) -> None:
+    width = max([len(result.name) for result in results] + [9])
+    header = f"{'benchmark':<{width}}{'median us':>12}{'p95 us':>12}{'min us':>12}"
+    if baseline is not None:
+        header += f"{'baseline':>12}{'change':>9}"
+    print(header)
+    for result in results:
+        line = (
+            f"{result.name:<{width}}{result.median_us:>12.1f}"
+            f"{result.p95_us:>12.1f}{result.min_us:>12.1f}"
+        )
+        if baseline is not None and result.name in baseline:
+            base = baseline[result.name].median_us
+            line += f"{base:>12.1f}{(result.median_us / base - 1) * 100:>+8.1f}%"
+        print(line)
+
+
+def main(cases: Dict[str, Callable[[], Any]], description: str) -> None:
+    """Command line entry point shared by the benchmark scripts"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument("--filter", default="", help="only run names containing this")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against this results file")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="fail when a median is this fraction slower than the baseline",
+    )
+    args = parser.parse_args()
+
+    results = [
+        measure(name, fn, args.repeat)
+        for name, fn in cases.items()
+        if args.filter in name
+    ]
+    baseline = load(args.baseline) if args.baseline else None
+    report(results, baseline)
+    if args.output:
+        save(results, args.output)
+
+    if baseline is not None:
+        slower = regressions(results, baseline, args.tolerance)
+        if slower:
+            print(
+                f"\n{len(slower)} regression(s) beyond {args.tolerance:.0%}: "
+                + ", ".join(slower)
+            )
+            sys.exit(1)
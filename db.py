@@ -1,4 +1,5 @@
 import os
+import threading
 from psycopg2 import pool
 from contextlib import contextmanager
 from psycopg2.extensions import connection as PGConnection
@@ -7,31 +8,48 @@ from typing import Generator
 
 class PostgresPool:
     def __init__(self, minconn: int = 1, maxconn: int = 10) -> None:
-        # Make pool an instance attribute, not class attribute
-        self._pool: None | pool.SimpleConnectionPool = pool.SimpleConnectionPool(
-            minconn=minconn,
-            maxconn=maxconn,
-            host=os.environ["ZTBUS_ADDR"],
-            database=os.environ["ZTBUS_DB"],
-            user=os.environ["ZTBUS_USER"],
-            password=os.environ["ZTBUS_PASS"],
-            port=os.environ["ZTBUS_PORT"],
-        )
+        # Make pool an instance attribute, not class attribute. It is created
+        # on first checkout so that importing this module never connects
+        self._minconn = minconn
+        self._maxconn = maxconn
+        self._pool: None | pool.ThreadedConnectionPool = None
+        self._closed = False
+        self._lock = threading.Lock()
+        # ThreadedConnectionPool raises when it is exhausted: wait instead
+        self._available = threading.BoundedSemaphore(maxconn)
+
+    def _get_pool(self) -> pool.ThreadedConnectionPool:
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Connection pool is not initialised")
+            if self._pool is None:
+                self._pool = pool.ThreadedConnectionPool(
+                    minconn=self._minconn,
+                    maxconn=self._maxconn,
+                    host=os.environ["ZTBUS_ADDR"],
+                    database=os.environ["ZTBUS_DB"],
+                    user=os.environ["ZTBUS_USER"],
+                    password=os.environ["ZTBUS_PASS"],
+                    port=os.environ["ZTBUS_PORT"],
+                )
+            return self._pool
 
     def close_pool(self) -> None:
-        if hasattr(self, "_pool") and self._pool:
-            self._pool.closeall()
-            self._pool = None
+        with self._lock:
+            self._closed = True
+            if self._pool:
+                self._pool.closeall()
+                self._pool = None
 
     @contextmanager
     def connection(self) -> Generator[PGConnection, None, None]:
-        if not hasattr(self, "_pool") or not self._pool:
-            raise RuntimeError("Connection pool is not initialised")
-        conn = self._pool.getconn()
-        try:
-            yield conn
-        finally:
-            self._pool.putconn(conn)
+        _pool = self._get_pool()
+        with self._available:
+            conn = _pool.getconn()
+            try:
+                yield conn
+            finally:
+                _pool.putconn(conn)
 
 
-db_pool = PostgresPool()
+db_pool = PostgresPool(maxconn=int(os.environ.get("ZTBUS_POOL_MAX", "10")))
@@ -0,0 +1,655 @@
+"""
+Create `telemetry` as a partitioned table and bulk-load ZTBus CSV exports.
+
+`telemetry` is range-partitioned by month of `time`, so the processor's
+minute-range reads prune to a single partition and each month is indexed and
+vacuumed on its own. With `--by-bus` every month is list-partitioned again by
+`bus_id`. Each partition gets its own `(trip_id, time)` and `(time)` indexes,
+attached to indexes on the parent.
+
+Loading reads `metaData.csv` into `trips` and streams every trip's CSV into
+`telemetry` with `COPY`, with the trips grouped by partition and the
+partitions spread over `--jobs` processes. The indexes are built after the
+load, one partition per job. Reloading a trip replaces its rows.
+
+    python ingest.py load /data/ztbus --jobs 8 [--by-bus]
+
+`migrate` moves an existing monolithic `telemetry` table into the partitioned
+layout, one month per job, and keeps the old table as `telemetry_monolithic`.
+
+    python ingest.py migrate --jobs 8 [--by-bus]
+"""
+
+import io
+import os
+import re
+import csv
+import math
+import time
+import logging
+import argparse
+import datetime as dt
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple, TypedDict
+
+import psycopg2
+from psycopg2.extensions import connection as PGConnection
+
+LOGGER = logging.getLogger(__name__)
+
+# (column, type) in table order; `bus_id` is denormalised from `trips` so
+# that telemetry can be partitioned by bus
+TELEMETRY_COLUMNS: List[Tuple[str, str]] = [
+    ("trip_id", "BIGINT"),
+    ("bus_id", "BIGINT"),
+    ("time", "TIMESTAMP"),
+    ("electric_power_demand", "DOUBLE PRECISION"),
+    ("temperature_ambient", "DOUBLE PRECISION"),
+    ("traction_brake_pressure", "DOUBLE PRECISION"),
+    ("traction_traction_force", "DOUBLE PRECISION"),
+    ("gnss_altitude", "DOUBLE PRECISION"),
+    ("gnss_course", "DOUBLE PRECISION"),
+    ("gnss_latitude", "DOUBLE PRECISION"),
+    ("gnss_longitude", "DOUBLE PRECISION"),
+    ("itcs_bus_route_id", "BIGINT"),
+    ("itcs_number_of_passengers", "INTEGER"),
+    ("itcs_stop_name", "TEXT"),
+    ("odometry_articulation_angle", "DOUBLE PRECISION"),
+    ("odometry_steering_angle", "DOUBLE PRECISION"),
+    ("odometry_vehicle_speed", "DOUBLE PRECISION"),
+    ("odometry_wheel_speed_fl", "DOUBLE PRECISION"),
+    ("odometry_wheel_speed_fr", "DOUBLE PRECISION"),
+    ("odometry_wheel_speed_ml", "DOUBLE PRECISION"),
+    ("odometry_wheel_speed_mr", "DOUBLE PRECISION"),
+    ("odometry_wheel_speed_rl", "DOUBLE PRECISION"),
+    ("odometry_wheel_speed_rr", "DOUBLE PRECISION"),
+    ("status_door_is_open", "BOOLEAN"),
+    ("status_grid_is_available", "BOOLEAN"),
+    ("status_halt_brake_is_active", "BOOLEAN"),
+    ("status_park_brake_is_active", "BOOLEAN"),
+]
+COLUMN_TYPES = dict(TELEMETRY_COLUMNS)
+
+# indexes every partition gets, by name suffix
+INDEXES = {"trip_id_time_idx": 'trip_id, "time"', "time_idx": '"time"'}
+
+# ZTBus CSV headers that do not map to their snake_case column name
+RENAMED = {"time_iso": "time", "itcs_bus_route": "itcs_bus_route_id"}
+# numeric values ZTBus exports for a missing sample
+NULLS = {"", "-", "nan", "NaN", "None"}
+
+# metaData.csv reports distance in m and energy in J
+M_PER_KM = 1000.0
+J_PER_KWH = 3.6e6
+
+
+@dataclass(frozen=True)
+class Partition:
+    month: dt.date
+    bus_id: Optional[int] = None
+
+    @property
+    def table(self) -> str:
+        name = f"telemetry_y{self.month:%Y}m{self.month:%m}"
+        return name if self.bus_id is None else f"{name}_b{self.bus_id}"
+
+
+def connect() -> PGConnection:
+    return psycopg2.connect(
+        host=os.environ["ZTBUS_ADDR"],
+        database=os.environ["ZTBUS_DB"],
+        user=os.environ["ZTBUS_USER"],
+        password=os.environ["ZTBUS_PASS"],
+        port=os.environ["ZTBUS_PORT"],
+    )
+
+
+def snake_case(header: str) -> str:
+    """`electric_powerDemand` -> `electric_power_demand`"""
+    name = re.sub(r"(?<=[a-z0-9])([A-Z])", r"_\1", header).lower()
+    return RENAMED.get(name, name)
+
+
+def month_of(time: dt.datetime) -> dt.date:
+    return dt.date(time.year, time.month, 1)
+
+
+def next_month(month: dt.date) -> dt.date:
+    return dt.date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def months_between(first: dt.datetime, last: dt.datetime) -> List[dt.date]:
+    months = [month_of(first)]
+    while months[-1] < month_of(last):
+        months.append(next_month(months[-1]))
+    return months
+
+
+# --- Schema ---
+
+
+def ReadTelemetryKind(conn: PGConnection) -> Optional[str]:
+    """'p' for a partitioned `telemetry`, 'r' for a plain table, None if missing"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('telemetry')")
+        row = cur.fetchone()
+    return None if row is None else str(row[0])
+
+
+def CreateTripsTable(conn: PGConnection) -> None:
+    query = """
+        CREATE TABLE IF NOT EXISTS trips (
+            id BIGINT PRIMARY KEY,
+            name TEXT UNIQUE,
+            bus_id BIGINT,
+            route_id BIGINT,
+            start_time TIMESTAMP,
+            end_time TIMESTAMP,
+            driven_distance_km DOUBLE PRECISION,
+            energy_consumption_kwh DOUBLE PRECISION,
+            itcs_passengers_mean DOUBLE PRECISION,
+            itcs_passengers_min INTEGER,
+            itcs_passengers_max INTEGER,
+            grid_available_mean DOUBLE PRECISION,
+            amb_temperature_mean DOUBLE PRECISION,
+            amb_temperature_min DOUBLE PRECISION,
+            amb_temperature_max DOUBLE PRECISION
+        );
+    """
+
+    with conn.cursor() as cur:
+        cur.execute(query)
+        conn.commit()
+
+
+def CreatePartitionedTelemetryTable(
+    conn: PGConnection,
+    months: Iterable[dt.date],
+    buses: Iterable[int],
+    by_bus: bool,
+) -> List[Partition]:
+    """
+    Create `telemetry` and a partition per month (and bus), returning the
+    leaf partitions. Rows outside them go to `telemetry_default`.
+    """
+    columns = ",\n".join(
+        f'"{column}" {kind}' if column == "time" else f"{column} {kind}"
+        for column, kind in TELEMETRY_COLUMNS
+    )
+    query = f"""
+        CREATE TABLE IF NOT EXISTS telemetry (
+            id BIGSERIAL,
+            {columns}
+        ) PARTITION BY RANGE ("time");
+        CREATE TABLE IF NOT EXISTS telemetry_default
+            PARTITION OF telemetry DEFAULT;
+    """
+    leaves = []
+    for month in months:
+        partition = Partition(month)
+        bounds = f"FROM ('{month}') TO ('{next_month(month)}')"
+        if not by_bus:
+            query += f"""
+                CREATE TABLE IF NOT EXISTS {partition.table}
+                    PARTITION OF telemetry FOR VALUES {bounds};
+            """
+            leaves.append(partition)
+            continue
+        query += f"""
+            CREATE TABLE IF NOT EXISTS {partition.table}
+                PARTITION OF telemetry FOR VALUES {bounds}
+                PARTITION BY LIST (bus_id);
+            CREATE TABLE IF NOT EXISTS {partition.table}_default
+                PARTITION OF {partition.table} DEFAULT;
+        """
+        for bus_id in buses:
+            leaf = Partition(month, int(bus_id))
+            query += f"""
+                CREATE TABLE IF NOT EXISTS {leaf.table}
+                    PARTITION OF {partition.table} FOR VALUES IN ({int(bus_id)});
+            """
+            leaves.append(leaf)
+
+    with conn.cursor() as cur:
+        cur.execute(query)
+        conn.commit()
+    return leaves
+
+
+def _partition_tree(conn: PGConnection) -> List[Tuple[str, str]]:
+    """(parent, child) for every partition under `telemetry`, top down"""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT parentrelid::regclass::text, relid::regclass::text
+            FROM pg_partition_tree('telemetry')
+            WHERE parentrelid IS NOT NULL
+            ORDER BY level
+            """
+        )
+        return [(str(parent), str(child)) for parent, child in cur.fetchall()]
+
+
+def _leaf_tables(conn: PGConnection) -> List[str]:
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT relid::regclass::text FROM pg_partition_tree('telemetry') WHERE isleaf"
+        )
+        return [str(row[0]) for row in cur.fetchall()]
+
+
+def CreatePartitionIndexes(conn: PGConnection, table: str) -> None:
+    query = "".join(
+        f"CREATE INDEX IF NOT EXISTS {table}_{suffix} ON {table} ({columns});"
+        for suffix, columns in INDEXES.items()
+    )
+
+    with conn.cursor() as cur:
+        cur.execute(query)
+        conn.commit()
+
+
+def AttachTelemetryIndexes(conn: PGConnection) -> None:
+    """
+    Create the indexes on `telemetry` and each sub-partitioned month without
+    recursing, then attach the partitions' indexes to them bottom up
+    """
+    tree = _partition_tree(conn)
+    parents = ["telemetry"] + sorted({parent for parent, _ in tree} - {"telemetry"})
+    query = "".join(
+        f"CREATE INDEX IF NOT EXISTS {parent}_{suffix} ON ONLY {parent} ({columns});"
+        for parent in parents
+        for suffix, columns in INDEXES.items()
+    )
+    with conn.cursor() as cur:
+        cur.execute(query)
+        cur.execute(
+            """
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE c.relkind IN ('i', 'I')
+            """
+        )
+        attached = {str(row[0]) for row in cur.fetchall()}
+        for parent, child in reversed(tree):
+            for suffix in INDEXES:
+                if f"{child}_{suffix}" not in attached:
+                    cur.execute(
+                        f"ALTER INDEX {parent}_{suffix} ATTACH PARTITION {child}_{suffix}"
+                    )
+        conn.commit()
+
+
+# --- Trips ---
+
+
+def _float(value: str) -> Optional[float]:
+    if value in NULLS:
+        return None
+    number = float(value)
+    return None if math.isnan(number) else number
+
+
+def _int(value: str) -> Optional[int]:
+    number = _float(value)
+    return None if number is None else int(number)
+
+
+def _time(value: str) -> dt.datetime:
+    return dt.datetime.fromisoformat(value.replace("Z", "")).replace(tzinfo=None)
+
+
+class TripRow(TypedDict):
+    name: str
+    bus_id: Optional[int]
+    route_id: Optional[int]
+    start_time: dt.datetime
+    end_time: dt.datetime
+    driven_distance_km: Optional[float]
+    energy_consumption_kwh: Optional[float]
+    itcs_passengers_mean: Optional[float]
+    itcs_passengers_min: Optional[int]
+    itcs_passengers_max: Optional[int]
+    grid_available_mean: Optional[float]
+    amb_temperature_mean: Optional[float]
+    amb_temperature_min: Optional[float]
+    amb_temperature_max: Optional[float]
+
+
+def ReadTripMetadata(path: str) -> List[TripRow]:
+    """The rows of ZTBus' `metaData.csv` as `trips` rows, without ids"""
+    trips: List[TripRow] = []
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            distance_m = _float(row["drivenDistance"])
+            energy_j = _float(row["energyConsumption"])
+            trips.append(
+                TripRow(
+                    name=row["name"],
+                    bus_id=_int(row["busNumber"]),
+                    route_id=_int(row["busRoute"]),
+                    start_time=_time(row["startTime_iso"]),
+                    end_time=_time(row["endTime_iso"]),
+                    driven_distance_km=None
+                    if distance_m is None
+                    else distance_m / M_PER_KM,
+                    energy_consumption_kwh=None
+                    if energy_j is None
+                    else energy_j / J_PER_KWH,
+                    itcs_passengers_mean=_float(row["itcs_numberOfPassengers_mean"]),
+                    itcs_passengers_min=_int(row["itcs_numberOfPassengers_min"]),
+                    itcs_passengers_max=_int(row["itcs_numberOfPassengers_max"]),
+                    grid_available_mean=_float(row["status_gridIsAvailable_mean"]),
+                    amb_temperature_mean=_float(row["temperature_ambient_mean"]),
+                    amb_temperature_min=_float(row["temperature_ambient_min"]),
+                    amb_temperature_max=_float(row["temperature_ambient_max"]),
+                )
+            )
+    return trips
+
+
+def UpsertTrips(
+    conn: PGConnection, trips: List[TripRow]
+) -> Tuple[Dict[str, int], List[int]]:
+    """
+    Insert or update `trips` by name, keeping the ids of known trips.
+    Returns the id of every trip and the ids that were already loaded.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT name, id FROM trips")
+        known = {str(name): int(trip_id) for name, trip_id in cur.fetchall()}
+        cur.execute("SELECT coalesce(max(id), 0) FROM trips")
+        (max_id,) = cur.fetchone() or (0,)
+        next_id = int(max_id) + 1
+
+        ids: Dict[str, int] = {}
+        for trip in trips:
+            name = trip["name"]
+            if name in known:
+                ids[name] = known[name]
+            else:
+                ids[name] = next_id
+                next_id += 1
+
+        columns = list(trips[0]) if trips else []
+        updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in columns if c != "name")
+        from psycopg2.extras import execute_values
+
+        execute_values(
+            cur,
+            f"""
+            INSERT INTO trips (id, {", ".join(columns)}) VALUES %s
+            ON CONFLICT (id) DO UPDATE SET {updates}
+            """,
+            [(ids[trip["name"]], *trip.values()) for trip in trips],
+        )
+        conn.commit()
+    reloaded = [ids[name] for name in ids if name in known]
+    return ids, reloaded
+
+
+# --- Loading ---
+
+
+def _convert(value: str, kind: str) -> str:
+    if kind == "TEXT":
+        # kept as exported, "-" is ZTBus' "no stop"
+        return value
+    if value in NULLS:
+        return ""
+    if kind == "BOOLEAN":
+        return "t" if float(value) else "f"
+    if kind in ("BIGINT", "INTEGER"):
+        return str(int(float(value)))
+    return value
+
+
+def _telemetry_csv(
+    path: str, trip_id: int, bus_id: Optional[int]
+) -> Tuple[io.StringIO, List[str]]:
+    """A trip's ZTBus CSV rewritten as COPY input for `telemetry`"""
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        header = [snake_case(column) for column in next(reader)]
+        keep = [(i, name) for i, name in enumerate(header) if name in COLUMN_TYPES]
+        columns = ["trip_id", "bus_id"] + [name for _, name in keep]
+        out = io.StringIO()
+        writer = csv.writer(out)
+        prefix = [str(trip_id), "" if bus_id is None else str(bus_id)]
+        for row in reader:
+            writer.writerow(
+                prefix + [_convert(row[i], COLUMN_TYPES[name]) for i, name in keep]
+            )
+    out.seek(0)
+    return out, columns
+
+
+def CopyTripTelemetry(
+    conn: PGConnection, path: str, trip_id: int, bus_id: Optional[int]
+) -> int:
+    data, columns = _telemetry_csv(path, trip_id, bus_id)
+    quoted = ", ".join(f'"{column}"' for column in columns)
+    with conn.cursor() as cur:
+        cur.copy_expert(f"COPY telemetry ({quoted}) FROM STDIN WITH (FORMAT csv)", data)
+        rows: int = cur.rowcount
+    return rows
+
+
+def _load_partition(
+    partition: Partition, trips: List[Tuple[str, int, Optional[int]]]
+) -> Tuple[str, int, float]:
+    start = time.perf_counter()
+    rows = 0
+    conn = connect()
+    try:
+        for path, trip_id, bus_id in trips:
+            rows += CopyTripTelemetry(conn, path, trip_id, bus_id)
+        conn.commit()
+    finally:
+        conn.close()
+    return partition.table, rows, time.perf_counter() - start
+
+
+def _index_partition(table: str) -> Tuple[str, float]:
+    start = time.perf_counter()
+    conn = connect()
+    try:
+        CreatePartitionIndexes(conn, table)
+    finally:
+        conn.close()
+    return table, time.perf_counter() - start
+
+
+def _migrate_month(month: Optional[dt.date]) -> Tuple[str, int, float]:
+    """Move a month of the monolithic table, or the rows without a time"""
+    start = time.perf_counter()
+    columns = ", ".join(
+        ["id"]
+        + [f'"{column}"' for column, _ in TELEMETRY_COLUMNS if column != "bus_id"]
+    )
+    selected = ", ".join(
+        ["t.id"]
+        + [f't."{column}"' for column, _ in TELEMETRY_COLUMNS if column != "bus_id"]
+    )
+    if month is None:
+        table, where, params = "telemetry_default", 't."time" IS NULL', {}
+    else:
+        table = Partition(month).table
+        where = 't."time" >= %(time_from)s AND t."time" < %(time_to)s'
+        params = {"time_from": month, "time_to": next_month(month)}
+    conn = connect()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                INSERT INTO telemetry ({columns}, bus_id)
+                SELECT {selected}, tr.bus_id
+                FROM telemetry_monolithic t
+                LEFT JOIN trips tr ON tr.id = t.trip_id
+                WHERE {where}
+                """,
+                params,
+            )
+            rows = cur.rowcount
+        conn.commit()
+    finally:
+        conn.close()
+    return table, rows, time.perf_counter() - start
+
+
+def build_indexes(conn: PGConnection, jobs: int) -> None:
+    leaves = _leaf_tables(conn)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for table, seconds in pool.map(_index_partition, leaves):
+            LOGGER.info(f"Indexed {table} in {seconds:.1f}s")
+    AttachTelemetryIndexes(conn)
+
+
+def load(directory: str, jobs: int, by_bus: bool) -> None:
+    conn = connect()
+    try:
+        if ReadTelemetryKind(conn) == "r":
+            raise SystemExit(
+                "telemetry is not partitioned; run `python ingest.py migrate` first"
+            )
+        CreateTripsTable(conn)
+        trips = ReadTripMetadata(os.path.join(directory, "metaData.csv"))
+        trips = [
+            trip
+            for trip in trips
+            if os.path.exists(os.path.join(directory, f"{trip['name']}.csv"))
+        ]
+        if not trips:
+            raise SystemExit(f"No trip CSVs listed in {directory}/metaData.csv")
+        ids, reloaded = UpsertTrips(conn, trips)
+
+        times = [t["start_time"] for t in trips] + [t["end_time"] for t in trips]
+        months = months_between(min(times), max(times))
+        buses = sorted({t["bus_id"] for t in trips if t["bus_id"] is not None})
+        CreatePartitionedTelemetryTable(conn, months, buses, by_bus)
+        if reloaded:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "DELETE FROM telemetry WHERE trip_id = ANY(%(ids)s)",
+                    {"ids": reloaded},
+                )
+                LOGGER.info(
+                    f"Deleted {cur.rowcount} rows of {len(reloaded)} reloaded trips"
+                )
+            conn.commit()
+
+        # a trip's rows are routed by `time`; it is grouped with the
+        # partition it starts in
+        groups: Dict[Partition, List[Tuple[str, int, Optional[int]]]] = {}
+        for trip in trips:
+            bus_id = trip["bus_id"]
+            partition = Partition(
+                month_of(trip["start_time"]), bus_id if by_bus else None
+            )
+            groups.setdefault(partition, []).append(
+                (
+                    os.path.join(directory, f"{trip['name']}.csv"),
+                    ids[trip["name"]],
+                    bus_id,
+                )
+            )
+
+        start = time.perf_counter()
+        total = 0
+        # the largest partitions first, so that they do not finish last
+        ordered = sorted(groups.items(), key=lambda item: -len(item[1]))
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = pool.map(_load_partition, *zip(*ordered))
+            for table, rows, seconds in results:
+                total += rows
+                LOGGER.info(f"Loaded {rows} rows into {table} in {seconds:.1f}s")
+        LOGGER.info(
+            f"Loaded {total} rows of {len(trips)} trips in {time.perf_counter() - start:.1f}s"
+        )
+
+        build_indexes(conn, jobs)
+        with conn.cursor() as cur:
+            cur.execute("ANALYZE telemetry")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def migrate(jobs: int, by_bus: bool) -> None:
+    conn = connect()
+    try:
+        if ReadTelemetryKind(conn) != "r":
+            raise SystemExit("telemetry is not a plain table, nothing to migrate")
+        with conn.cursor() as cur:
+            cur.execute('SELECT min("time"), max("time") FROM telemetry')
+            first, last = cur.fetchone() or (None, None)
+            cur.execute("SELECT DISTINCT bus_id FROM trips WHERE bus_id IS NOT NULL")
+            buses = sorted(int(row[0]) for row in cur.fetchall())
+            cur.execute("ALTER TABLE telemetry RENAME TO telemetry_monolithic")
+            # the old indexes keep their names otherwise
+            for suffix in ("pkey", *INDEXES):
+                cur.execute(
+                    f"ALTER INDEX IF EXISTS telemetry_{suffix} RENAME TO telemetry_monolithic_{suffix}"
+                )
+            cur.execute(
+                "ALTER SEQUENCE IF EXISTS telemetry_id_seq RENAME TO telemetry_monolithic_id_seq"
+            )
+        conn.commit()
+
+        months = months_between(first, last) if first is not None else []
+        CreatePartitionedTelemetryTable(conn, months, buses, by_bus)
+
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            for table, rows, seconds in pool.map(_migrate_month, [*months, None]):
+                LOGGER.info(f"Moved {rows} rows into {table} in {seconds:.1f}s")
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT setval(
+                    pg_get_serial_sequence('telemetry', 'id'),
+                    coalesce((SELECT max(id) FROM telemetry), 0) + 1,
+                    false
+                )
+                """
+            )
+        conn.commit()
+        LOGGER.info(f"Migrated in {time.perf_counter() - start:.1f}s")
+
+        build_indexes(conn, jobs)
+        with conn.cursor() as cur:
+            cur.execute("ANALYZE telemetry")
+        conn.commit()
+        LOGGER.info("The old table is kept as telemetry_monolithic")
+    finally:
+        conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    load_parser = commands.add_parser("load", help="load ZTBus CSV exports")
+    load_parser.add_argument("directory", help="holds metaData.csv and a CSV per trip")
+    migrate_parser = commands.add_parser(
+        "migrate", help="partition an existing telemetry table"
+    )
+    for command in (load_parser, migrate_parser):
+        command.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+        command.add_argument(
+            "--by-bus",
+            action="store_true",
+            help="partition every month by bus_id as well",
+        )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.command == "load":
+        load(args.directory, args.jobs, args.by_bus)
+    else:
+        migrate(args.jobs, args.by_bus)
+
+
+if __name__ == "__main__":
+    main()
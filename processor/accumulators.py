@@ -0,0 +1,348 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+import datetime as dt
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Protocol, Set
+
+from db import PostgresPool, db_pool
+
+LOGGER = logging.getLogger(__name__)
+
+Partial = Dict[str, float]
+
+# ids of discarded trips remembered per trip kept, to refuse their late minutes
+FORGOTTEN_PER_TRIP = 10
+
+
+class AccumulatorBackend(Protocol):
+    def load(self, trip_id: int, after: Optional[str] = None) -> Dict[str, str]:
+        """The trip's partials by minute, only those after `after` if given"""
+        ...
+
+    def put(self, trip_id: int, minute: str, partial: str) -> None: ...
+
+    def discard(self, trip_id: int) -> None: ...
+
+
+class SqliteAccumulatorBackend:
+    def __init__(self, path: str) -> None:
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS trip_accumulators (
+                    trip_id INTEGER NOT NULL,
+                    minute TEXT NOT NULL,
+                    partial TEXT NOT NULL,
+                    PRIMARY KEY (trip_id, minute)
+                )
+                """
+            )
+            self._conn.commit()
+
+    def load(self, trip_id: int, after: Optional[str] = None) -> Dict[str, str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT minute, partial FROM trip_accumulators "
+                "WHERE trip_id = ? AND minute > ?",
+                (trip_id, after or ""),
+            ).fetchall()
+        return {str(minute): str(partial) for minute, partial in rows}
+
+    def put(self, trip_id: int, minute: str, partial: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO trip_accumulators (trip_id, minute, partial) VALUES (?, ?, ?)",
+                (trip_id, minute, partial),
+            )
+            self._conn.commit()
+
+    def discard(self, trip_id: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM trip_accumulators WHERE trip_id = ?", (trip_id,)
+            )
+            self._conn.commit()
+
+
+class PostgresAccumulatorBackend:
+    def __init__(self, pool: PostgresPool) -> None:
+        self._pool = pool
+        self._created = False
+
+    def _ensure_table(self) -> None:
+        if self._created:
+            return
+        with self._pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS trip_accumulators (
+                        trip_id BIGINT NOT NULL,
+                        minute TEXT NOT NULL,
+                        partial JSONB NOT NULL,
+                        PRIMARY KEY (trip_id, minute)
+                    );
+                    """
+                )
+                conn.commit()
+        self._created = True
+
+    def load(self, trip_id: int, after: Optional[str] = None) -> Dict[str, str]:
+        self._ensure_table()
+        with self._pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT minute, partial::text FROM trip_accumulators
+                    WHERE trip_id = %(trip_id)s AND minute > %(after)s
+                    """,
+                    {"trip_id": trip_id, "after": after or ""},
+                )
+                rows = cur.fetchall()
+            conn.commit()
+        return {str(minute): str(partial) for minute, partial in rows}
+
+    def put(self, trip_id: int, minute: str, partial: str) -> None:
+        self._ensure_table()
+        with self._pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO trip_accumulators (trip_id, minute, partial)
+                    VALUES (%(trip_id)s, %(minute)s, %(partial)s)
+                    ON CONFLICT (trip_id, minute) DO UPDATE SET partial = EXCLUDED.partial
+                    """,
+                    {"trip_id": trip_id, "minute": minute, "partial": partial},
+                )
+            conn.commit()
+
+    def discard(self, trip_id: int) -> None:
+        self._ensure_table()
+        with self._pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "DELETE FROM trip_accumulators WHERE trip_id = %(trip_id)s",
+                    {"trip_id": trip_id},
+                )
+            conn.commit()
+
+
+@dataclass
+class _TripState:
+    partials: Dict[dt.datetime, Partial] = field(default_factory=dict)
+    totals: Partial = field(default_factory=dict)
+    latest: Optional[dt.datetime] = None
+    # minutes found missing that the backend has already been asked for
+    checked: Set[dt.datetime] = field(default_factory=set)
+
+
+@dataclass
+class AccumulatorStats:
+    added: int = 0
+    replaced: int = 0
+    out_of_order: int = 0
+    loads: int = 0
+    discarded: int = 0
+    late: int = 0
+
+
+class TripAccumulators:
+    """
+    Running per-trip sums built from each minute's partial sums.
+
+    Partials are kept per (trip, minute), so a redelivered minute replaces
+    its earlier partial instead of being counted twice, and the running total
+    is updated by the difference. The total up to a minute is then O(1) for
+    the latest minute of a trip; a minute arriving after later ones sums the
+    partials up to it instead.
+
+    With a backend, every partial is written through, and a trip's partials
+    are loaded the first time it is seen, so a restarted processor resumes
+    its trips. When the minute before a window is missing, the backend is
+    asked for the minutes after the trip's latest one, which picks up minutes
+    another process handled. Backend I/O happens outside the lock.
+
+    An ended trip is kept for `grace` after its end, as its last minutes may
+    still be on their way, and then discarded from the backend. Its partials
+    are kept in memory (for up to `max_trips` trips), so a minute arriving
+    later still, such as a retry or a reprocessed day, is answered with the
+    totals up to that minute without starting the trip over. A minute of a
+    trip whose partials are gone raises `LookupError` rather than reporting
+    a trip that starts at that minute.
+    """
+
+    def __init__(
+        self,
+        max_trips: int = 10_000,
+        backend: Optional[AccumulatorBackend] = None,
+        grace: dt.timedelta = dt.timedelta(minutes=5),
+    ) -> None:
+        self.max_trips = max_trips
+        self.backend = backend
+        self.grace = grace
+        self.stats = AccumulatorStats()
+        self._trips: OrderedDict[int, _TripState] = OrderedDict()
+        self._ended: Dict[int, dt.datetime] = {}
+        self._closed: OrderedDict[int, _TripState] = OrderedDict()
+        # trips discarded so long ago that their partials are gone too
+        self._forgotten: OrderedDict[int, None] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(
+        self,
+        trip_id: int,
+        minute: dt.datetime,
+        previous: dt.datetime,
+        partial: Partial,
+    ) -> tuple[Partial, int]:
+        """
+        Record the partial sums of the trip's `minute` and return the trip's
+        totals up to and including it, with the number of minutes counted
+        """
+        with self._lock:
+            closed = self._closed.get(trip_id)
+            if closed is not None:
+                self.stats.late += 1
+                self._closed.move_to_end(trip_id)
+                self._apply(closed, minute, partial, closed.partials.get(minute))
+                return self._prefix(closed, minute)
+            if trip_id in self._forgotten:
+                self.stats.late += 1
+                raise LookupError(
+                    f"Trip {trip_id} ended and its partials were discarded"
+                )
+            state = self._trips.get(trip_id)
+            load, after = False, None
+            if self.backend is not None:
+                if state is None:
+                    load = True
+                elif previous not in state.partials and previous not in state.checked:
+                    load = True
+                    after = state.latest.isoformat() if state.latest else None
+                    state.checked.add(previous)
+            if load:
+                self.stats.loads += 1
+
+        loaded = self.backend.load(trip_id, after) if load else {}  # type: ignore[union-attr]
+
+        with self._lock:
+            state = self._trips.get(trip_id)
+            if state is None:
+                state = _TripState()
+                self._trips[trip_id] = state
+                state.checked.add(previous)
+            self._merge(state, loaded)
+            self._trips.move_to_end(trip_id)
+
+            old = state.partials.get(minute)
+            self._apply(state, minute, partial, old)
+            if old is None:
+                self.stats.added += 1
+            else:
+                self.stats.replaced += 1
+
+            if minute >= state.latest:  # type: ignore[operator]
+                totals = dict(state.totals)
+                minutes = len(state.partials)
+            else:
+                self.stats.out_of_order += 1
+                totals, minutes = self._prefix(state, minute)
+
+            while len(self._trips) > self.max_trips:
+                self._trips.popitem(last=False)
+
+        if self.backend is not None:
+            self.backend.put(trip_id, minute.isoformat(), json.dumps(partial))
+        return totals, minutes
+
+    def end(self, trip_id: int, end_time: dt.datetime) -> None:
+        """Note that a trip has ended, to be discarded once `grace` has passed"""
+        with self._lock:
+            self._ended.setdefault(trip_id, end_time)
+
+    def expire(self, now: dt.datetime) -> None:
+        """Discard the trips that ended more than `grace` before `now`"""
+        with self._lock:
+            expired = [
+                trip_id
+                for trip_id, end_time in self._ended.items()
+                if end_time + self.grace <= now
+            ]
+        for trip_id in expired:
+            self.discard(trip_id)
+
+    def discard(self, trip_id: int) -> None:
+        """Forget a trip that has ended, keeping its partials in memory"""
+        with self._lock:
+            self._ended.pop(trip_id, None)
+            state = self._trips.pop(trip_id, None)
+            if state is not None:
+                self._closed[trip_id] = state
+                while len(self._closed) > self.max_trips:
+                    forgotten, _ = self._closed.popitem(last=False)
+                    self._forgotten[forgotten] = None
+                while len(self._forgotten) > FORGOTTEN_PER_TRIP * self.max_trips:
+                    self._forgotten.popitem(last=False)
+        self.stats.discarded += 1
+        if self.backend is not None:
+            self.backend.discard(trip_id)
+
+    def _apply(
+        self,
+        state: _TripState,
+        minute: dt.datetime,
+        partial: Partial,
+        old: Optional[Partial],
+    ) -> None:
+        for key, value in partial.items():
+            previous = 0.0 if old is None else old.get(key, 0.0)
+            state.totals[key] = state.totals.get(key, 0.0) + value - previous
+        state.partials[minute] = partial
+        if state.latest is None or minute > state.latest:
+            state.latest = minute
+
+    def _prefix(self, state: _TripState, minute: dt.datetime) -> tuple[Partial, int]:
+        totals: Partial = {}
+        minutes = 0
+        for other, partial in state.partials.items():
+            if other > minute:
+                continue
+            minutes += 1
+            for key, value in partial.items():
+                totals[key] = totals.get(key, 0.0) + value
+        return totals, minutes
+
+    def _merge(self, state: _TripState, loaded: Dict[str, str]) -> None:
+        for raw_minute, raw_partial in loaded.items():
+            minute = dt.datetime.fromisoformat(raw_minute)
+            partial = json.loads(raw_partial)
+            if state.partials.get(minute) != partial:
+                self._apply(state, minute, partial, state.partials.get(minute))
+
+
+def _backend_from_env() -> Optional[AccumulatorBackend]:
+    kind = os.environ.get("ACCUMULATOR_STORE", "memory")
+    if kind == "memory":
+        return None
+    if kind == "sqlite":
+        return SqliteAccumulatorBackend(
+            os.environ.get("ACCUMULATOR_STORE_PATH", "accumulators.db")
+        )
+    if kind == "postgres":
+        return PostgresAccumulatorBackend(db_pool)
+    raise ValueError(
+        f"ACCUMULATOR_STORE must be one of memory, sqlite, postgres: {kind}"
+    )
+
+
+trip_accumulators = TripAccumulators(
+    max_trips=int(os.environ.get("ACCUMULATOR_MAX_TRIPS", "10000")),
+    backend=_backend_from_env(),
+    grace=dt.timedelta(minutes=float(os.environ.get("ACCUMULATOR_GRACE_MINUTES", "5"))),
+)
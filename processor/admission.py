@@ -0,0 +1,192 @@
+import os
+import time
+import functools
+import datetime as dt
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from orca_python import ExecutionParams
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+# (trip_id, time_from, time_to) - trip_id is None for fleet wide windows
+AdmissionKey = Tuple[Optional[int], dt.datetime, dt.datetime]
+
+
+@dataclass
+class AdmissionStats:
+    admitted: int = 0
+    in_flight: int = 0
+    queued: int = 0
+    max_queued: int = 0
+    reserved_bytes: int = 0
+    lag_s: float = 0.0
+    lag_s_max: float = 0.0
+    coalesced_fetches: int = 0
+    coalesced_windows: int = 0
+
+
+def _admission_key(params: ExecutionParams) -> AdmissionKey:
+    trip_id = params.window.metadata.get("trip_id")
+    return (
+        None if trip_id is None else int(trip_id),
+        params.window.time_from,
+        params.window.time_to,
+    )
+
+
+class AdmissionController:
+    """
+    Bounds how many windows the processor works on at once.
+
+    A window is admitted when fewer than `max_in_flight` windows are running
+    and its estimated telemetry footprint fits in `memory_budget_bytes`.
+    Algorithms triggered by a window that is already running share its slot.
+    Windows waiting for a slot are visible through `queued_for_trip`, so a
+    lagging processor can fetch several of them at once.
+
+    The processor is lagging when a window has waited for a slot longer
+    than `lag_threshold_s`, or when `backlog_threshold` windows are waiting.
+    Both are measured on the wall clock, so they hold however fast the
+    windows' own (possibly simulated) time advances. Up to `max_queued`
+    windows can wait at once: the gRPC executor is sized to
+    `max_in_flight + max_queued` threads, as each waiting window holds one.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 8,
+        memory_budget_bytes: int = 256 * 1024 * 1024,
+        bytes_per_row: int = 2048,
+        rows_per_second: float = 1.0,
+        lag_threshold_s: float = 5.0,
+        backlog_threshold: Optional[int] = None,
+        max_queued: int = 64,
+    ) -> None:
+        self.max_in_flight = max_in_flight
+        self.memory_budget_bytes = memory_budget_bytes
+        self.bytes_per_row = bytes_per_row
+        self.rows_per_second = rows_per_second
+        self.lag_threshold_s = lag_threshold_s
+        self.backlog_threshold = (
+            max_in_flight if backlog_threshold is None else backlog_threshold
+        )
+        self.max_queued = max_queued
+        self.stats = AdmissionStats()
+
+        self._in_flight: Dict[AdmissionKey, int] = {}
+        self._queued: Dict[AdmissionKey, int] = {}
+        self._reserved: Dict[AdmissionKey, int] = {}
+        # monotonic time each waiting window started waiting
+        self._waiting_since: Dict[AdmissionKey, float] = {}
+        self._cond = threading.Condition()
+
+    def estimate_bytes(self, key: AdmissionKey) -> int:
+        seconds = max((key[2] - key[1]).total_seconds(), 1.0)
+        return int(seconds * self.rows_per_second * self.bytes_per_row)
+
+    def admitted(self, fn: F) -> F:
+        """Run an algorithm only once its window has been admitted"""
+
+        @functools.wraps(fn)
+        def wrapper(params: ExecutionParams) -> Any:
+            key = _admission_key(params)
+            self._acquire(key)
+            try:
+                return fn(params)
+            finally:
+                self._release(key)
+
+        return wrapper  # type: ignore[return-value]
+
+    def lagging(self) -> bool:
+        with self._cond:
+            if len(self._queued) >= self.backlog_threshold:
+                return True
+            oldest = min(self._waiting_since.values(), default=None)
+        return oldest is not None and time.monotonic() - oldest > self.lag_threshold_s
+
+    def queued_for_trip(self, trip_id: int) -> List[Tuple[dt.datetime, dt.datetime]]:
+        """Time ranges of a trip's windows that are waiting or running"""
+        with self._cond:
+            keys = set(self._queued) | set(self._in_flight)
+        return sorted((k[1], k[2]) for k in keys if k[0] == trip_id)
+
+    def record_coalesced(self, windows: int) -> None:
+        with self._cond:
+            self.stats.coalesced_fetches += 1
+            self.stats.coalesced_windows += windows
+
+    def _acquire(self, key: AdmissionKey) -> None:
+        with self._cond:
+            if key in self._in_flight:
+                self._in_flight[key] += 1
+                return
+
+            self._queued[key] = self._queued.get(key, 0) + 1
+            started = self._waiting_since.setdefault(key, time.monotonic())
+            self._update_queue_stats()
+            nbytes = self.estimate_bytes(key)
+            while key not in self._in_flight and not self._fits(nbytes):
+                self._cond.wait()
+            self._queued[key] -= 1
+            if self._queued[key] == 0:
+                del self._queued[key]
+                self._waiting_since.pop(key, None)
+            self._record_wait(time.monotonic() - started)
+
+            if key in self._in_flight:
+                # another algorithm admitted this window while we waited
+                self._in_flight[key] += 1
+            else:
+                self._in_flight[key] = 1
+                self._reserved[key] = nbytes
+                self.stats.admitted += 1
+            self._update_queue_stats()
+
+    def _fits(self, nbytes: int) -> bool:
+        # caller holds self._cond. A single window is always admitted when
+        # nothing else runs, even if it alone exceeds the budget
+        if not self._in_flight:
+            return True
+        return (
+            len(self._in_flight) < self.max_in_flight
+            and sum(self._reserved.values()) + nbytes <= self.memory_budget_bytes
+        )
+
+    def _release(self, key: AdmissionKey) -> None:
+        with self._cond:
+            self._in_flight[key] -= 1
+            if self._in_flight[key] == 0:
+                del self._in_flight[key]
+                self._reserved.pop(key, None)
+            self._update_queue_stats()
+            self._cond.notify_all()
+
+    def _update_queue_stats(self) -> None:
+        # caller holds self._cond
+        self.stats.in_flight = len(self._in_flight)
+        self.stats.queued = len(self._queued)
+        self.stats.max_queued = max(self.stats.max_queued, self.stats.queued)
+        self.stats.reserved_bytes = sum(self._reserved.values())
+
+    def _record_wait(self, wait_s: float) -> None:
+        # caller holds self._cond
+        self.stats.lag_s = wait_s
+        self.stats.lag_s_max = max(self.stats.lag_s_max, wait_s)
+
+
+admission = AdmissionController(
+    max_in_flight=int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", "8")),
+    memory_budget_bytes=int(os.environ.get("ADMISSION_MEMORY_BUDGET_MB", "256"))
+    * 1024
+    * 1024,
+    lag_threshold_s=float(os.environ.get("ADMISSION_LAG_THRESHOLD_S", "5")),
+    backlog_threshold=(
+        int(os.environ["ADMISSION_BACKLOG_THRESHOLD"])
+        if os.environ.get("ADMISSION_BACKLOG_THRESHOLD")
+        else None
+    ),
+    max_queued=int(os.environ.get("ADMISSION_MAX_QUEUED", "64")),
+)
@@ -0,0 +1,131 @@
+import os
+import datetime as dt
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Generic, List, Optional, Tuple, TypeVar
+
+# (trip_id, time_from, time_to)
+WindowKey = Tuple[int, dt.datetime, dt.datetime]
+Rows = List[Any]
+V = TypeVar("V")
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    prefetched: int = 0
+    prefetch_hits: int = 0
+    prefetch_wasted: int = 0
+    evictions: int = 0
+
+
+@dataclass
+class _Entry(Generic[V]):
+    rows: V
+    prefetched: bool = False
+    used: bool = False
+
+
+class TelemetryCache(Generic[V]):
+    """
+    In-memory LRU of telemetry per (trip_id, time range) window, holding
+    either the raw rows or frames derived from them.
+
+    Every algorithm triggered by a window reads the same rows, so loads are
+    single-flight: concurrent misses for one key wait on the first loader
+    rather than each issuing the query.
+    """
+
+    def __init__(self, max_entries: int = 512) -> None:
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self._entries: OrderedDict[WindowKey, _Entry[V]] = OrderedDict()
+        self._loading: Dict[WindowKey, Future[V]] = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: WindowKey) -> bool:
+        with self._lock:
+            return key in self._entries or key in self._loading
+
+    def get(self, key: WindowKey) -> Optional[V]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            if entry.prefetched and not entry.used:
+                self.stats.prefetch_hits += 1
+            entry.used = True
+            return entry.rows
+
+    def put(self, key: WindowKey, rows: V, prefetched: bool = False) -> None:
+        with self._lock:
+            self._entries[key] = _Entry(rows=rows, prefetched=prefetched)
+            self._entries.move_to_end(key)
+            if prefetched:
+                self.stats.prefetched += 1
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._discard(evicted)
+
+    def get_or_load(self, key: WindowKey, loader: Callable[[], V]) -> V:
+        rows = self.get(key)
+        if rows is not None:
+            return rows
+        return self._load(key, loader, prefetched=False)
+
+    def prefetch(self, key: WindowKey, loader: Callable[[], V]) -> None:
+        """Load a window ahead of use, unless it is already cached or loading"""
+        if key in self:
+            return
+        self._load(key, loader, prefetched=True)
+
+    def _load(self, key: WindowKey, loader: Callable[[], V], prefetched: bool) -> V:
+        with self._lock:
+            pending = self._loading.get(key)
+            if pending is None:
+                future: Future[V] = Future()
+                self._loading[key] = future
+                if not prefetched:
+                    self.stats.misses += 1
+        if pending is not None:
+            rows = pending.result()
+            # waiting on an in-flight load (often a prefetch) still counts as a hit
+            cached = None if prefetched else self.get(key)
+            return rows if cached is None else cached
+
+        try:
+            rows = loader()
+        except BaseException as e:
+            with self._lock:
+                self._loading.pop(key, None)
+            future.set_exception(e)
+            raise
+        # a prefetch that found nothing (e.g. the trip has ended) is not kept
+        if rows or not prefetched:
+            self.put(key, rows, prefetched=prefetched)
+        with self._lock:
+            self._loading.pop(key, None)
+        future.set_result(rows)
+        return rows
+
+    def evict_trip(self, trip_id: int) -> None:
+        """Drop every window cached for a trip"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == trip_id]:
+                self._discard(self._entries.pop(key))
+
+    def _discard(self, entry: _Entry[V]) -> None:
+        # caller holds self._lock
+        self.stats.evictions += 1
+        if entry.prefetched and not entry.used:
+            self.stats.prefetch_wasted += 1
+
+
+telemetry_cache: TelemetryCache[Rows] = TelemetryCache(
+    max_entries=int(os.environ.get("TELEMETRY_CACHE_SIZE", "512"))
+)
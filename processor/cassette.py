@@ -0,0 +1,157 @@
+import os
+import json
+import atexit
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Generator, List, Optional, TypeVar
+
+from db import PostgresPool
+from fleet import VIRTUAL_FLEET_SIZE
+from memo import json_default
+
+LOGGER = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+@dataclass
+class CassetteStats:
+    recorded: int = 0
+    replayed: int = 0
+    misses: int = 0
+
+
+class NullPool:
+    """Stands in for the connection pool while replaying: reads never reach it"""
+
+    @contextmanager
+    def connection(self) -> Generator[None, None, None]:
+        yield None
+
+    def close_pool(self) -> None:
+        pass
+
+
+def _normalise(value: Any) -> Any:
+    # window metadata ids arrive as floats
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _query_key(name: str, params: Dict[str, Any]) -> str:
+    """The query shape (read and parameter names) with its parameter values"""
+    return json.dumps(
+        [name, VIRTUAL_FLEET_SIZE, {k: _normalise(v) for k, v in params.items()}],
+        sort_keys=True,
+        default=json_default,
+    )
+
+
+class Cassette:
+    """
+    Records the results of the processor's database reads to disk and replays
+    them without a database.
+
+    In "record" mode every wrapped read goes to Postgres as usual and its
+    result set is kept, keyed by the read and its parameters; the cassette is
+    written to `path` on exit (or `save()`). In "replay" mode reads are served
+    from the cassette and a read that was not recorded raises `LookupError`.
+    Result sets are stored column-wise in one compressed .npz file.
+    """
+
+    def __init__(self, mode: Optional[str], path: str) -> None:
+        if mode not in (None, "record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.mode = mode
+        self.path = path
+        self.stats = CassetteStats()
+
+        self._results: Dict[str, List[Dict[str, Any]]] = {}
+        self._single: Dict[str, bool] = {}
+        self._lock = threading.Lock()
+        if self.replaying:
+            self._load()
+        elif self.recording:
+            atexit.register(self.save)
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def pool(self, pool: PostgresPool) -> PostgresPool | NullPool:
+        """The pool to read through: none is needed while replaying"""
+        return NullPool() if self.replaying else pool
+
+    def recorded(self, fn: F) -> F:
+        """Record or replay a read taking (params, conn)"""
+        if self.mode is None:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(params: Dict[str, Any], conn: Any) -> Any:
+            key = _query_key(fn.__name__, params)
+            if self.replaying:
+                with self._lock:
+                    rows = self._results.get(key)
+                    if rows is None:
+                        self.stats.misses += 1
+                        raise LookupError(f"No recording of {key} in {self.path}")
+                    self.stats.replayed += 1
+                    return rows[0] if self._single[key] else list(rows)
+
+            result = fn(params, conn)
+            single = isinstance(result, dict)
+            with self._lock:
+                self._results[key] = [result] if single else list(result)
+                self._single[key] = single
+                self.stats.recorded += 1
+            return result
+
+        return wrapper  # type: ignore[return-value]
+
+    def recorded_params(self, name: str) -> List[Dict[str, Any]]:
+        """Parameters of every recorded call to a read, JSON encoded"""
+        with self._lock:
+            keys = list(self._results)
+        calls = [json.loads(key) for key in keys]
+        return [params for read, _, params in calls if read == name]
+
+    def save(self) -> None:
+        import numpy as np
+        from columnar import encode, save_blocks
+
+        with self._lock:
+            keys = list(self._results)
+            blocks = {
+                str(ii): encode(self._results[key]) for ii, key in enumerate(keys)
+            }
+            index = [{"key": key, "single": self._single[key]} for key in keys]
+        blocks["index"] = {
+            "json": np.frombuffer(json.dumps(index).encode(), dtype=np.uint8),
+        }
+        save_blocks(self.path, blocks)
+        LOGGER.info(f"Recorded {len(keys)} reads to {self.path}")
+
+    def _load(self) -> None:
+        from columnar import decode, load_blocks
+
+        blocks = load_blocks(self.path)
+        index = json.loads(blocks["index"]["json"].tobytes())
+        for ii, entry in enumerate(index):
+            self._results[entry["key"]] = decode(blocks[str(ii)])
+            self._single[entry["key"]] = entry["single"]
+        LOGGER.info(f"Replaying {len(index)} reads from {self.path}")
+
+
+cassette = Cassette(
+    mode=os.environ.get("DB_CASSETTE_MODE") or None,
+    path=os.environ.get("DB_CASSETTE_PATH", "cassette.npz"),
+)
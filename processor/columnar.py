@@ -0,0 +1,173 @@
+import os
+import json
+import decimal
+import datetime as dt
+from typing import TYPE_CHECKING, Any, Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Compact columnar encoding of query results (lists of dict rows).
+#
+# Each column becomes one typed numpy array plus, when it has NULLs, a boolean
+# mask. The column names and kinds are stored alongside as JSON, so a block is
+# self-describing and loads without pickle.
+
+Arrays = Dict[str, np.ndarray]
+
+SCHEMA = "__schema__"
+
+_DTYPES: Dict[str, np.dtype[Any]] = {
+    "int": np.dtype(np.int64),
+    "float": np.dtype(np.float64),
+    "bool": np.dtype(np.bool_),
+    "datetime": np.dtype("datetime64[us]"),
+}
+
+
+def _kind(values: List[Any]) -> str:
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, (bool, np.bool_)):
+            return "bool"
+        if isinstance(value, (int, np.integer)):
+            return "int"
+        if isinstance(value, (float, np.floating, decimal.Decimal)):
+            return "float"
+        if isinstance(value, dt.datetime):
+            return "datetime" if value.tzinfo is None else "datetime_utc"
+        if isinstance(value, str):
+            return "str"
+        raise TypeError(f"Cannot encode {type(value).__name__} values")
+    return "null"
+
+
+def _fill(kind: str) -> Any:
+    return {
+        "int": 0,
+        "float": 0.0,
+        "bool": False,
+        "datetime": dt.datetime(1970, 1, 1),
+        "str": "",
+    }[kind]
+
+
+def encode(rows: List[Mapping[str, Any]]) -> Arrays:
+    names = list(rows[0]) if rows else []
+    schema: List[Tuple[str, str]] = []
+    arrays: Arrays = {}
+    for name in names:
+        values = [row[name] for row in rows]
+        kind = _kind(values)
+        schema.append((name, kind))
+        if kind == "null":
+            continue
+
+        nulls = np.fromiter((v is None for v in values), dtype=bool, count=len(values))
+        storage = kind
+        if kind == "datetime_utc":
+            # aware datetimes are stored as naive UTC
+            storage = "datetime"
+            values = [
+                None
+                if v is None
+                else v.astimezone(dt.timezone.utc).replace(tzinfo=None)
+                for v in values
+            ]
+        if nulls.any():
+            fill = _fill(storage)
+            values = [fill if v is None else v for v in values]
+            arrays[f"{name}.nulls"] = nulls
+        if kind == "float":
+            values = [float(v) for v in values]
+        # strings are left to numpy, which picks a fixed-width unicode dtype
+        arrays[name] = np.array(values, dtype=_DTYPES.get(storage))
+
+    arrays[SCHEMA] = np.frombuffer(
+        json.dumps({"rows": len(rows), "columns": schema}).encode(), dtype=np.uint8
+    )
+    return arrays
+
+
+def decode(arrays: Mapping[str, np.ndarray]) -> List[Dict[str, Any]]:
+    schema = json.loads(arrays[SCHEMA].tobytes())
+    n = schema["rows"]
+    names = []
+    columns = []
+    for name, kind in schema["columns"]:
+        names.append(name)
+        if kind == "null":
+            columns.append([None] * n)
+            continue
+        values = arrays[name].tolist()
+        if kind == "datetime_utc":
+            values = [v.replace(tzinfo=dt.timezone.utc) for v in values]
+        nulls: Optional[np.ndarray] = arrays.get(f"{name}.nulls")
+        if nulls is not None:
+            values = [None if null else v for v, null in zip(values, nulls.tolist())]
+        columns.append(values)
+    if not names:
+        return [{} for _ in range(n)]
+    return [dict(zip(names, values)) for values in zip(*columns)]
+
+
+def to_frame(arrays: Mapping[str, np.ndarray]) -> "pd.DataFrame":
+    """
+    The DataFrame `pd.DataFrame(decode(arrays))` would give, built column by
+    column without Python rows. Every column is copied, so the frame stays
+    valid after `arrays` is released
+    """
+    import pandas as pd
+
+    schema = json.loads(arrays[SCHEMA].tobytes())
+    n = schema["rows"]
+    columns: Dict[str, Any] = {}
+    for name, kind in schema["columns"]:
+        if kind == "null":
+            columns[name] = np.full(n, None, dtype=object)
+            continue
+        nulls: Optional[np.ndarray] = arrays.get(f"{name}.nulls")
+        values = arrays[name]
+        if kind in ("datetime", "datetime_utc"):
+            values = values.copy()
+            if nulls is not None:
+                values[nulls] = np.datetime64("NaT")
+            if kind == "datetime_utc":
+                columns[name] = pd.DatetimeIndex(values).tz_localize("UTC")
+                continue
+        elif nulls is None:
+            values = values.astype(object) if kind == "str" else values.copy()
+        elif kind in ("int", "float"):
+            values = values.astype(np.float64)
+            values[nulls] = np.nan
+        else:
+            values = values.astype(object)
+            values[nulls] = None
+        columns[name] = values
+    return pd.DataFrame(columns, index=pd.RangeIndex(n), copy=False)
+
+
+def save_blocks(path: str, blocks: Mapping[str, Arrays], compress: bool = True) -> None:
+    """Write named blocks to one .npz file, replacing it atomically"""
+    # Any: numpy types the `**` arrays of savez as ArrayLike | bool
+    flat: Dict[str, Any] = {
+        f"{block}/{name}": array
+        for block, arrays in blocks.items()
+        for name, array in arrays.items()
+    }
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        (np.savez_compressed if compress else np.savez)(f, **flat)
+    os.replace(tmp, path)
+
+
+def load_blocks(path: str) -> Dict[str, Arrays]:
+    blocks: Dict[str, Arrays] = {}
+    with np.load(path, allow_pickle=False) as data:
+        for key in data.files:
+            block, name = key.split("/", 1)
+            blocks.setdefault(block, {})[name] = data[key]
+    return blocks
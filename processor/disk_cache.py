@@ -0,0 +1,202 @@
+import io
+import os
+import hashlib
+import logging
+import threading
+import datetime as dt
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar, cast
+
+from fleet import fleet_tag
+
+LOGGER = logging.getLogger(__name__)
+
+# (trip_id, time_from, time_to)
+WindowKey = Tuple[int, dt.datetime, dt.datetime]
+# the rows a loader returns; a cached window decodes to rows of the same shape
+R = TypeVar("R", bound=List[Any])
+
+SUFFIX = ".window"
+# eviction frees space down to this fraction of the budget, so it does not
+# run again on the next write
+LOW_WATERMARK = 0.9
+
+
+@dataclass
+class DiskCacheStats:
+    hits: int = 0
+    misses: int = 0
+    writes: int = 0
+    corrupt: int = 0
+    evictions: int = 0
+    bytes: int = 0
+
+
+def _stamp(time: dt.datetime) -> str:
+    if time.tzinfo is not None:
+        time = time.astimezone(dt.timezone.utc).replace(tzinfo=None)
+    return time.strftime("%Y%m%dT%H%M%S%f")
+
+
+def dumps(rows: List[Any]) -> bytes:
+    """
+    A window as a compressed columnar file (see `columnar`), preceded by
+    the hex SHA-256 of the file and a newline
+    """
+    import numpy as np
+    from columnar import encode
+
+    buf = io.BytesIO()
+    arrays: Dict[str, Any] = encode(rows)
+    np.savez_compressed(buf, **arrays)
+    body = buf.getvalue()
+    return hashlib.sha256(body).hexdigest().encode() + b"\n" + body
+
+
+def loads(data: bytes) -> Optional[List[Dict[str, Any]]]:
+    """The rows of a file written by `dumps`, None when it is corrupt"""
+    import numpy as np
+    from columnar import decode
+
+    checksum, _, body = data.partition(b"\n")
+    if hashlib.sha256(body).hexdigest().encode() != checksum:
+        return None
+    with np.load(io.BytesIO(body), allow_pickle=False) as arrays:
+        return decode({name: arrays[name] for name in arrays.files})
+
+
+class DiskWindowCache:
+    """
+    Telemetry windows spilled to local disk, one compressed columnar file
+    per fleet configuration and (trip_id, time range), so that a restarted processor or a re-run over
+    the same day reads them without the database.
+
+    Files are written atomically and checked against their SHA-256 on read;
+    a corrupt file is deleted and read again from the database. A hit touches
+    the file, and once the directory outgrows `max_bytes` the least recently
+    used files (by mtime) are deleted. Several processes may share the
+    directory, and processes replaying different virtual fleets (see
+    `fleet`) keep apart files for the same key.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, fleet: str = "real") -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.fleet = fleet
+        self.stats = DiskCacheStats()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._remove_abandoned()
+        self.stats.bytes = sum(size for _, _, size in self._files())
+
+    def path(self, key: WindowKey) -> str:
+        trip_id, time_from, time_to = key
+        name = (
+            f"{self.fleet}_{int(trip_id)}_{_stamp(time_from)}_{_stamp(time_to)}{SUFFIX}"
+        )
+        return os.path.join(self.directory, name)
+
+    def __contains__(self, key: WindowKey) -> bool:
+        return os.path.exists(self.path(key))
+
+    def get(self, key: WindowKey) -> Optional[List[Dict[str, Any]]]:
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        rows = loads(data)
+        if rows is None:
+            LOGGER.warning(f"Discarding corrupt cached window {path}")
+            self.stats.corrupt += 1
+            if self._remove(path):
+                self.stats.bytes -= len(data)
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # evicted by another process since
+            pass
+        self.stats.hits += 1
+        return rows
+
+    def put(self, key: WindowKey, rows: List[Any]) -> None:
+        # an empty window may still be filled by late telemetry
+        if not rows:
+            return
+        path = self.path(key)
+        data = dumps(rows)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self.stats.writes += 1
+            self.stats.bytes += len(data)
+            over = self.stats.bytes > self.max_bytes
+        if over:
+            self._evict()
+
+    def get_or_load(self, key: WindowKey, loader: Callable[[], R]) -> R:
+        cached = self.get(key)
+        if cached is not None:
+            return cast(R, cached)
+        self.stats.misses += 1
+        rows = loader()
+        try:
+            self.put(key, rows)
+        except OSError as e:
+            LOGGER.warning(f"Failed to spill window to {self.directory}: {e}")
+        return rows
+
+    def _files(self) -> List[Tuple[float, str, int]]:
+        files = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith(SUFFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, entry.path, stat.st_size))
+        return files
+
+    def _evict(self) -> None:
+        with self._lock:
+            # other processes write to the directory too, so recount
+            files = sorted(self._files())
+            total = sum(size for _, _, size in files)
+            target = self.max_bytes * LOW_WATERMARK
+            for _, path, size in files:
+                if total <= target:
+                    break
+                if self._remove(path):
+                    self.stats.evictions += 1
+                total -= size
+            self.stats.bytes = total
+
+    def _remove_abandoned(self, max_age_s: float = 600.0) -> None:
+        """Delete partial writes left behind by processes that died"""
+        cutoff = dt.datetime.now().timestamp() - max_age_s
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(".tmp") and entry.stat().st_mtime < cutoff:
+                    self._remove(entry.path)
+
+    def _remove(self, path: str) -> bool:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+
+disk_cache: Optional[DiskWindowCache] = None
+if os.environ.get("DISK_CACHE_DIR"):
+    disk_cache = DiskWindowCache(
+        os.environ["DISK_CACHE_DIR"],
+        max_bytes=int(os.environ.get("DISK_CACHE_MAX_MB", "1024")) * 1024 * 1024,
+        fleet=fleet_tag(),
+    )
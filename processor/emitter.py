@@ -0,0 +1,277 @@
+import os
+import time
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Generator, List, Optional, Tuple
+
+import grpc
+import service_pb2 as pb
+import service_pb2_grpc
+import google.protobuf.struct_pb2 as struct_pb2
+from google.protobuf import json_format, timestamp_pb2
+from orca_python import Window, envs
+
+LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class EmitterStats:
+    windows_emitted: int = 0
+    windows_failed: int = 0
+    windows_retried: int = 0
+    windows_dropped: int = 0
+    batches: int = 0
+    flush_seconds_total: float = 0.0
+    flush_seconds_max: float = 0.0
+
+
+def _window_to_pb(window: Window) -> pb.Window:
+    """Mirror of the conversion `orca_python.EmitWindow` performs per call"""
+    _time_from = timestamp_pb2.Timestamp()
+    _time_from.FromDatetime(window.time_from)
+
+    _time_to = timestamp_pb2.Timestamp()
+    _time_to.FromDatetime(window.time_to)
+
+    window_pb = pb.Window()
+    window_pb.time_to.CopyFrom(_time_to)
+    window_pb.time_from.CopyFrom(_time_from)
+    window_pb.window_type_name = window.name
+    window_pb.window_type_version = window.version
+    window_pb.origin = window.origin
+
+    struct_value = struct_pb2.Struct()
+    json_format.ParseDict(window.metadata, struct_value)
+    window_pb.metadata = struct_value
+    return window_pb
+
+
+class WindowEmitter:
+    """
+    Buffers windows and emits them to Orca-core in batches.
+
+    Orca-core only exposes a unary `EmitWindow` RPC, so a batch is sent as
+    pipelined calls over one long-lived channel rather than one channel (and
+    TLS handshake) per window.
+
+    Windows emitted inside a `batch()` block are buffered for that block
+    alone, sent whenever `max_batch_size` of them are waiting and when the
+    block exits, and the block raises the first failure, so the algorithm
+    that emitted them fails rather than reporting success. Windows emitted
+    outside a block share a buffer flushed in the background when it reaches
+    `max_batch_size`, when its oldest window is older than `max_latency`, or
+    when the interpreter exits; a window that fails there is queued again up
+    to `max_retries` times before it is dropped and counted.
+    """
+
+    def __init__(
+        self,
+        max_batch_size: int = 100,
+        max_latency_ms: int = 200,
+        max_retries: int = 3,
+    ) -> None:
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000.0
+        self.max_retries = max_retries
+        self.stats = EmitterStats()
+
+        # (window, failed attempts) waiting for the background flush
+        self._buffer: List[Tuple[Window, int]] = []
+        self._oldest: Optional[float] = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._channel_lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._channel: Optional[grpc.Channel] = None
+        self._flusher: Optional[threading.Thread] = None
+        self._closed = False
+        atexit.register(self.close)
+
+    def emit(self, window: Window) -> None:
+        """Queue a window for emission"""
+        batch: Optional[_Batch] = getattr(self._local, "batch", None)
+        if batch is not None:
+            batch.windows.append(window)
+            if len(batch.windows) >= self.max_batch_size:
+                self._send_batch(batch)
+            return
+
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Window emitter is closed")
+            self._buffer.append((window, 0))
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            full = len(self._buffer) >= self.max_batch_size
+            if not full:
+                self._ensure_flusher()
+                self._wakeup.notify()
+        if full:
+            try:
+                self.flush()
+            except grpc.RpcError as e:
+                # failed windows are queued again, and may not be this caller's
+                LOGGER.warning(f"Window flush failed: {e}")
+
+    @contextmanager
+    def batch(self) -> Generator["WindowEmitter", None, None]:
+        """
+        Collect the windows emitted inside the block and send them on exit.
+        A nested block joins the outer one.
+
+        Raises:
+            grpc.RpcError: The first failure of the block's windows, after
+                the rest are sent.
+        """
+        if getattr(self._local, "batch", None) is not None:
+            yield self
+            return
+        batch = _Batch()
+        self._local.batch = batch
+        try:
+            yield self
+        finally:
+            self._local.batch = None
+            self._send_batch(batch)
+        if batch.error is not None:
+            raise batch.error
+
+    def flush(self) -> None:
+        """
+        Emit every window buffered outside a `batch()` block. Failed windows
+        are queued again until they have been tried `max_retries` times.
+
+        Raises:
+            grpc.RpcError: The first failure, after the rest of the batch is sent.
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._buffer = self._buffer, []
+                self._oldest = None
+            if not pending:
+                return
+
+            failed = self._send([window for window, _ in pending])
+            retry = []
+            for index, error in failed:
+                window, attempts = pending[index]
+                if attempts + 1 < self.max_retries and not self._closed:
+                    retry.append((window, attempts + 1))
+                else:
+                    LOGGER.error(
+                        f"Dropping window {window.name} {window.time_from} "
+                        f"{window.metadata} after {attempts + 1} attempts: {error}"
+                    )
+            with self._lock:
+                self.stats.windows_retried += len(retry)
+                self.stats.windows_dropped += len(failed) - len(retry)
+                if retry:
+                    self._buffer[:0] = retry
+                    if self._oldest is None:
+                        self._oldest = time.monotonic()
+                    self._wakeup.notify()
+
+        if failed:
+            raise failed[0][1]
+
+    def close(self) -> None:
+        """Flush outstanding windows and release the channel"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._wakeup.notify()
+        try:
+            self.flush()
+        except grpc.RpcError as e:
+            LOGGER.error(f"Failed to flush windows on close: {e}")
+        with self._channel_lock:
+            if self._channel is not None:
+                self._channel.close()
+                self._channel = None
+
+    def _send_batch(self, batch: "_Batch") -> None:
+        windows, batch.windows = batch.windows, []
+        failed = self._send(windows)
+        if failed and batch.error is None:
+            batch.error = failed[0][1]
+
+    def _send(self, windows: List[Window]) -> List[Tuple[int, grpc.RpcError]]:
+        """Emit the windows, returning the index and error of each failure"""
+        if not windows:
+            return []
+        start = time.perf_counter()
+        stub = service_pb2_grpc.OrcaCoreStub(self._get_channel())
+        futures = [stub.EmitWindow.future(_window_to_pb(w)) for w in windows]
+
+        failed = []
+        for index, future in enumerate(futures):
+            try:
+                future.result()
+            except grpc.RpcError as e:
+                failed.append((index, e))
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.stats.batches += 1
+            self.stats.windows_emitted += len(windows) - len(failed)
+            self.stats.windows_failed += len(failed)
+            self.stats.flush_seconds_total += elapsed
+            self.stats.flush_seconds_max = max(self.stats.flush_seconds_max, elapsed)
+        LOGGER.info(
+            f"Emitted {len(windows) - len(failed)}/{len(windows)} windows in {elapsed * 1000:.1f}ms ({self.stats})"
+        )
+        return failed
+
+    def _get_channel(self) -> grpc.Channel:
+        with self._channel_lock:
+            if self._channel is None:
+                if envs.is_production:
+                    self._channel = grpc.secure_channel(
+                        envs.ORCA_CORE, grpc.ssl_channel_credentials()
+                    )
+                else:
+                    self._channel = grpc.insecure_channel(envs.ORCA_CORE)
+            return self._channel
+
+    def _ensure_flusher(self) -> None:
+        # caller holds self._lock
+        if self._flusher is None:
+            self._flusher = threading.Thread(
+                target=self._run_flusher, name="window-emitter", daemon=True
+            )
+            self._flusher.start()
+
+    def _run_flusher(self) -> None:
+        while True:
+            with self._lock:
+                while not self._closed and self._oldest is None:
+                    self._wakeup.wait()
+                if self._closed:
+                    return
+                assert self._oldest is not None
+                remaining = self._oldest + self.max_latency - time.monotonic()
+                if remaining > 0:
+                    self._wakeup.wait(remaining)
+                    continue
+            try:
+                self.flush()
+            except grpc.RpcError as e:
+                LOGGER.warning(f"Background window flush failed: {e}")
+
+
+@dataclass
+class _Batch:
+    windows: List[Window] = field(default_factory=list)
+    error: Optional[grpc.RpcError] = None
+
+
+window_emitter = WindowEmitter(
+    max_batch_size=int(os.environ.get("EMIT_BATCH_SIZE", "100")),
+    max_latency_ms=int(os.environ.get("EMIT_MAX_LATENCY_MS", "200")),
+    max_retries=int(os.environ.get("EMIT_MAX_RETRIES", "3")),
+)
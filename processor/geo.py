@@ -0,0 +1,362 @@
+import json
+import math
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+METRES_PER_DEGREE = 111_320.0
+DEFAULT_SEGMENT_WIDTH_M = 20.0
+# a grid this large would rather want a coarser cell
+MAX_CELLS = 10_000_000
+# bound on the (points x edges) arrays built while indexing
+CHUNK_ELEMENTS = 1_000_000
+
+ZONE = "zone"
+SEGMENT = "segment"
+
+
+@dataclass
+class Geofence:
+    """
+    A zone (polygon rings, even-odd, so holes and multipolygons work) or a
+    road segment (polylines with a width), in local metres
+    """
+
+    name: str
+    kind: str
+    edges: np.ndarray  # (x0, y0, x1, y1) per edge
+    half_width_m: float = 0.0
+
+    @property
+    def bounds(self) -> Tuple[float, float, float, float]:
+        xs = self.edges[:, [0, 2]]
+        ys = self.edges[:, [1, 3]]
+        pad = self.half_width_m
+        return xs.min() - pad, ys.min() - pad, xs.max() + pad, ys.max() + pad
+
+    def contains(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        if self.kind == ZONE:
+            return points_in_rings(x, y, self.edges)
+        near: np.ndarray = (
+            distance_to_lines(x, y, self.edges).min(axis=1) <= self.half_width_m
+        )
+        return near
+
+
+def points_in_rings(x: np.ndarray, y: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """Ray casting against every edge at once"""
+    x0, y0, x1, y1 = edges.T
+    y_ = y[:, None]
+    crosses = (y0 > y_) != (y1 > y_)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_at_y = x0 + (y_ - y0) * (x1 - x0) / (y1 - y0)
+    inside: np.ndarray = (
+        np.count_nonzero(crosses & (x[:, None] < x_at_y), axis=1) % 2
+    ) == 1
+    return inside
+
+
+def distance_to_lines(x: np.ndarray, y: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """Distance of every point to every edge, shape (points, edges)"""
+    x0, y0, x1, y1 = edges.T
+    dx, dy = x1 - x0, y1 - y0
+    length2 = np.maximum(dx * dx + dy * dy, 1e-12)
+    t = ((x[:, None] - x0) * dx + (y[:, None] - y0) * dy) / length2
+    t = np.clip(t, 0.0, 1.0)
+    distance: np.ndarray = np.hypot(
+        x[:, None] - (x0 + t * dx), y[:, None] - (y0 + t * dy)
+    )
+    return distance
+
+
+class GeoIndex:
+    """
+    Zones and road segments on a uniform grid in local metres.
+
+    Every cell lists the geofences that may contain its points, and whether
+    the cell lies wholly inside one, so that `assign` only runs exact tests
+    for points in cells on a boundary. Points are projected, gridded and
+    looked up for a whole window at once.
+    """
+
+    def __init__(
+        self, fences: List[Geofence], origin: Tuple[float, float], cell_m: float
+    ) -> None:
+        if not fences:
+            raise ValueError("No geofences to index")
+        self.fences = fences
+        self.origin = origin
+        self.cell_m = cell_m
+        self._cos_lat = math.cos(math.radians(origin[0]))
+
+        bounds = np.array([fence.bounds for fence in fences])
+        self.x_min = float(bounds[:, 0].min())
+        self.y_min = float(bounds[:, 1].min())
+        self.nx = int((bounds[:, 2].max() - self.x_min) // cell_m) + 1
+        self.ny = int((bounds[:, 3].max() - self.y_min) // cell_m) + 1
+        if self.nx * self.ny > MAX_CELLS:
+            raise ValueError(
+                f"A {self.nx}x{self.ny} grid is too large, use a larger cell"
+            )
+
+        cells, owners, interior = [], [], []
+        for index, fence in enumerate(fences):
+            fence_cells, fence_interior = self._cells(fence)
+            cells.append(fence_cells)
+            owners.append(np.full(len(fence_cells), index, dtype=np.int32))
+            interior.append(fence_interior)
+        cell = np.concatenate(cells)
+        order = np.argsort(cell, kind="stable")
+        self._fence = np.concatenate(owners)[order]
+        self._interior = np.concatenate(interior)[order]
+        counts = np.bincount(cell, minlength=self.nx * self.ny)
+
+        self._count = counts.astype(np.int64)
+        self._start = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+
+        # every geofence's edges, for testing points against several at once
+        self._edges = np.concatenate([fence.edges for fence in fences])
+        self._edge_count = np.array([len(fence.edges) for fence in fences])
+        self._edge_start = np.cumsum(self._edge_count) - self._edge_count
+        self._half_width = np.array([fence.half_width_m for fence in fences])
+        self._is_zone = np.array([fence.kind == ZONE for fence in fences])
+
+    @classmethod
+    def from_geojson(cls, path: str, cell_m: float) -> "GeoIndex":
+        """
+        Polygons and multipolygons become zones, linestrings road segments
+        `width_m` wide (a feature property, default 20). Features are named
+        by their `name` property
+        """
+        with open(path) as f:
+            features = json.load(f)["features"]
+
+        coordinates = [
+            point
+            for feature in features
+            for point in _points(feature["geometry"]["coordinates"])
+        ]
+        lon0 = float(np.mean([point[0] for point in coordinates]))
+        lat0 = float(np.mean([point[1] for point in coordinates]))
+        cos_lat = math.cos(math.radians(lat0))
+
+        def project(line: List[List[float]]) -> np.ndarray:
+            lonlat = np.asarray(line, dtype=float)[:, :2]
+            return np.column_stack(
+                (
+                    (lonlat[:, 0] - lon0) * METRES_PER_DEGREE * cos_lat,
+                    (lonlat[:, 1] - lat0) * METRES_PER_DEGREE,
+                )
+            )
+
+        fences = []
+        for number, feature in enumerate(features):
+            geometry = feature["geometry"]
+            properties = feature.get("properties") or {}
+            name = str(properties.get("name", feature.get("id", f"geofence_{number}")))
+            kind = geometry["type"]
+            if kind == "Polygon":
+                lines, fence_kind = geometry["coordinates"], ZONE
+            elif kind == "MultiPolygon":
+                lines = [ring for part in geometry["coordinates"] for ring in part]
+                fence_kind = ZONE
+            elif kind == "LineString":
+                lines, fence_kind = [geometry["coordinates"]], SEGMENT
+            elif kind == "MultiLineString":
+                lines, fence_kind = geometry["coordinates"], SEGMENT
+            else:
+                raise ValueError(f"Unsupported geometry {kind} for {name}")
+            edges = np.concatenate(
+                [_edges(project(line), close=fence_kind == ZONE) for line in lines]
+            )
+            half_width = 0.0
+            if fence_kind == SEGMENT:
+                half_width = (
+                    float(properties.get("width_m", DEFAULT_SEGMENT_WIDTH_M)) / 2
+                )
+            fences.append(Geofence(name, fence_kind, edges, half_width))
+        return cls(fences, (lat0, lon0), cell_m)
+
+    def project(
+        self, lat: np.ndarray, lon: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        lat0, lon0 = self.origin
+        x = (lon - lon0) * METRES_PER_DEGREE * self._cos_lat
+        y = (lat - lat0) * METRES_PER_DEGREE
+        return x, y
+
+    def assign(self, lat: np.ndarray, lon: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (point index, geofence index) for every geofence each point lies in;
+        a point may lie in several, or none
+        """
+        x, y = self.project(np.asarray(lat, dtype=float), np.asarray(lon, dtype=float))
+        with np.errstate(invalid="ignore"):
+            ix = np.floor((x - self.x_min) / self.cell_m)
+            iy = np.floor((y - self.y_min) / self.cell_m)
+        valid = (ix >= 0) & (ix < self.nx) & (iy >= 0) & (iy < self.ny)
+        points = np.flatnonzero(valid)
+        cell = iy[valid].astype(np.int64) * self.nx + ix[valid].astype(np.int64)
+
+        # expand every point into one candidate per geofence of its cell
+        counts = self._count[cell]
+        total = int(counts.sum())
+        if total == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty
+        candidate_point = np.repeat(points, counts)
+        first = np.repeat(np.cumsum(counts) - counts, counts)
+        entry = np.repeat(self._start[cell], counts) + np.arange(total) - first
+        fence = self._fence[entry]
+
+        inside = self._interior[entry].copy()
+        boundary = np.flatnonzero(~inside)
+        if len(boundary):
+            tested = candidate_point[boundary]
+            inside[boundary] = self._contains(x[tested], y[tested], fence[boundary])
+        return candidate_point[inside], fence[inside].astype(np.int64)
+
+    def _contains(self, x: np.ndarray, y: np.ndarray, fence: np.ndarray) -> np.ndarray:
+        """
+        Exact test of each point against its own geofence, with the edges of
+        every pair laid out one after another so all pairs are tested at once
+        """
+        counts = self._edge_count[fence]
+        total = int(counts.sum())
+        pair = np.repeat(np.arange(len(fence)), counts)
+        first = np.cumsum(counts) - counts
+        edge = np.repeat(self._edge_start[fence] - first, counts) + np.arange(total)
+        x0, y0, x1, y1 = self._edges[edge].T
+        px, py = x[pair], y[pair]
+
+        # zones: ray casting, inside after an odd number of crossings
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_at_y = x0 + (py - y0) * (x1 - x0) / (y1 - y0)
+        crossing = ((y0 > py) != (y1 > py)) & (px < x_at_y)
+        in_zone = np.add.reduceat(crossing.astype(np.int64), first) % 2 == 1
+
+        # road segments: within half the width of the nearest edge
+        dx, dy = x1 - x0, y1 - y0
+        t = ((px - x0) * dx + (py - y0) * dy) / np.maximum(dx * dx + dy * dy, 1e-12)
+        t = np.clip(t, 0.0, 1.0)
+        distance = np.hypot(px - (x0 + t * dx), py - (y0 + t * dy))
+        near = np.minimum.reduceat(distance, first) <= self._half_width[fence]
+
+        inside: np.ndarray = np.where(self._is_zone[fence], in_zone, near)
+        return inside
+
+    def _cells(self, fence: Geofence) -> Tuple[np.ndarray, np.ndarray]:
+        """The cells that may hold points of the geofence, and which are inside"""
+        x_lo, y_lo, x_hi, y_hi = fence.bounds
+        ix = np.arange(
+            int((x_lo - self.x_min) // self.cell_m),
+            int((x_hi - self.x_min) // self.cell_m) + 1,
+        )
+        iy = np.arange(
+            int((y_lo - self.y_min) // self.cell_m),
+            int((y_hi - self.y_min) // self.cell_m) + 1,
+        )
+        grid_x, grid_y = np.meshgrid(ix, iy)
+        gx, gy = grid_x.ravel(), grid_y.ravel()
+
+        # cells x edges at a time, bounded to keep large zones in memory
+        chunk = max(1, CHUNK_ELEMENTS // len(fence.edges))
+        keep, interior = [], []
+        for lo in range(0, len(gx), chunk):
+            chunk_keep, chunk_interior = self._classify(
+                fence,
+                self.x_min + gx[lo : lo + chunk] * self.cell_m,
+                self.y_min + gy[lo : lo + chunk] * self.cell_m,
+            )
+            keep.append(chunk_keep)
+            interior.append(chunk_interior)
+        kept = np.concatenate(keep)
+        cells = gy[kept].astype(np.int64) * self.nx + gx[kept]
+        return cells, np.concatenate(interior)[kept]
+
+    def _classify(
+        self, fence: Geofence, cx0: np.ndarray, cy0: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Whether each cell (by its lower corner) is kept, and wholly inside"""
+        size = self.cell_m
+        n = len(cx0)
+        corners_x = np.concatenate([cx0, cx0 + size, cx0, cx0 + size])
+        corners_y = np.concatenate([cy0, cy0, cy0 + size, cy0 + size])
+
+        if fence.kind == ZONE:
+            corners_inside = fence.contains(corners_x, corners_y).reshape(4, n).all(0)
+            # no edge may pass through a cell that is wholly inside
+            edges = fence.edges
+            crossed = (
+                (np.minimum(edges[:, 0], edges[:, 2]) <= (cx0 + size)[:, None])
+                & (np.maximum(edges[:, 0], edges[:, 2]) >= cx0[:, None])
+                & (np.minimum(edges[:, 1], edges[:, 3]) <= (cy0 + size)[:, None])
+                & (np.maximum(edges[:, 1], edges[:, 3]) >= cy0[:, None])
+            ).any(axis=1)
+            return np.ones(n, dtype=bool), corners_inside & ~crossed
+
+        # a cell is inside when one edge's band holds all its corners, as
+        # each band is convex
+        distances = distance_to_lines(corners_x, corners_y, fence.edges)
+        within = (distances <= fence.half_width_m).reshape(4, n, -1)
+        interior: np.ndarray = np.logical_and.reduce(within, axis=0).any(axis=1)
+        centre = distance_to_lines(cx0 + size / 2, cy0 + size / 2, fence.edges)
+        keep: np.ndarray = (
+            centre.min(axis=1) <= fence.half_width_m + size * math.sqrt(2) / 2
+        )
+        return keep, interior
+
+
+def _points(coordinates: Any) -> List[List[float]]:
+    if coordinates and isinstance(coordinates[0], (int, float)):
+        return [coordinates]
+    return [point for part in coordinates for point in _points(part)]
+
+
+def _edges(points: np.ndarray, close: bool) -> np.ndarray:
+    if close and not np.array_equal(points[0], points[-1]):
+        points = np.vstack((points, points[:1]))
+    return np.column_stack((points[:-1], points[1:]))
+
+
+def geofence_totals(
+    index: GeoIndex,
+    lat: np.ndarray,
+    lon: np.ndarray,
+    dt_s: np.ndarray,
+    power_kw: np.ndarray,
+    speed_ms: np.ndarray,
+) -> Dict[str, Any]:
+    """
+    Time, energy and distance in every geofence the points lie in, with the
+    time spent in none of them
+    """
+    points, fences = index.assign(lat, lon)
+    n_fences = len(index.fences)
+    time_s = np.bincount(fences, weights=dt_s[points], minlength=n_fences)
+    kwh = np.bincount(
+        fences, weights=power_kw[points] * dt_s[points], minlength=n_fences
+    )
+    metres = np.bincount(
+        fences, weights=speed_ms[points] * dt_s[points], minlength=n_fences
+    )
+    samples = np.bincount(fences, minlength=n_fences)
+
+    totals: Dict[str, Dict[str, Any]] = {}
+    for fence in np.flatnonzero(samples):
+        geofence = index.fences[fence]
+        entry = totals.setdefault(
+            geofence.name,
+            {"kind": geofence.kind, "samples": 0, "time_s": 0.0, "kwh": 0.0, "km": 0.0},
+        )
+        entry["samples"] += int(samples[fence])
+        entry["time_s"] += float(time_s[fence])
+        entry["kwh"] += float(kwh[fence]) / 3600.0
+        entry["km"] += float(metres[fence]) / 1000.0
+    for entry in totals.values():
+        entry["kwh_per_km"] = entry["kwh"] / entry["km"] if entry["km"] > 0 else None
+
+    in_any = np.zeros(len(dt_s), dtype=bool)
+    in_any[points] = True
+    return {"geofences": totals, "outside_s": float(dt_s[~in_any].sum())}
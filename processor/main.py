@@ -1,32 +1,97 @@
+from startup import first_window, mark, warm_imports
 from orca_python import (
     Processor,
     ExecutionParams,
-    EmitWindow,
     Window,
     WindowType,
     StructResult,
     ValueResult,
 )
+import os
+import logging
 import datetime as dt
-import pandas as pd
 from db import db_pool
+from disk_cache import disk_cache
+from cassette import cassette
+from accumulators import trip_accumulators
+from admission import admission
+from cache import TelemetryCache, telemetry_cache
+from emitter import window_emitter
+from fleet import is_virtual_fleet, split_virtual_id
+from memo import result_store
+from prefetch import Prefetcher
+import pyramid
+from profiling import note_rows, profiler
+from pushdown import SqlPushdown, avg, percentile_cont, time_weighted, var_samp
+from shm_cache import shared_cache
+from sink import result_sink
 from psycopg2.extensions import connection as PGConnection
 
 from windows import (
     EveryMinute,
     EveryMinutePerTripPerBus,
+    StopVisit,
+    TripEnd,
 )
 
-from typing import TypedDict, Optional, Callable, ParamSpec, TypeVar, List
-import psycopg2.extras
+from typing import (
+    TYPE_CHECKING,
+    TypedDict,
+    Optional,
+    Callable,
+    ParamSpec,
+    TypeVar,
+    List,
+    Any,
+)
 import functools
-from frozendict import frozendict
 
+# the analytics stack is imported where it is used (and warmed in the
+# background after registration) to keep it off the cold start path
+if TYPE_CHECKING:
+    import pandas as pd
+    from geo import GeoIndex
+    from segmentation import StopVisits
+    from timebase import WindowFrame
+    from wheels import ChannelMatrix
+
+HEAVY_IMPORTS = ("pandas", "psycopg2.extras", "frozendict")
+
+
+LOGGER = logging.getLogger(__name__)
+
+# every window waiting for admission holds an executor thread
+proc = Processor("analyser", max_workers=admission.max_in_flight + admission.max_queued)
 
-proc = Processor("analyser")
+# reads are served from the cassette, without a database, when replaying
+read_pool = cassette.pool(db_pool)
 
 P = ParamSpec("P")
 T = TypeVar("T")
+A = TypeVar("A", bound=Callable[..., Any])
+
+
+def algorithm(
+    name: str, version: str, window_type: WindowType, memoise: bool = True
+) -> Callable[[A], A]:
+    """
+    Register an algorithm with the processor.
+    Runs once its window is admitted, slow invocations are profiled when
+    enabled, computed results go to the result sink when enabled, and results
+    are memoised per window unless the algorithm has side effects
+    """
+
+    def inner(fn: A) -> A:
+        if profiler is not None:
+            fn = profiler.profiled(name, version)(fn)
+        fn = admission.admitted(fn)
+        if result_sink is not None:
+            fn = result_sink.recording(name, version)(fn)
+        if memoise:
+            fn = result_store.memoise(name, version)(fn)
+        return proc.algorithm(name, version, window_type)(first_window(fn))
+
+    return inner
 
 
 def freezeargs(func: Callable[P, T]) -> Callable[P, T]:
@@ -37,6 +102,8 @@ def freezeargs(func: Callable[P, T]) -> Callable[P, T]:
 
     @functools.wraps(func)
     def wrapped(*args: P.args, **kwargs: P.kwargs) -> T:
+        from frozendict import frozendict
+
         # Convert mutable dicts to frozendict in args
         frozen_args = tuple(
             frozendict(arg) if isinstance(arg, dict) else arg for arg in args
@@ -144,14 +211,64 @@ def _get_telemetry_query_and_params(params: ReadTelemParams) -> tuple[str, dict]
     return BASE_QUERY, params
 
 
+@freezeargs
+@functools.lru_cache
+def _get_virtual_telemetry_query_and_params(
+    params: ReadTelemParams,
+) -> tuple[str, dict]:
+    """
+    Same as `_get_telemetry_query_and_params`, but reads the virtual fleet:
+    ids and times are rewritten per replica of the `virtual_fleet` table
+    """
+    if not any([params.get("trip_id"), params.get("time_from"), params.get("time_to")]):
+        raise ValueError(
+            "at least one of trip_id, time_from, or time_to must be provided"
+        )
+
+    rewritten = {
+        "trip_id": "t.trip_id + v.id_offset AS trip_id",
+        "time": "t.time + v.time_offset AS time",
+    }
+    columns = ",\n            ".join(
+        rewritten.get(column, f"t.{column}")
+        for column in ReadTelemResultRow.__annotations__
+    )
+    BASE_QUERY = f"""
+        SELECT
+            {columns}
+        FROM virtual_fleet v
+        CROSS JOIN telemetry t
+        WHERE 1=1
+    """
+    query_params = dict(params)
+
+    # pin the replica so that only its slice of telemetry is scanned
+    if params.get("trip_id"):
+        replica, real_trip_id = split_virtual_id(params["trip_id"])  # type: ignore[arg-type]
+        query_params.update(replica=replica, real_trip_id=real_trip_id)
+        BASE_QUERY += " AND v.replica = %(replica)s AND t.trip_id = %(real_trip_id)s"
+
+    # shift the bounds rather than the column so the time index is used
+    if params.get("time_from"):
+        BASE_QUERY += " AND t.time >= %(time_from)s - v.time_offset"
+    if params.get("time_to"):
+        BASE_QUERY += " AND t.time <= %(time_to)s - v.time_offset"
+
+    return BASE_QUERY, query_params
+
+
+@cassette.recorded
 def ReadTelemetryForTripAndTime(
     params: ReadTelemParams, conn: PGConnection
 ) -> List[ReadTelemResultRow]:
-    query, query_params = _get_telemetry_query_and_params(params)
-    with conn.cursor(
-        name="telem_cursor", cursor_factory=psycopg2.extras.RealDictCursor
-    ) as cur:
-        cur.execute(query, params)
+    from psycopg2.extras import RealDictCursor
+
+    if is_virtual_fleet():
+        query, query_params = _get_virtual_telemetry_query_and_params(params)
+    else:
+        query, query_params = _get_telemetry_query_and_params(params)
+    with conn.cursor(name="telem_cursor", cursor_factory=RealDictCursor) as cur:
+        cur.execute(query, query_params)
         return [ReadTelemResultRow(**row) for row in cur]  # type: ignore
 
 
@@ -166,6 +283,7 @@ class ReadActiveBussesRow(TypedDict):
     route_id: int
 
 
+@cassette.recorded
 def ReadActiveBusses(
     params: ReadActiveBussesParams, conn: PGConnection
 ) -> List[ReadActiveBussesRow]:
@@ -175,9 +293,21 @@ def ReadActiveBusses(
         JOIN trips tr ON t.trip_id = tr.id 
         WHERE t."time" BETWEEN %(time_from)s AND %(time_to)s
     """
-    with conn.cursor(
-        name="telem_cursor", cursor_factory=psycopg2.extras.RealDictCursor
-    ) as cur:
+    if is_virtual_fleet():
+        query = """
+            SELECT DISTINCT
+                t.trip_id + v.id_offset AS trip_id,
+                tr.bus_id + v.id_offset AS bus_id,
+                tr.route_id
+            FROM virtual_fleet v
+            JOIN telemetry t
+                ON t."time" BETWEEN %(time_from)s - v.time_offset
+                AND %(time_to)s - v.time_offset
+            JOIN trips tr ON t.trip_id = tr.id
+        """
+    from psycopg2.extras import RealDictCursor
+
+    with conn.cursor(name="telem_cursor", cursor_factory=RealDictCursor) as cur:
         cur.execute(query, params)
         return [ReadActiveBussesRow(**row) for row in cur]  # type: ignore
 
@@ -204,6 +334,7 @@ class ReadTripsFromTripIdRow(TypedDict):
     amb_temperature_max: float
 
 
+@cassette.recorded
 def ReadTripsFromTripId(
     params: ReadTripsFromTripIdParams, conn: PGConnection
 ) -> ReadTripsFromTripIdRow:
@@ -227,15 +358,315 @@ def ReadTripsFromTripId(
         FROM trips t
         WHERE t.id = %(trip_id)s LIMIT 1;
     """
+    query_params = dict(params)
+    if is_virtual_fleet():
+        replica, real_trip_id = split_virtual_id(params["trip_id"])
+        query_params.update(replica=replica, real_trip_id=real_trip_id)
+        query = """
+            SELECT
+                t.id + v.id_offset AS id,
+                t.name,
+                t.bus_id + v.id_offset AS bus_id,
+                t.route_id,
+                t.start_time + v.time_offset AS start_time,
+                t.end_time + v.time_offset AS end_time,
+                t.driven_distance_km,
+                t.energy_consumption_kwh,
+                t.itcs_passengers_mean,
+                t.itcs_passengers_min,
+                t.itcs_passengers_max,
+                t.grid_available_mean,
+                t.amb_temperature_mean,
+                t.amb_temperature_min,
+                t.amb_temperature_max
+            FROM virtual_fleet v
+            JOIN trips t ON t.id = %(real_trip_id)s
+            WHERE v.replica = %(replica)s LIMIT 1;
+        """
+    from psycopg2.extras import RealDictCursor
+
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(query, query_params)
+        results = cur.fetchall()
+        return [ReadTripsFromTripIdRow(**row) for row in results][0]  # type: ignore
+
 
-    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+class ReadEndedTripsParams(TypedDict):
+    time_from: dt.datetime
+    time_to: dt.datetime
+
+
+class ReadEndedTripsRow(TypedDict):
+    trip_id: int
+    bus_id: int
+    route_id: int
+    start_time: dt.datetime
+    end_time: dt.datetime
+
+
+@cassette.recorded
+def ReadEndedTrips(
+    params: ReadEndedTripsParams, conn: PGConnection
+) -> List[ReadEndedTripsRow]:
+    """Trips whose end falls in (time_from, time_to], so each is seen once"""
+    query = """
+        SELECT
+            t.id AS trip_id,
+            t.bus_id,
+            t.route_id,
+            t.start_time,
+            t.end_time
+        FROM trips t
+        WHERE t.end_time > %(time_from)s AND t.end_time <= %(time_to)s
+    """
+    if is_virtual_fleet():
+        query = """
+            SELECT
+                t.id + v.id_offset AS trip_id,
+                t.bus_id + v.id_offset AS bus_id,
+                t.route_id,
+                t.start_time + v.time_offset AS start_time,
+                t.end_time + v.time_offset AS end_time
+            FROM virtual_fleet v
+            JOIN trips t
+                ON t.end_time > %(time_from)s - v.time_offset
+                AND t.end_time <= %(time_to)s - v.time_offset
+        """
+    from psycopg2.extras import RealDictCursor
+
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
         cur.execute(query, params)
-        results = cur.fetchall()
-        return [ReadTelemResultRow(**row) for row in results][0]  # type: ignore
+        return [ReadEndedTripsRow(**row) for row in cur]  # type: ignore
+
+
+class ReadFleetTelemetryParams(TypedDict):
+    time_from: dt.datetime
+    time_to: dt.datetime
+
+
+class ReadFleetTelemetryRow(TypedDict):
+    trip_id: int
+    bus_id: int
+    time: dt.datetime
+    electric_power_demand: Optional[float]
+    odometry_vehicle_speed: Optional[float]
+    itcs_number_of_passengers: Optional[int]
+    status_halt_brake_is_active: Optional[bool]
+
+
+@cassette.recorded
+def ReadFleetTelemetry(
+    params: ReadFleetTelemetryParams, conn: PGConnection
+) -> List[ReadFleetTelemetryRow]:
+    """
+    The columns of the fleet KPIs for every bus in the window, in one read.
+    Trips without a bus (`bus_id` is NULL in `trips`) cannot be grouped by
+    bus and are left out
+    """
+    query = """
+        SELECT
+            t.trip_id,
+            tr.bus_id,
+            t."time",
+            t.electric_power_demand,
+            t.odometry_vehicle_speed,
+            t.itcs_number_of_passengers,
+            t.status_halt_brake_is_active
+        FROM telemetry t
+        JOIN trips tr ON t.trip_id = tr.id
+        WHERE t."time" BETWEEN %(time_from)s AND %(time_to)s
+            AND tr.bus_id IS NOT NULL
+    """
+    if is_virtual_fleet():
+        query = """
+            SELECT
+                t.trip_id + v.id_offset AS trip_id,
+                tr.bus_id + v.id_offset AS bus_id,
+                t."time" + v.time_offset AS "time",
+                t.electric_power_demand,
+                t.odometry_vehicle_speed,
+                t.itcs_number_of_passengers,
+                t.status_halt_brake_is_active
+            FROM virtual_fleet v
+            JOIN telemetry t
+                ON t."time" BETWEEN %(time_from)s - v.time_offset
+                AND %(time_to)s - v.time_offset
+            JOIN trips tr ON t.trip_id = tr.id
+            WHERE tr.bus_id IS NOT NULL
+        """
+    from psycopg2.extras import RealDictCursor
+
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(query, params)
+        return [ReadFleetTelemetryRow(**row) for row in cur]  # type: ignore
+
+
+ReadTelemetrySummary = cassette.recorded(pyramid.ReadTelemetrySummary)
+
+
+def _load_trip_window(
+    trip_id: int, time_from: dt.datetime, time_to: dt.datetime
+) -> List[ReadTelemResultRow]:
+    """
+    Read a window's telemetry through the caches behind the in-process one,
+    when enabled (and no cassette is recording reads): the cache shared by
+    the processes on this node, then the windows spilled to disk
+    """
+
+    def load() -> List[ReadTelemResultRow]:
+        with read_pool.connection() as conn:
+            return ReadTelemetryForTripAndTime(
+                ReadTelemParams(time_from=time_from, time_to=time_to, trip_id=trip_id),
+                conn,
+            )
+
+    if cassette.mode is not None:
+        return load()
+    key = (trip_id, time_from, time_to)
+    read: Callable[[], List[ReadTelemResultRow]] = load
+    if disk_cache is not None:
+        read = functools.partial(disk_cache.get_or_load, key, load)
+    if shared_cache is None:
+        return read()
+    rows: List[ReadTelemResultRow] = shared_cache.get_or_load(key, read)
+    return rows
+
+
+COALESCE_MAX_WINDOWS = int(os.environ.get("COALESCE_MAX_WINDOWS", "10"))
+
+prefetcher = Prefetcher(
+    telemetry_cache,
+    _load_trip_window,
+    enabled=os.environ.get("PREFETCH_ENABLED", "true").lower() == "true",
+)
+
+
+def _coalesced_windows(
+    trip_id: int, time_from: dt.datetime, time_to: dt.datetime
+) -> List[tuple[dt.datetime, dt.datetime]]:
+    """
+    The window plus the queued windows of the same trip that directly follow
+    it, when the processor is lagging. Otherwise just the window
+    """
+    windows = [(time_from, time_to)]
+    if not admission.lagging():
+        return windows
+    for queued_from, queued_to in admission.queued_for_trip(trip_id):
+        if len(windows) >= COALESCE_MAX_WINDOWS:
+            break
+        if (
+            queued_from == windows[-1][1]
+            and (trip_id, queued_from, queued_to) not in telemetry_cache
+        ):
+            windows.append((queued_from, queued_to))
+    return windows
+
+
+def _load_coalesced(
+    trip_id: int, windows: List[tuple[dt.datetime, dt.datetime]]
+) -> List[ReadTelemResultRow]:
+    """Fetch consecutive windows in one query and cache each window's slice"""
+    import numpy as np
+
+    rows = _load_trip_window(trip_id, windows[0][0], windows[-1][1])
+    times = np.array([row["time"] for row in rows], dtype="datetime64[us]")
+    order = np.argsort(times, kind="stable")
+    sorted_times = times[order]
+
+    slices = []
+    for time_from, time_to in windows:
+        # BETWEEN is inclusive, so boundary rows belong to both neighbours
+        lo = np.searchsorted(sorted_times, np.datetime64(time_from, "us"), "left")
+        hi = np.searchsorted(sorted_times, np.datetime64(time_to, "us"), "right")
+        slices.append([rows[ii] for ii in order[lo:hi]])
+    for (time_from, time_to), window_rows in zip(windows[1:], slices[1:]):
+        telemetry_cache.put((trip_id, time_from, time_to), window_rows)
+    if disk_cache is not None and cassette.mode is None:
+        for (time_from, time_to), window_rows in zip(windows, slices):
+            disk_cache.put((trip_id, time_from, time_to), window_rows)
+    admission.record_coalesced(len(windows))
+    return slices[0]
+
+
+def _read_trip_window(
+    trip_id: int, time_from: dt.datetime, time_to: dt.datetime
+) -> List[ReadTelemResultRow]:
+    """
+    Telemetry for the trip and time range of a per-trip window.
+    Served from the window cache when warm, and prefetches the next window.
+    When lagging, queued windows of the trip are fetched along with it
+    """
+
+    def load() -> List[ReadTelemResultRow]:
+        windows = _coalesced_windows(trip_id, time_from, time_to)
+        # a window spilled to disk is cheaper than any query
+        if len(windows) == 1 or (
+            disk_cache is not None and (trip_id, time_from, time_to) in disk_cache
+        ):
+            return _load_trip_window(trip_id, time_from, time_to)
+        return _load_coalesced(trip_id, windows)
+
+    rows = telemetry_cache.get_or_load((trip_id, time_from, time_to), load)
+    if rows:
+        prefetcher.schedule(trip_id, time_from, time_to)
+    return rows
+
+
+# frames are derived from the cached rows, so a small cache covering the
+# windows in flight is enough
+frame_cache: "TelemetryCache[WindowFrame]" = TelemetryCache(
+    max_entries=int(os.environ.get("FRAME_CACHE_SIZE", "64"))
+)
+
+
+def _read_trip_frame(params: ExecutionParams) -> "WindowFrame":
+    """
+    The window's telemetry as a time-sorted frame with its timebase.
+    Built once per window and shared by every algorithm it triggers
+    """
+    trip_id = params.window.metadata.get("trip_id")
+    if trip_id is None:
+        raise Exception("Require trip_id as metadata to the window")
+    key = (int(trip_id), params.window.time_from, params.window.time_to)
+    frame = frame_cache.get_or_load(key, lambda: _build_trip_frame(key))
+    note_rows(len(frame))
+    return frame
+
+
+def _build_trip_frame(key: tuple[int, dt.datetime, dt.datetime]) -> "WindowFrame":
+    """
+    A window fetched by another process on this node is built straight from
+    its columns in shared memory, without decoding it into rows
+    """
+    from timebase import build_window_frame, window_frame
+
+    trip_id, time_from, time_to = key
+    if shared_cache is not None and cassette.mode is None:
+        df = shared_cache.get_frame(key)
+        if df is not None:
+            if not df.empty:
+                prefetcher.schedule(trip_id, time_from, time_to)
+            return window_frame(df, time_to)
+    return build_window_frame(_read_trip_window(trip_id, time_from, time_to), time_to)
+
+
+# reduction-only metrics can run inside Postgres, one query per window for
+# every trip. The cassette does not record these, so they stay off with it
+pushdown = SqlPushdown(
+    db_pool,
+    columns=list(ReadTelemResultRow.__annotations__),
+    enabled=os.environ.get("SQL_PUSHDOWN", "false").lower() == "true"
+    and cassette.mode is None,
+    cache_size=int(os.environ.get("SQL_PUSHDOWN_CACHE_SIZE", "16")),
+)
+
+
+def _float_or_none(value: Any) -> Optional[float]:
+    return None if value is None else float(value)
 
 
 def _find_contiguous_chunks_and_emit(
-    df: pd.DataFrame,
+    df: "pd.DataFrame",
     tgt_column: str,
     time_column: str,
     trip_id: int,
@@ -245,7 +676,9 @@ def _find_contiguous_chunks_and_emit(
     conn: PGConnection,
     lookback_window: dt.timedelta = dt.timedelta(seconds=20),  # seconds
     max_lookback_iterations: int = 20,
-) -> pd.DataFrame:
+) -> "pd.DataFrame":
+    import pandas as pd
+
     # if the first value is true, then we need to look back
     if df.loc[0, tgt_column]:
         ii = 0
@@ -296,7 +729,6 @@ def _find_contiguous_chunks_and_emit(
     in_window = False
     start_idx = 0
     windows_emitted = 0
-    windows = []
     for ii, row in df.iterrows():
         if row[tgt_column] and not in_window:
             in_window = True
@@ -323,25 +755,23 @@ def _find_contiguous_chunks_and_emit(
                 # Convert pandas timestamp or other types to datetime
                 end_timestamp = pd.to_datetime(end_time).timestamp()
 
-            windows.append(
-                EmitWindow(
-                    Window(
-                        time_from=dt.datetime.fromtimestamp(start_timestamp),
-                        time_to=dt.datetime.fromtimestamp(end_timestamp),
-                        name=emitting_window.name,
-                        version=emitting_window.version,
-                        origin=origin,
-                        metadata={"trip_id": trip_id},
-                    )
+            window_emitter.emit(
+                Window(
+                    time_from=dt.datetime.fromtimestamp(start_timestamp),
+                    time_to=dt.datetime.fromtimestamp(end_timestamp),
+                    name=emitting_window.name,
+                    version=emitting_window.version,
+                    origin=origin,
+                    metadata={"trip_id": trip_id},
                 )
             )
     return windows_emitted
 
 
 # --- Find whether a trip is ongoing ---
-@proc.algorithm("FindActiveBusses", "1.0.0", EveryMinute)
+@algorithm("FindActiveBusses", "1.0.0", EveryMinute, memoise=False)
 def FindActiveBuses(params: ExecutionParams) -> ValueResult:
-    with db_pool.connection() as conn:
+    with read_pool.connection() as conn:
         # get telemetry for this window
         buses = ReadActiveBusses(
             ReadActiveBussesParams(
@@ -350,13 +780,31 @@ def FindActiveBuses(params: ExecutionParams) -> ValueResult:
             ),
             conn,
         )
-        count = 0
+    note_rows(len(buses))
+    LOGGER.info(
+        f"Telemetry cache: {telemetry_cache.stats}, frames: {frame_cache.stats}, "
+        f"prefetch: {prefetcher.stats}, admission: {admission.stats}, "
+        f"pushdown: {pushdown.stats}, accumulators: {trip_accumulators.stats}"
+    )
+    if shared_cache is not None:
+        LOGGER.info(f"Shared telemetry cache: {shared_cache.stats}")
+    if disk_cache is not None:
+        LOGGER.info(f"Disk telemetry cache: {disk_cache.stats}")
+
+    return ValueResult(_emit_active_bus_windows(buses, params))
+
+
+def _emit_active_bus_windows(
+    buses: List[ReadActiveBussesRow], params: ExecutionParams
+) -> int:
+    count = 0
+    with window_emitter.batch():
         for bus in buses:
             count += 1
-            EmitWindow(
+            window_emitter.emit(
                 Window(
-                    time_from=params.time_from,
-                    time_to=params.time_to,
+                    time_from=params.window.time_from,
+                    time_to=params.window.time_to,
                     name=EveryMinutePerTripPerBus.name,
                     version=EveryMinutePerTripPerBus.version,
                     origin="active_bus_emitter",
@@ -367,8 +815,47 @@ def FindActiveBuses(params: ExecutionParams) -> ValueResult:
                     },
                 )
             )
+    return count
+
+
+# --- Find trips that have ended ---
+@algorithm("FindEndedTrips", "1.0.0", EveryMinute, memoise=False)
+def FindEndedTrips(params: ExecutionParams) -> ValueResult:
+    with read_pool.connection() as conn:
+        trips = ReadEndedTrips(
+            ReadEndedTripsParams(
+                time_from=params.window.time_from,
+                time_to=params.window.time_to,
+            ),
+            conn,
+        )
 
-    return ValueResult(count)
+    with window_emitter.batch():
+        for trip in trips:
+            trip_id = int(trip["trip_id"])
+            # nothing more will be read for the trip
+            prefetcher.cancel(trip_id)
+            frame_cache.evict_trip(trip_id)
+            # its last minutes may still be on their way
+            trip_accumulators.end(trip_id, trip["end_time"])
+            if shared_cache is not None:
+                shared_cache.evict_trip(trip_id)
+            window_emitter.emit(
+                Window(
+                    time_from=trip["start_time"],
+                    time_to=trip["end_time"],
+                    name=TripEnd.name,
+                    version=TripEnd.version,
+                    origin="trip_end_emitter",
+                    metadata={
+                        "trip_id": trip_id,
+                        "bus_id": trip.get("bus_id"),
+                        "route_id": trip.get("route_id"),
+                    },
+                )
+            )
+    trip_accumulators.expire(params.window.time_to)
+    return ValueResult(len(trips))
 
 
 # @proc.algorithm("FindHaltBrakeWindows", "1.0.0", EveryMinute)
@@ -446,158 +933,689 @@ def FindActiveBuses(params: ExecutionParams) -> ValueResult:
 
 
 # --- Temperature ---
-@proc.algorithm("AmbientTemperature", "1.0.0", EveryMinutePerTripPerBus)
+@algorithm("AmbientTemperature", "1.0.0", EveryMinutePerTripPerBus)
 def ambient_temperature_per_minute(params: ExecutionParams) -> StructResult:
-    with db_pool.connection() as conn:
-        trip_id = params.window.metadata["trip_id"]
-        if trip_id is None:
-            raise Exception("Require trip_id as metadata to the window")
+    pushed = pushdown.result("AmbientTemperature", params)
+    if pushed is not None:
+        return StructResult(pushed)
+    return StructResult(_ambient_temperature(_read_trip_frame(params)))
 
-        telem = ReadTelemetryForTripAndTime(
-            ReadTelemParams(
-                time_from=params.window.time_from,
-                time_to=params.window.time_to,
-                trip_id=trip_id,
-            ),
-            conn,
-        )
-    df = pd.DataFrame(telem)
-    median = df["temperature_ambient"].median()
-    return StructResult(
-        {
-            "50p": median,
-        }
-    )
+
+def _ambient_temperature(frame: "WindowFrame") -> dict[str, Any]:
+    if frame.df.empty:
+        return {"50p": None}
+    median = frame.df["temperature_ambient"].median()
+    return {
+        "50p": median,
+    }
+
+
+pushdown.register(
+    "AmbientTemperature",
+    {"median": percentile_cont(0.5, "temperature_ambient")},
+    lambda r: {"50p": _float_or_none(r["median"])},
+)
 
 
 # --- Energy Efficiency ---
-@proc.algorithm("EnergyEfficiencyPerMinute", "1.0.0", EveryMinutePerTripPerBus)
+@algorithm("EnergyEfficiencyPerMinute", "1.1.0", EveryMinutePerTripPerBus)
 def energy_efficiency_per_minute(params: ExecutionParams) -> StructResult:
-    with db_pool.connection() as conn:
-        telem = ReadTelemetryForTripAndTime(
-            ReadTelemParams(
-                time_from=params.window.time_from,
-                time_to=params.window.time_to,
-                trip_id=None,
-            ),
-            conn,
-        )
+    pushed = pushdown.result("EnergyEfficiencyPerMinute", params)
+    if pushed is not None:
+        return StructResult(pushed)
+    return StructResult(_energy_efficiency(_read_trip_frame(params)))
+
 
-    df = pd.DataFrame(telem)
+def _energy_efficiency(frame: "WindowFrame") -> dict[str, Any]:
+    sums = _energy_sums(frame)
+    if sums is None:
+        return {"kwh": None, "kwh_per_km": None, "kwh_per_passenger_km": None}
+    return _energy_totals(**sums)
+
+
+def _energy_sums(frame: "WindowFrame") -> Optional[dict[str, float]]:
+    """Energy, distance and passenger-km over the window, None when empty"""
+    df = frame.df
     if df.empty:
-        return StructResult(
-            {"kwh": None, "kwh_per_km": None, "kwh_per_passenger_km": None}
-        )
+        return None
+    dt_s = frame.timebase.dt_s
 
     # Energy in kWh: power demand [kW] * time [h]
-    df["energy_kwh"] = df["electric_power_demand"].fillna(0) / 3600.0  # 1s samples
-    total_kwh = df["energy_kwh"].sum()
+    power_kw = df["electric_power_demand"].fillna(0).to_numpy(dtype=float)
+    total_kwh = float((power_kw * dt_s).sum()) / 3600.0
 
-    # Distance travelled from odometry speed (m/s * 1s)
-    df["dist_m"] = df["odometry_vehicle_speed"].fillna(0)
-    df["dist_m"] = df["dist_m"] * 1.0  # one second
-    total_km = df["dist_m"].sum() / 1000.0
+    # Distance travelled from odometry speed [m/s] * time [s]
+    dist_m = df["odometry_vehicle_speed"].fillna(0).to_numpy(dtype=float) * dt_s
+    total_km = float(dist_m.sum()) / 1000.0
 
     # Passenger-km
-    passenger_km = (
-        df["itcs_number_of_passengers"].fillna(0) * df["dist_m"]
-    ).sum() / 1000.0
-
-    return StructResult(
-        {
-            "kwh": total_kwh,
-            "kwh_per_km": total_kwh / total_km if total_km > 0 else None,
-            "kwh_per_passenger_km": total_kwh / passenger_km
-            if passenger_km > 0
-            else None,
+    passengers = df["itcs_number_of_passengers"].fillna(0).to_numpy(dtype=float)
+    passenger_km = float((passengers * dist_m).sum()) / 1000.0
+
+    return {"kwh": total_kwh, "km": total_km, "passenger_km": passenger_km}
+
+
+def _energy_totals(kwh: float, km: float, passenger_km: float) -> dict[str, Any]:
+    return {
+        "kwh": kwh,
+        "kwh_per_km": kwh / km if km > 0 else None,
+        "kwh_per_passenger_km": kwh / passenger_km if passenger_km > 0 else None,
+    }
+
+
+ENERGY_REDUCTIONS = {
+    "kwh": time_weighted("coalesce(electric_power_demand, 0)") + " / 3600.0",
+    "km": time_weighted("coalesce(odometry_vehicle_speed, 0)") + " / 1000.0",
+    "passenger_km": time_weighted(
+        "coalesce(itcs_number_of_passengers, 0) * coalesce(odometry_vehicle_speed, 0)"
+    )
+    + " / 1000.0",
+}
+
+
+def _floats(row: dict[str, Any]) -> dict[str, float]:
+    return {key: float(value) for key, value in row.items()}
+
+
+pushdown.register(
+    "EnergyEfficiencyPerMinute",
+    ENERGY_REDUCTIONS,
+    lambda r: _energy_totals(**_floats(r)),
+)
+
+
+# --- Cumulative Trip KPIs ---
+# not memoised: the result depends on the minutes before the window, so a
+# redelivered window is answered from the trip's current totals
+@algorithm(
+    "CumulativeTripKpisPerMinute", "1.0.0", EveryMinutePerTripPerBus, memoise=False
+)
+def cumulative_trip_kpis_per_minute(params: ExecutionParams) -> StructResult:
+    """
+    Energy, distance and passenger-km since the start of the trip, kept as
+    running sums of each minute's energy sums rather than re-reading the trip
+    """
+    window = params.window
+    trip_id = window.metadata.get("trip_id")
+    if trip_id is None:
+        raise Exception("Require trip_id as metadata to the window")
+
+    sums = pushdown.result("CumulativeTripKpisPerMinute", params)
+    if sums is None:
+        sums = _energy_sums(_read_trip_frame(params)) or {
+            "kwh": 0.0,
+            "km": 0.0,
+            "passenger_km": 0.0,
         }
+    totals, minutes = trip_accumulators.add(
+        int(trip_id),
+        window.time_from,
+        window.time_from - (window.time_to - window.time_from),
+        sums,
     )
+    return StructResult(_cumulative_trip_kpis(totals, minutes))
+
+
+def _cumulative_trip_kpis(totals: dict[str, float], minutes: int) -> dict[str, Any]:
+    return {
+        **_energy_totals(totals["kwh"], totals["km"], totals["passenger_km"]),
+        "km": totals["km"],
+        "passenger_km": totals["passenger_km"],
+        "minutes": minutes,
+    }
+
+
+pushdown.register("CumulativeTripKpisPerMinute", ENERGY_REDUCTIONS, _floats)
 
 
 # --- Service Efficiency ---
-@proc.algorithm("ServiceEfficiencyPerMinute", "1.0.0", EveryMinutePerTripPerBus)
+@algorithm("ServiceEfficiencyPerMinute", "1.1.0", EveryMinutePerTripPerBus)
 def service_efficiency_per_minute(params: ExecutionParams) -> StructResult:
-    with db_pool.connection() as conn:
-        telem = ReadTelemetryForTripAndTime(
-            ReadTelemParams(
-                time_from=params.window.time_from,
-                time_to=params.window.time_to,
-                trip_id=None,
-            ),
-            conn,
-        )
-    df = pd.DataFrame(telem)
-    if df.empty:
-        return StructResult({"dwell_time_s": None, "door_open_fraction": None})
+    pushed = pushdown.result("ServiceEfficiencyPerMinute", params)
+    if pushed is not None:
+        return StructResult(pushed)
+    return StructResult(_service_efficiency(_read_trip_frame(params)))
 
-    total_time = len(df)  # seconds
-    dwell_time = df[
-        (df["status_door_is_open"]) & (df["odometry_vehicle_speed"] < 0.1)
-    ].shape[0]
 
-    return StructResult(
-        {
-            "dwell_time_s": dwell_time,
-            "door_open_fraction": dwell_time / total_time if total_time > 0 else None,
-        }
+def _service_efficiency(frame: "WindowFrame") -> dict[str, Any]:
+    df = frame.df
+    if df.empty:
+        return {"dwell_time_s": None, "door_open_fraction": None}
+
+    total_time = frame.timebase.duration_s
+    dwelling = df["status_door_is_open"].fillna(False).to_numpy(dtype=bool) & (
+        df["odometry_vehicle_speed"].to_numpy(dtype=float) < 0.1
     )
+    dwell_time = float(frame.timebase.dt_s[dwelling].sum())
+
+    return _service_totals(dwell_time, total_time)
+
+
+def _service_totals(dwell_time: float, total_time: float) -> dict[str, Any]:
+    return {
+        "dwell_time_s": dwell_time,
+        "door_open_fraction": dwell_time / total_time if total_time > 0 else None,
+    }
+
+
+pushdown.register(
+    "ServiceEfficiencyPerMinute",
+    {
+        "dwell_s": "coalesce(sum(dt_s) FILTER (WHERE coalesce(status_door_is_open,"
+        " false) AND odometry_vehicle_speed < 0.1), 0)",
+        "total_s": "sum(dt_s)",
+    },
+    lambda r: _service_totals(float(r["dwell_s"]), float(r["total_s"])),
+)
 
 
 # --- Comfort & Safety ---
-@proc.algorithm("ComfortAndSafetyPerMinute", "1.0.0", EveryMinutePerTripPerBus)
+@algorithm("ComfortAndSafetyPerMinute", "1.1.0", EveryMinutePerTripPerBus)
 def comfort_and_safety_per_minute(params: ExecutionParams) -> StructResult:
-    with db_pool.connection() as conn:
-        telem = ReadTelemetryForTripAndTime(
-            ReadTelemParams(
+    return StructResult(_comfort_and_safety(_read_trip_frame(params)))
+
+
+def _comfort_and_safety(frame: "WindowFrame") -> dict[str, Any]:
+    import pandas as pd
+    from timebase import derivative
+
+    df = frame.df
+    if df.empty or "odometry_vehicle_speed" not in df.columns:
+        return {"mean_accel": None, "std_accel": None, "jerk_95p": None}
+
+    # Acceleration (m/s^2) and jerk (rate of change of acceleration) over the
+    # actual sample spacing. Samples without a valid step are NaN and skipped
+    speed = df["odometry_vehicle_speed"].to_numpy(dtype=float)
+    accel = derivative(speed, frame.timebase)
+    jerk = pd.Series(derivative(accel, frame.timebase))
+    accel_s = pd.Series(accel)
+
+    return {
+        "mean_accel": accel_s.mean(),
+        "std_accel": accel_s.std(),
+        "jerk_95p": jerk.quantile(0.95),
+    }
+
+
+# --- Asset Stress ---
+@algorithm("AssetStressPerMinute", "1.0.0", EveryMinutePerTripPerBus)
+def asset_stress_per_minute(params: ExecutionParams) -> StructResult:
+    pushed = pushdown.result("AssetStressPerMinute", params)
+    if pushed is not None:
+        return StructResult(pushed)
+    return StructResult(_asset_stress(_read_trip_frame(params)))
+
+
+def _asset_stress(frame: "WindowFrame") -> dict[str, Any]:
+    df = frame.df
+    if df.empty:
+        return {"articulation_var": None, "brake_pressure_mean": None}
+
+    return {
+        "articulation_var": df["odometry_articulation_angle"].var(),
+        "brake_pressure_mean": df["traction_brake_pressure"].mean(),
+    }
+
+
+pushdown.register(
+    "AssetStressPerMinute",
+    {
+        "articulation_var": var_samp("odometry_articulation_angle"),
+        "brake_pressure_mean": avg("traction_brake_pressure"),
+    },
+    lambda r: {key: _float_or_none(value) for key, value in r.items()},
+)
+
+
+# --- Wheel Dynamics ---
+@algorithm("WheelDynamicsPerMinute", "1.1.0", EveryMinutePerTripPerBus)
+def wheel_dynamics_per_minute(params: ExecutionParams) -> StructResult:
+    """
+    Slip ratio per wheel, left/right imbalance per axle and odometry
+    consistency, with the share of moving time each is above its threshold.
+    Wheel speeds are converted to m/s with `WHEEL_RADIUS_M`
+    """
+    return StructResult(_wheel_dynamics(_read_trip_frame(params)))
+
+
+def _wheel_dynamics(frame: "WindowFrame") -> dict[str, Any]:
+    from wheels import wheel_dynamics, wheel_inputs
+
+    if frame.df.empty:
+        return {
+            "mean": {},
+            "max_abs": {},
+            "flagged_fraction": {},
+            "valid_s": 0.0,
+            "anomalies": [],
+        }
+    return wheel_dynamics(
+        wheel_inputs(frame.df), frame.timebase.dt_s, _wheel_channels()
+    ).as_dict()
+
+
+@functools.cache
+def _wheel_channels() -> "ChannelMatrix":
+    from wheels import ChannelMatrix, default_channels, wheel_radius_m
+
+    return ChannelMatrix(default_channels(), wheel_radius_m)
+
+
+# --- Stop Visits ---
+@algorithm("StopVisitsPerMinute", "1.1.0", EveryMinutePerTripPerBus, memoise=False)
+def stop_visits_per_minute(params: ExecutionParams) -> StructResult:
+    """
+    Segment the window into stop visits, emit a `StopVisit` window for each
+    visit that ends inside it and report dwell/boardings per stop.
+    Visits still ongoing at the end of the window are left to the next one,
+    and a visit the window starts in is read back to where it began
+    """
+    return StructResult(_stop_visits(_read_trip_frame(params), params))
+
+
+STOP_LOOKBACK_WINDOWS = 10
+
+
+def _stop_visits(frame: "WindowFrame", params: ExecutionParams) -> dict[str, Any]:
+    from segmentation import segment_stop_visits
+
+    if frame.df.empty:
+        return {"visits": 0, "stops": {}}
+
+    window = params.window
+    frame, offset = _with_open_visit(
+        frame, int(window.metadata["trip_id"]), window.time_from, window.time_to
+    )
+    visits = segment_stop_visits(frame.df, frame.timebase.dt_s)
+    # visits that end in this window, the bus having stood with the doors open
+    completed = visits.select(
+        (visits.end > offset) & (visits.end < len(frame.df)) & (visits.dwell_s > 0)
+    )
+    _emit_stop_visits(frame, completed, params)
+    return {"visits": len(completed), "stops": completed.per_stop()}
+
+
+@algorithm("TripEndStopVisit", "1.0.0", TripEnd, memoise=False)
+def trip_end_stop_visit(params: ExecutionParams) -> StructResult:
+    """
+    The stop visit still open at the end of the trip, which no later sample
+    closes, as a `StopVisit` window and per stop as `StopVisitsPerMinute`
+    reports it
+    """
+    from timebase import build_window_frame
+
+    trip_id = params.window.metadata.get("trip_id")
+    if trip_id is None:
+        raise Exception("Require trip_id as metadata to the window")
+    # the trip's last minute, on the grid of the per-minute windows
+    time_to = params.window.time_to
+    time_from = time_to.replace(second=0, microsecond=0)
+    if time_from == time_to:
+        time_from -= dt.timedelta(minutes=1)
+    rows = _load_trip_window(int(trip_id), time_from, time_to)
+    frame = build_window_frame(rows, time_to)
+    return StructResult(_trip_end_stop_visit(frame, time_from, time_to, params))
+
+
+def _trip_end_stop_visit(
+    frame: "WindowFrame",
+    time_from: dt.datetime,
+    time_to: dt.datetime,
+    params: ExecutionParams,
+) -> dict[str, Any]:
+    from segmentation import segment_stop_visits
+
+    if frame.df.empty:
+        return {"visits": 0, "stops": {}}
+
+    trip_id = int(params.window.metadata["trip_id"])
+    frame, _ = _with_open_visit(frame, trip_id, time_from, time_to)
+    visits = segment_stop_visits(frame.df, frame.timebase.dt_s)
+    # the per-minute windows report every visit that ends before the last sample
+    last = visits.select((visits.end == len(frame.df)) & (visits.dwell_s > 0))
+    _emit_stop_visits(frame, last, params)
+    return {"visits": len(last), "stops": last.per_stop()}
+
+
+def _emit_stop_visits(
+    frame: "WindowFrame", visits: "StopVisits", params: ExecutionParams
+) -> None:
+    import pandas as pd
+
+    times = pd.to_datetime(frame.df["time"])
+    with window_emitter.batch():
+        for ii in range(len(visits)):
+            window_emitter.emit(
+                Window(
+                    time_from=times[visits.start[ii]].to_pydatetime(),
+                    time_to=times[visits.end[ii] - 1].to_pydatetime(),
+                    name=StopVisit.name,
+                    version=StopVisit.version,
+                    origin="stop_visit_emitter",
+                    metadata={
+                        "trip_id": params.window.metadata.get("trip_id"),
+                        "bus_id": params.window.metadata.get("bus_id"),
+                        "route_id": params.window.metadata.get("route_id"),
+                        "stop_name": str(visits.stop_names[visits.stop_code[ii]]),
+                    },
+                )
+            )
+
+
+def _with_open_visit(
+    frame: "WindowFrame", trip_id: int, time_from: dt.datetime, time_to: dt.datetime
+) -> tuple["WindowFrame", int]:
+    """
+    When the window [time_from, time_to] starts at a stop, the frame with the
+    windows before it prepended back to where the bus arrived (at most
+    `STOP_LOOKBACK_WINDOWS` of them), and the number of rows prepended.
+    Earlier windows of the trip are usually still in the window cache
+    """
+    import pandas as pd
+    from segmentation import at_stop
+    from timebase import WindowFrame, compute_timebase
+
+    df = frame.df
+    if not at_stop(df.iloc[:1])[0]:
+        return frame, 0
+
+    stop_name = df["itcs_stop_name"].iloc[0]
+    length = time_to - time_from
+    earlier: List["pd.DataFrame"] = []
+    end = time_from
+    for _ in range(STOP_LOOKBACK_WINDOWS):
+        start = end - length
+        rows = telemetry_cache.get_or_load(
+            (trip_id, start, end),
+            functools.partial(_load_trip_window, trip_id, start, end),
+        )
+        before = pd.DataFrame(rows)
+        if before.empty:
+            break
+        # BETWEEN is inclusive: the boundary row is the later window's
+        before = before[pd.to_datetime(before["time"]) < end]
+        before = before.sort_values("time", kind="stable")
+        earlier.insert(0, before)
+        if not (
+            at_stop(before).all() and (before["itcs_stop_name"] == stop_name).all()
+        ):
+            break
+        end = start
+
+    if not earlier:
+        return frame, 0
+    offset = sum(len(before) for before in earlier)
+    combined = pd.concat([*earlier, df], ignore_index=True)
+    timebase = compute_timebase(combined["time"], time_to)
+    return WindowFrame(df=combined, timebase=timebase), offset
+
+
+# --- Geofences ---
+@algorithm("GeofencePerMinute", "1.0.0", EveryMinutePerTripPerBus)
+def geofence_per_minute(params: ExecutionParams) -> StructResult:
+    """
+    Time, energy and distance in each zone and road segment of
+    GEO_ZONES_PATH the bus was in, with the time spent outside all of them
+    """
+    return StructResult(_geofences(_read_trip_frame(params), _geo_index()))
+
+
+def _geofences(frame: "WindowFrame", index: Optional["GeoIndex"]) -> dict[str, Any]:
+    import numpy as np
+    from geo import geofence_totals
+
+    df = frame.df
+    if index is None or df.empty:
+        return {"geofences": {}, "outside_s": frame.timebase.duration_s}
+
+    def column(name: str) -> np.ndarray:
+        return df[name].to_numpy(dtype=float, na_value=np.nan)
+
+    return geofence_totals(
+        index,
+        column("gnss_latitude"),
+        column("gnss_longitude"),
+        frame.timebase.dt_s,
+        np.nan_to_num(column("electric_power_demand")),
+        np.nan_to_num(column("odometry_vehicle_speed")),
+    )
+
+
+@functools.cache
+def _geo_index() -> Optional["GeoIndex"]:
+    path = os.environ.get("GEO_ZONES_PATH")
+    if not path:
+        return None
+    from geo import GeoIndex
+
+    index = GeoIndex.from_geojson(
+        path, cell_m=float(os.environ.get("GEO_GRID_CELL_M", "100"))
+    )
+    LOGGER.info(
+        f"Indexed {len(index.fences)} geofences from {path} "
+        f"on a {index.nx}x{index.ny} grid"
+    )
+    return index
+
+
+# --- Fleet KPIs ---
+@algorithm("FleetKpisPerMinute", "1.0.0", EveryMinute)
+def fleet_kpis_per_minute(params: ExecutionParams) -> StructResult:
+    """
+    Energy, distance, passengers and halt brake time of every bus active in
+    the minute, and of the fleet as a whole, from a single read
+    """
+    with read_pool.connection() as conn:
+        rows = ReadFleetTelemetry(
+            ReadFleetTelemetryParams(
                 time_from=params.window.time_from,
                 time_to=params.window.time_to,
-                trip_id=None,
             ),
             conn,
         )
-    df = pd.DataFrame(telem)
-    if df.empty or "odometry_vehicle_speed" not in df.columns:
-        return StructResult({"mean_accel": None, "std_accel": None, "jerk_95p": None})
-
-    # Approximate acceleration (m/s^2) from 1s sampling
-    df["accel"] = df["odometry_vehicle_speed"].diff().fillna(0)
-    # Jerk (rate of change of acceleration)
-    df["jerk"] = df["accel"].diff().fillna(0)
-
-    return StructResult(
-        {
-            "mean_accel": df["accel"].mean(),
-            "std_accel": df["accel"].std(),
-            "jerk_95p": df["jerk"].quantile(0.95),
+    note_rows(len(rows))
+    return StructResult(_fleet_kpis(rows, params.window.time_to))
+
+
+def _fleet_kpis(
+    rows: List[ReadFleetTelemetryRow], time_to: Optional[dt.datetime]
+) -> dict[str, Any]:
+    """
+    Sums per bus with one sort and a bincount per column, so the cost per row
+    does not grow with the fleet. Samples are weighted by `timebase` steps
+    taken within each trip; `braking_fraction` is the share of bus time with
+    the halt brake active, i.e. the mean fraction of the fleet braking
+    """
+    import numpy as np
+    import pandas as pd
+    from timebase import grouped_dt_s
+
+    if not rows:
+        return {
+            "active_buses": 0,
+            "kwh": 0.0,
+            "km": 0.0,
+            "kwh_per_km": None,
+            "passengers": None,
+            "mean_passengers": None,
+            "braking_fraction": None,
+            "buses": {},
         }
+
+    # columns straight from the rows: a DataFrame would cost more than the KPIs
+    def column(name: str, dtype: Any = float) -> np.ndarray:
+        return np.array([row[name] for row in rows], dtype=dtype)  # type: ignore[literal-required]
+
+    bus = column("bus_id", np.int64)
+    trip = column("trip_id", np.int64)
+    times = pd.to_datetime([row["time"] for row in rows])
+    t_ns = times.to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    order = np.lexsort((t_ns, trip, bus))
+    bus, trip, t_ns = bus[order], trip[order], t_ns[order]
+
+    # a bus may change trips within the minute: steps are taken per trip
+    new_trip = np.empty(len(bus), dtype=bool)
+    new_trip[0] = True
+    new_trip[1:] = (bus[1:] != bus[:-1]) | (trip[1:] != trip[:-1])
+    last = np.roll(new_trip, -1)
+    dt_s = grouped_dt_s(t_ns, last, time_to)
+
+    new_bus = np.empty(len(bus), dtype=bool)
+    new_bus[0] = True
+    new_bus[1:] = bus[1:] != bus[:-1]
+    group = np.cumsum(new_bus) - 1
+    buses = int(group[-1]) + 1
+
+    def per_bus(weights: np.ndarray) -> np.ndarray:
+        return np.bincount(group, weights=weights, minlength=buses)
+
+    passengers = column("itcs_number_of_passengers")[order]
+    counted = ~np.isnan(passengers)
+    time_s = per_bus(dt_s)
+    kwh = per_bus(np.nan_to_num(column("electric_power_demand")[order]) * dt_s) / 3600.0
+    km = per_bus(np.nan_to_num(column("odometry_vehicle_speed")[order]) * dt_s) / 1000.0
+    passenger_s = per_bus(np.where(counted, passengers, 0.0) * dt_s)
+    counted_s = per_bus(counted * dt_s)
+    braking_s = per_bus(
+        np.nan_to_num(column("status_halt_brake_is_active")[order]) * dt_s
     )
+    samples = np.bincount(group, minlength=buses)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_passengers = np.where(counted_s > 0, passenger_s / counted_s, np.nan)
+        braking_fraction = np.where(time_s > 0, braking_s / time_s, np.nan)
+
+    def floats(values: np.ndarray) -> List[Optional[float]]:
+        return [None if np.isnan(value) else value for value in values.tolist()]
+
+    bus_ids = bus[new_bus].tolist()
+    last_trips = trip[np.roll(new_bus, -1)].tolist()
+    per_bus_passengers = floats(mean_passengers)
+    per_bus_braking = floats(braking_fraction)
+    total_kwh, total_km, total_s = float(kwh.sum()), float(km.sum()), time_s.sum()
+    carrying = mean_passengers[~np.isnan(mean_passengers)]
+    return {
+        "active_buses": buses,
+        "kwh": total_kwh,
+        "km": total_km,
+        "kwh_per_km": total_kwh / total_km if total_km > 0 else None,
+        "passengers": float(carrying.sum()) if len(carrying) else None,
+        "mean_passengers": float(carrying.mean()) if len(carrying) else None,
+        "braking_fraction": float(braking_s.sum() / total_s) if total_s > 0 else None,
+        "buses": {
+            str(bus_ids[ii]): {
+                "trip_id": last_trips[ii],
+                "samples": int(samples[ii]),
+                "time_s": float(time_s[ii]),
+                "kwh": float(kwh[ii]),
+                "km": float(km[ii]),
+                "mean_passengers": per_bus_passengers[ii],
+                "braking_fraction": per_bus_braking[ii],
+            }
+            for ii in range(buses)
+        },
+    }
+
+
+# --- Trip level ---
+def _read_trip(params: ExecutionParams) -> ReadTripsFromTripIdRow:
+    trip_id = params.window.metadata.get("trip_id")
+    if trip_id is None:
+        raise Exception("Require trip_id as metadata to the window")
+    with read_pool.connection() as conn:
+        return ReadTripsFromTripId(
+            ReadTripsFromTripIdParams(trip_id=int(trip_id)), conn
+        )
 
 
-# --- Asset Stress ---
-@proc.algorithm("AssetStressPerMinute", "1.0.0", EveryMinutePerTripPerBus)
-def asset_stress_per_minute(params: ExecutionParams) -> StructResult:
-    with db_pool.connection() as conn:
-        telem = ReadTelemetryForTripAndTime(
-            ReadTelemParams(
+@algorithm("TripEnergyEfficiency", "1.0.0", TripEnd)
+def trip_energy_efficiency(params: ExecutionParams) -> StructResult:
+    return StructResult(_trip_energy_efficiency(_read_trip(params)))
+
+
+def _trip_energy_efficiency(trip: ReadTripsFromTripIdRow) -> dict[str, Any]:
+    kwh = trip["energy_consumption_kwh"]
+    km = trip["driven_distance_km"]
+    passenger_km = (
+        km * trip["itcs_passengers_mean"]
+        if km is not None and trip["itcs_passengers_mean"] is not None
+        else None
+    )
+    return {
+        "kwh": kwh,
+        "km": km,
+        "kwh_per_km": kwh / km if kwh is not None and km else None,
+        "kwh_per_passenger_km": kwh / passenger_km
+        if kwh is not None and passenger_km
+        else None,
+    }
+
+
+@algorithm("TripServiceSummary", "1.0.0", TripEnd)
+def trip_service_summary(params: ExecutionParams) -> StructResult:
+    return StructResult(_trip_service_summary(_read_trip(params)))
+
+
+def _trip_service_summary(trip: ReadTripsFromTripIdRow) -> dict[str, Any]:
+    duration_h = (trip["end_time"] - trip["start_time"]).total_seconds() / 3600
+    km = trip["driven_distance_km"]
+    return {
+        "duration_min": duration_h * 60,
+        "mean_speed_kmh": km / duration_h
+        if km is not None and duration_h > 0
+        else None,
+        "passengers_mean": trip["itcs_passengers_mean"],
+        "passengers_min": trip["itcs_passengers_min"],
+        "passengers_max": trip["itcs_passengers_max"],
+        "grid_available_fraction": trip["grid_available_mean"],
+        "ambient_temperature_mean": trip["amb_temperature_mean"],
+        "ambient_temperature_min": trip["amb_temperature_min"],
+        "ambient_temperature_max": trip["amb_temperature_max"],
+    }
+
+
+@algorithm("TripTelemetrySummary", "1.0.0", TripEnd)
+def trip_telemetry_summary(params: ExecutionParams) -> StructResult:
+    """
+    Trip KPIs the trips table lacks, from the downsampled telemetry.
+    Pyramid buckets are per trip, so any level summarises the trip exactly
+    """
+    trip_id = params.window.metadata.get("trip_id")
+    if trip_id is None:
+        raise Exception("Require trip_id as metadata to the window")
+    with read_pool.connection() as conn:
+        summary = ReadTelemetrySummary(
+            pyramid.ReadTelemetrySummaryParams(
+                trip_id=int(trip_id),
                 time_from=params.window.time_from,
-                time_to=params.window.time_to,
-                trip_id=None,
+                # include the trip's last sample
+                time_to=params.window.time_to + dt.timedelta(seconds=1),
+                precision_s=pyramid.LEVELS[-1].stride_s,
             ),
             conn,
         )
+    return StructResult(_trip_telemetry_summary(summary))
 
-    df = pd.DataFrame(telem)
-    if df.empty:
-        return StructResult({"articulation_var": None, "brake_pressure_mean": None})
 
-    return StructResult(
-        {
-            "articulation_var": df["odometry_articulation_angle"].var(),
-            "brake_pressure_mean": df["traction_brake_pressure"].mean(),
-        }
-    )
+def _trip_telemetry_summary(summary: pyramid.TelemetrySummary) -> dict[str, Any]:
+    channels = summary["channels"]
+    return {
+        "samples": summary["rows"],
+        "resolution_s": summary["resolution_s"],
+        "max_speed_ms": channels["odometry_vehicle_speed"]["max"],
+        "door_open_fraction": channels["status_door_is_open"]["mean"],
+        "halt_brake_fraction": channels["status_halt_brake_is_active"]["mean"],
+        "brake_pressure_mean": channels["traction_brake_pressure"]["mean"],
+        "brake_pressure_max": channels["traction_brake_pressure"]["max"],
+        "traction_force_max": channels["traction_traction_force"]["max"],
+        "power_demand_max_kw": channels["electric_power_demand"]["max"],
+        "articulation_angle_max": channels["odometry_articulation_angle"]["max"],
+    }
 
 
 if __name__ == "__main__":
+    mark("imported")
     proc.Register()
+    mark("registered")
+    warm_imports(*HEAVY_IMPORTS)
     proc.Start()
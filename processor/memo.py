@@ -0,0 +1,293 @@
+import os
+import json
+import math
+import sqlite3
+import hashlib
+import logging
+import functools
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Protocol, Set, TypeVar
+
+from orca_python import ExecutionParams, StructResult, ValueResult
+from db import PostgresPool, db_pool
+from profiling import read_no_rows, reset_rows
+
+LOGGER = logging.getLogger(__name__)
+
+Result = StructResult | ValueResult
+F = TypeVar("F", bound=Callable[..., Result])
+
+
+def json_default(value: Any) -> Any:
+    # numpy/pandas scalars expose .item(), everything else is stringified
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def _finite(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+    if hasattr(value, "item") and getattr(value, "ndim", None) == 0:
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def json_dumps(value: Any, **kwargs: Any) -> str:
+    """JSON that a JSONB column accepts: NaN and infinities become null"""
+    return json.dumps(_finite(value), default=json_default, allow_nan=False, **kwargs)
+
+
+def _window_key(params: ExecutionParams) -> str:
+    """Stable key for a window: type, version, time range and metadata"""
+    window = params.window
+    raw = json.dumps(
+        [
+            window.name,
+            window.version,
+            window.time_from.isoformat(),
+            window.time_to.isoformat(),
+            window.metadata,
+        ],
+        sort_keys=True,
+        default=json_default,
+    )
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _dump_result(result: Result) -> str:
+    kind = "struct" if isinstance(result, StructResult) else "value"
+    return json_dumps({"kind": kind, "value": result.value})
+
+
+def _load_result(raw: str) -> Result:
+    payload = json.loads(raw)
+    if payload["kind"] == "struct":
+        return StructResult(payload["value"])
+    return ValueResult(payload["value"])
+
+
+class ResultBackend(Protocol):
+    def get(self, algorithm: str, version: str, key: str) -> Optional[str]: ...
+
+    def put(self, algorithm: str, version: str, key: str, result: str) -> None: ...
+
+    def purge(self, algorithm: str, keep_version: str) -> None: ...
+
+
+class SqliteResultBackend:
+    def __init__(self, path: str) -> None:
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS result_memo (
+                    algorithm TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    PRIMARY KEY (algorithm, version, key)
+                )
+                """
+            )
+            self._conn.commit()
+
+    def get(self, algorithm: str, version: str, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result FROM result_memo WHERE algorithm = ? AND version = ? AND key = ?",
+                (algorithm, version, key),
+            ).fetchone()
+        return None if row is None else str(row[0])
+
+    def put(self, algorithm: str, version: str, key: str, result: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO result_memo (algorithm, version, key, result) VALUES (?, ?, ?, ?)",
+                (algorithm, version, key, result),
+            )
+            self._conn.commit()
+
+    def purge(self, algorithm: str, keep_version: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM result_memo WHERE algorithm = ? AND version <> ?",
+                (algorithm, keep_version),
+            )
+            self._conn.commit()
+
+
+class PostgresResultBackend:
+    def __init__(self, pool: PostgresPool) -> None:
+        self._pool = pool
+        self._created = False
+
+    def _ensure_table(self) -> None:
+        if self._created:
+            return
+        with self._pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS result_memo (
+                        algorithm TEXT NOT NULL,
+                        version TEXT NOT NULL,
+                        key TEXT NOT NULL,
+                        result JSONB NOT NULL,
+                        PRIMARY KEY (algorithm, version, key)
+                    );
+                    """
+                )
+                conn.commit()
+        self._created = True
+
+    def get(self, algorithm: str, version: str, key: str) -> Optional[str]:
+        self._ensure_table()
+        with self._pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT result::text FROM result_memo
+                    WHERE algorithm = %(algorithm)s AND version = %(version)s AND key = %(key)s
+                    """,
+                    {"algorithm": algorithm, "version": version, "key": key},
+                )
+                row = cur.fetchone()
+            conn.commit()
+        return None if row is None else str(row[0])
+
+    def put(self, algorithm: str, version: str, key: str, result: str) -> None:
+        self._ensure_table()
+        with self._pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO result_memo (algorithm, version, key, result)
+                    VALUES (%(algorithm)s, %(version)s, %(key)s, %(result)s)
+                    ON CONFLICT (algorithm, version, key) DO UPDATE SET result = EXCLUDED.result
+                    """,
+                    {
+                        "algorithm": algorithm,
+                        "version": version,
+                        "key": key,
+                        "result": result,
+                    },
+                )
+            conn.commit()
+
+    def purge(self, algorithm: str, keep_version: str) -> None:
+        self._ensure_table()
+        with self._pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "DELETE FROM result_memo WHERE algorithm = %(algorithm)s AND version <> %(version)s",
+                    {"algorithm": algorithm, "version": keep_version},
+                )
+            conn.commit()
+
+
+class ResultStore:
+    """
+    Memoises algorithm results by (algorithm, version, window).
+
+    Results are held in a bounded in-memory LRU, optionally backed by a
+    persistent table so that redelivered windows survive restarts. The
+    algorithm version is part of every key, and entries written by other
+    versions of an algorithm are purged the first time it is looked up.
+    """
+
+    def __init__(
+        self, max_entries: int = 10_000, backend: Optional[ResultBackend] = None
+    ) -> None:
+        self.max_entries = max_entries
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self._entries: OrderedDict[tuple[str, str, str], str] = OrderedDict()
+        self._purged: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def get(self, algorithm: str, version: str, key: str) -> Optional[Result]:
+        with self._lock:
+            raw = self._entries.get((algorithm, version, key))
+            if raw is not None:
+                self._entries.move_to_end((algorithm, version, key))
+        if raw is None and self.backend is not None:
+            if algorithm not in self._purged:
+                self.backend.purge(algorithm, version)
+                self._purged.add(algorithm)
+            raw = self.backend.get(algorithm, version, key)
+            if raw is not None:
+                self._remember(algorithm, version, key, raw)
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return _load_result(raw)
+
+    def put(self, algorithm: str, version: str, key: str, result: Result) -> None:
+        raw = _dump_result(result)
+        self._remember(algorithm, version, key, raw)
+        if self.backend is not None:
+            self.backend.put(algorithm, version, key, raw)
+
+    def _remember(self, algorithm: str, version: str, key: str, raw: str) -> None:
+        with self._lock:
+            self._entries[(algorithm, version, key)] = raw
+            self._entries.move_to_end((algorithm, version, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def memoise(self, algorithm: str, version: str) -> Callable[[F], F]:
+        """
+        Return the stored result for a repeated window instead of recomputing.
+        A window that read no telemetry is not stored, as its rows may still
+        arrive
+        """
+
+        def inner(fn: F) -> F:
+            @functools.wraps(fn)
+            def wrapper(params: ExecutionParams) -> Result:
+                key = _window_key(params)
+                cached = self.get(algorithm, version, key)
+                if cached is not None:
+                    LOGGER.debug(f"Memoised result for {algorithm}_{version}")
+                    return cached
+                reset_rows()
+                result = fn(params)
+                if read_no_rows():
+                    self.skipped += 1
+                    return result
+                try:
+                    self.put(algorithm, version, key, result)
+                except Exception as e:
+                    LOGGER.warning(f"Failed to memoise {algorithm}_{version}: {e}")
+                return result
+
+            return wrapper  # type: ignore[return-value]
+
+        return inner
+
+
+def _backend_from_env() -> Optional[ResultBackend]:
+    kind = os.environ.get("RESULT_STORE", "memory")
+    if kind == "memory":
+        return None
+    if kind == "sqlite":
+        return SqliteResultBackend(os.environ.get("RESULT_STORE_PATH", "results.db"))
+    if kind == "postgres":
+        return PostgresResultBackend(db_pool)
+    raise ValueError(f"RESULT_STORE must be one of memory, sqlite, postgres: {kind}")
+
+
+result_store = ResultStore(
+    max_entries=int(os.environ.get("RESULT_STORE_SIZE", "10000")),
+    backend=_backend_from_env(),
+)
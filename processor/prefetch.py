@@ -0,0 +1,86 @@
+import logging
+import datetime as dt
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict
+
+from cache import Rows, TelemetryCache, WindowKey
+
+LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class PrefetchStats:
+    scheduled: int = 0
+    completed: int = 0
+    cancelled: int = 0
+    failed: int = 0
+
+
+class Prefetcher:
+    """
+    Loads the next window of an active trip into the telemetry cache.
+
+    Simulator windows advance one window length at a time, so after serving
+    [time_from, time_to) for a trip the next window is predictable. Loads
+    run on a background executor and check out their own pooled connection
+    through `loader`. Prefetches for trips that have ended are cancelled
+    and their cached windows dropped; a trip missing from one minute's
+    active buses is left alone, as its windows may still be queued when the
+    processor lags or backfills, and otherwise ages out of the cache.
+    """
+
+    def __init__(
+        self,
+        cache: TelemetryCache[Rows],
+        loader: Callable[[int, dt.datetime, dt.datetime], Rows],
+        max_workers: int = 1,
+        enabled: bool = True,
+    ) -> None:
+        self.cache = cache
+        self.loader = loader
+        self.enabled = enabled
+        self.stats = PrefetchStats()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="prefetch"
+        )
+        self._pending: Dict[WindowKey, Future[None]] = {}
+        self._lock = threading.Lock()
+
+    def schedule(
+        self, trip_id: int, time_from: dt.datetime, time_to: dt.datetime
+    ) -> None:
+        """Prefetch the window following [time_from, time_to] for a trip"""
+        if not self.enabled:
+            return
+        key = (trip_id, time_to, time_to + (time_to - time_from))
+        with self._lock:
+            if key in self._pending or key in self.cache:
+                return
+            self.stats.scheduled += 1
+            future = self._executor.submit(self._run, key)
+            self._pending[key] = future
+        future.add_done_callback(lambda _: self._done(key))
+
+    def cancel(self, trip_id: int) -> None:
+        """Stop prefetching for a trip that has ended"""
+        with self._lock:
+            keys = [key for key in self._pending if key[0] == trip_id]
+            for key in keys:
+                if self._pending[key].cancel():
+                    self.stats.cancelled += 1
+        self.cache.evict_trip(trip_id)
+
+    def _run(self, key: WindowKey) -> None:
+        trip_id, time_from, time_to = key
+        try:
+            self.cache.prefetch(key, lambda: self.loader(trip_id, time_from, time_to))
+            self.stats.completed += 1
+        except Exception as e:
+            self.stats.failed += 1
+            LOGGER.warning(f"Prefetch of trip {trip_id} at {time_from} failed: {e}")
+
+    def _done(self, key: WindowKey) -> None:
+        with self._lock:
+            self._pending.pop(key, None)
@@ -0,0 +1,310 @@
+import os
+import sys
+import json
+import time
+import random
+import pstats
+import cProfile
+import logging
+import functools
+import threading
+import datetime as dt
+from collections import Counter
+from dataclasses import dataclass, field
+from types import FrameType
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from orca_python import ExecutionParams
+
+LOGGER = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+_local = threading.local()
+
+
+def note_rows(rows: int) -> None:
+    """Record how many telemetry rows the current invocation read"""
+    _local.rows = getattr(_local, "rows", 0) + rows
+    _local.read = True
+
+
+def reset_rows() -> None:
+    _local.rows = 0
+    _local.read = False
+
+
+def read_no_rows() -> bool:
+    """Whether the current invocation read telemetry and found none"""
+    return getattr(_local, "read", False) and getattr(_local, "rows", 0) == 0
+
+
+@dataclass
+class ProfilerStats:
+    invocations: int = 0
+    slow: int = 0
+    captured: int = 0
+    cprofiled: int = 0
+    files_deleted: int = 0
+
+
+@dataclass
+class _Recording:
+    stacks: Counter[str] = field(default_factory=Counter)
+    samples: int = 0
+
+
+def _collapse(frame: Optional[FrameType]) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SlowWindowProfiler:
+    """
+    Profiles algorithm invocations and keeps the profiles of slow ones.
+
+    A background thread samples the stacks of the threads running an
+    algorithm every `sample_interval_ms`. A fraction `cprofile_rate` of
+    invocations additionally runs under cProfile, one at a time. From
+    Python 3.12 cProfile observes every thread of the interpreter, so a
+    cProfiled invocation waits for the running ones to finish and holds
+    back new ones until it is done; its pstats then only show its own work
+    (and the sampler's and the gRPC server's threads). When an
+    invocation takes longer than `threshold_ms` its collapsed stacks
+    (for flamegraph.pl / speedscope), its pstats if it was cProfiled, and a
+    JSON description of the window are written to `directory`. The oldest
+    captures are deleted once the directory exceeds `max_disk_bytes`.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        threshold_ms: float,
+        sample_interval_ms: float = 5.0,
+        cprofile_rate: float = 0.0,
+        max_disk_bytes: int = 100 * 1024 * 1024,
+    ) -> None:
+        self.directory = directory
+        self.threshold_ms = threshold_ms
+        self.sample_interval = sample_interval_ms / 1000.0
+        self.cprofile_rate = cprofile_rate
+        self.max_disk_bytes = max_disk_bytes
+        self.stats = ProfilerStats()
+
+        self._recordings: Dict[int, _Recording] = {}
+        self._lock = threading.Lock()
+        self._active = threading.Condition(self._lock)
+        self._sampler: Optional[threading.Thread] = None
+        # cProfile hooks the interpreter's profiling machinery, so only one
+        # invocation is profiled with it at a time
+        self._cprofile_lock = threading.Lock()
+        # from 3.12 it profiles all threads, so other invocations are kept out
+        self._exclusive = sys.version_info >= (3, 12)
+        self._running = 0
+        self._cprofiling = False
+        self._gate = threading.Condition(threading.Lock())
+        self._disk_lock = threading.Lock()
+
+    def profiled(self, algorithm: str, version: str) -> Callable[[F], F]:
+        """Profile every invocation of the algorithm"""
+
+        def inner(fn: F) -> F:
+            @functools.wraps(fn)
+            def wrapper(params: ExecutionParams) -> Any:
+                # invocations nested in another only profile as part of it
+                if getattr(_local, "invocation", False):
+                    return fn(params)
+
+                profile = None
+                if (
+                    self.cprofile_rate > 0
+                    and random.random() < self.cprofile_rate
+                    and self._cprofile_lock.acquire(blocking=False)
+                ):
+                    profile = cProfile.Profile()
+                self._enter(profile is not None)
+
+                thread_id = threading.get_ident()
+                recording = _Recording()
+                _local.rows = 0
+                _local.invocation = True
+                with self._lock:
+                    self._recordings[thread_id] = recording
+                    self._ensure_sampler()
+                    self._active.notify()
+
+                start = time.perf_counter()
+                try:
+                    if profile is None:
+                        return fn(params)
+                    return profile.runcall(fn, params)
+                finally:
+                    elapsed_ms = (time.perf_counter() - start) * 1000
+                    _local.invocation = False
+                    self._leave(profile is not None)
+                    if profile is not None:
+                        self._cprofile_lock.release()
+                    with self._lock:
+                        self._recordings.pop(thread_id, None)
+                        self.stats.invocations += 1
+                        if profile is not None:
+                            self.stats.cprofiled += 1
+                    if elapsed_ms > self.threshold_ms:
+                        self._capture(
+                            algorithm,
+                            version,
+                            params,
+                            elapsed_ms,
+                            getattr(_local, "rows", 0),
+                            recording,
+                            profile,
+                        )
+
+            return wrapper  # type: ignore[return-value]
+
+        return inner
+
+    def _enter(self, cprofiled: bool) -> None:
+        if not self._exclusive:
+            return
+        with self._gate:
+            if cprofiled:
+                self._cprofiling = True
+                while self._running:
+                    self._gate.wait()
+            else:
+                while self._cprofiling:
+                    self._gate.wait()
+                self._running += 1
+
+    def _leave(self, cprofiled: bool) -> None:
+        if not self._exclusive:
+            return
+        with self._gate:
+            if cprofiled:
+                self._cprofiling = False
+            else:
+                self._running -= 1
+            self._gate.notify_all()
+
+    def _capture(
+        self,
+        algorithm: str,
+        version: str,
+        params: ExecutionParams,
+        elapsed_ms: float,
+        rows: int,
+        recording: _Recording,
+        profile: Optional[cProfile.Profile],
+    ) -> None:
+        with self._lock:
+            self.stats.slow += 1
+        window = params.window
+        trip_id = window.metadata.get("trip_id")
+        tag = "_".join(
+            [
+                dt.datetime.now().strftime("%Y%m%dT%H%M%S%f"),
+                algorithm,
+                version,
+                window.name,
+                "fleet" if trip_id is None else str(int(trip_id)),
+                window.time_from.strftime("%Y%m%dT%H%M%S"),
+            ]
+        )
+        base = os.path.join(self.directory, tag)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(f"{base}.folded", "w") as f:
+                for stack, count in recording.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            if profile is not None:
+                pstats.Stats(profile).dump_stats(f"{base}.pstats")
+            with open(f"{base}.json", "w") as f:
+                json.dump(
+                    {
+                        "algorithm": algorithm,
+                        "version": version,
+                        "window": window.name,
+                        "window_version": window.version,
+                        "time_from": window.time_from.isoformat(),
+                        "time_to": window.time_to.isoformat(),
+                        "metadata": dict(window.metadata),
+                        "rows": rows,
+                        "elapsed_ms": elapsed_ms,
+                        "samples": recording.samples,
+                        "sample_interval_ms": self.sample_interval * 1000,
+                    },
+                    f,
+                    default=str,
+                    indent=2,
+                )
+        except OSError as e:
+            LOGGER.error(f"Failed to write profile {tag}: {e}")
+            return
+
+        with self._lock:
+            self.stats.captured += 1
+        LOGGER.warning(
+            f"Slow window: {algorithm} took {elapsed_ms:.0f}ms on {rows} rows, "
+            f"profile written to {base}.*"
+        )
+        self._enforce_quota()
+
+    def _enforce_quota(self) -> None:
+        with self._disk_lock:
+            try:
+                files = [
+                    entry for entry in os.scandir(self.directory) if entry.is_file()
+                ]
+            except OSError:
+                return
+            files.sort(key=lambda entry: entry.stat().st_mtime)
+            total = sum(entry.stat().st_size for entry in files)
+            for entry in files:
+                if total <= self.max_disk_bytes:
+                    break
+                try:
+                    size = entry.stat().st_size
+                    os.remove(entry.path)
+                except OSError:
+                    continue
+                total -= size
+                self.stats.files_deleted += 1
+
+    def _ensure_sampler(self) -> None:
+        # caller holds self._lock
+        if self._sampler is None:
+            self._sampler = threading.Thread(
+                target=self._run_sampler, name="profile-sampler", daemon=True
+            )
+            self._sampler.start()
+
+    def _run_sampler(self) -> None:
+        while True:
+            with self._lock:
+                while not self._recordings:
+                    self._active.wait()
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, recording in self._recordings.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        recording.stacks[_collapse(frame)] += 1
+                        recording.samples += 1
+            del frames
+            time.sleep(self.sample_interval)
+
+
+profiler: Optional[SlowWindowProfiler] = None
+if float(os.environ.get("PROFILE_SLOW_WINDOWS_MS", "0")) > 0:
+    profiler = SlowWindowProfiler(
+        directory=os.environ.get("PROFILE_DIR", "profiles"),
+        threshold_ms=float(os.environ["PROFILE_SLOW_WINDOWS_MS"]),
+        sample_interval_ms=float(os.environ.get("PROFILE_SAMPLE_INTERVAL_MS", "5")),
+        cprofile_rate=float(os.environ.get("PROFILE_CPROFILE_RATE", "0")),
+        max_disk_bytes=int(os.environ.get("PROFILE_MAX_DISK_MB", "100")) * 1024 * 1024,
+    )
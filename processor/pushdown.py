@@ -0,0 +1,205 @@
+import logging
+import datetime as dt
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence
+
+from orca_python import ExecutionParams
+from cache import TelemetryCache
+from db import PostgresPool
+from fleet import is_virtual_fleet
+
+LOGGER = logging.getLogger(__name__)
+
+# fleet wide entries in the result cache use this in place of a trip id
+FLEET = -1
+
+# trip_id -> column -> value
+TripRows = Dict[int, Dict[str, Any]]
+
+
+def sum_(expr: str) -> str:
+    return f"sum({expr})"
+
+
+def avg(expr: str) -> str:
+    return f"avg({expr})"
+
+
+def var_samp(expr: str) -> str:
+    return f"var_samp({expr})"
+
+
+def percentile_cont(fraction: float, column: str) -> str:
+    return f"percentile_cont({fraction}) WITHIN GROUP (ORDER BY {column})"
+
+
+def time_weighted(expr: str) -> str:
+    """
+    Integral of `expr` over the window, weighting each sample by the time
+    it stands for (see `timebase.Timebase`)
+    """
+    return f"sum(({expr}) * dt_s)"
+
+
+@dataclass(frozen=True)
+class PushdownMetric:
+    name: str
+    # output key -> SQL aggregate over the window's samples
+    reductions: Dict[str, str]
+    # reduced values -> the algorithm's result
+    finish: Callable[[Dict[str, Any]], Dict[str, Any]]
+
+
+@dataclass
+class PushdownStats:
+    queries: int = 0
+    trips_returned: int = 0
+    results: int = 0
+    fallbacks: int = 0
+    failures: int = 0
+
+
+class SqlPushdown:
+    """
+    Computes reduction-only metrics inside Postgres.
+
+    Metrics declare their reductions once at import. The first algorithm
+    to ask for a window runs every declared reduction for every trip in one
+    `SELECT ... GROUP BY trip_id`; the per-trip rows are kept so the other
+    algorithms and trips of that window read them without another query.
+    A metric falls back to its Python path (`result` returns None) when
+    pushdown is disabled, fails, or has no row for the trip.
+    """
+
+    def __init__(
+        self,
+        pool: PostgresPool,
+        columns: Sequence[str],
+        enabled: bool = False,
+        cache_size: int = 16,
+    ) -> None:
+        self.pool = pool
+        self.columns = [c for c in columns if c not in ("trip_id", "time")]
+        self.enabled = enabled
+        self.stats = PushdownStats()
+        self.metrics: Dict[str, PushdownMetric] = {}
+        self._cache: TelemetryCache[TripRows] = TelemetryCache(max_entries=cache_size)
+        self._query: Optional[str] = None
+
+    def register(
+        self,
+        name: str,
+        reductions: Dict[str, str],
+        finish: Callable[[Dict[str, Any]], Dict[str, Any]],
+    ) -> None:
+        if self._query is not None:
+            raise RuntimeError("Pushdown metrics must be registered before use")
+        self.metrics[name] = PushdownMetric(name, reductions, finish)
+
+    def result(self, name: str, params: ExecutionParams) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        trip_id = params.window.metadata.get("trip_id")
+        if trip_id is None:
+            raise Exception("Require trip_id as metadata to the window")
+        time_from = params.window.time_from
+        time_to = params.window.time_to
+
+        try:
+            rows = self._cache.get_or_load(
+                (FLEET, time_from, time_to), lambda: self._reduce(time_from, time_to)
+            )
+        except Exception as e:
+            self.stats.failures += 1
+            LOGGER.warning(f"Pushdown of {time_from} - {time_to} failed: {e}")
+            return None
+
+        row = rows.get(int(trip_id))
+        if row is None:
+            self.stats.fallbacks += 1
+            return None
+        self.stats.results += 1
+        metric = self.metrics[name]
+        return metric.finish({key: row[f"{name}__{key}"] for key in metric.reductions})
+
+    def query(self) -> str:
+        if self._query is None:
+            self._query = compile_query(self.metrics.values(), self.columns)
+        return self._query
+
+    def _reduce(self, time_from: dt.datetime, time_to: dt.datetime) -> TripRows:
+        from psycopg2.extras import RealDictCursor
+
+        with self.pool.connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(self.query(), {"time_from": time_from, "time_to": time_to})
+                rows = {int(row["trip_id"]): dict(row) for row in cur}
+        self.stats.queries += 1
+        self.stats.trips_returned += len(rows)
+        return rows
+
+
+def _samples_query(columns: Sequence[str]) -> str:
+    """Every trip's samples in the window, rewritten for the virtual fleet"""
+    selected = ", ".join(f"t.{column}" for column in columns)
+    if is_virtual_fleet():
+        return f"""
+            SELECT
+                t.trip_id + v.id_offset AS trip_id,
+                t.time + v.time_offset AS time,
+                {selected}
+            FROM virtual_fleet v
+            JOIN telemetry t
+                ON t.time BETWEEN %(time_from)s - v.time_offset
+                AND %(time_to)s - v.time_offset
+        """
+    return f"""
+        SELECT t.trip_id, t.time, {selected}
+        FROM telemetry t
+        WHERE t.time BETWEEN %(time_from)s AND %(time_to)s
+    """
+
+
+def compile_query(metrics: Iterable[PushdownMetric], columns: Sequence[str]) -> str:
+    """
+    One query computing every metric's reductions per trip.
+    `dt_s` follows `timebase.compute_timebase`: the step to the next sample,
+    the nominal step across gaps, and the time left in the window (at most
+    the nominal step) for the last sample
+    """
+    from timebase import MAX_GAP_S, NOMINAL_DT_S
+
+    reductions = ",\n            ".join(
+        f'{expr} AS "{metric.name}__{key}"'
+        for metric in metrics
+        for key, expr in metric.reductions.items()
+    )
+    return f"""
+        WITH samples AS ({_samples_query(columns)}),
+        stepped AS (
+            SELECT
+                *,
+                EXTRACT(EPOCH FROM lead(time) OVER (
+                    PARTITION BY trip_id ORDER BY time, id
+                ) - time)::DOUBLE PRECISION AS step_s
+            FROM samples
+        ),
+        weighted AS (
+            SELECT
+                *,
+                CASE
+                    WHEN step_s IS NULL THEN LEAST(GREATEST(
+                        EXTRACT(EPOCH FROM %(time_to)s - time)::DOUBLE PRECISION,
+                        0.0
+                    ), {NOMINAL_DT_S})
+                    WHEN step_s > {MAX_GAP_S} THEN {NOMINAL_DT_S}
+                    ELSE step_s
+                END AS dt_s
+            FROM stepped
+        )
+        SELECT
+            trip_id,
+            {reductions}
+        FROM weighted
+        GROUP BY trip_id
+    """
@@ -0,0 +1,382 @@
+import datetime as dt
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, TypedDict
+
+from psycopg2.extensions import connection as PGConnection
+from fleet import VIRTUAL_FLEET_OFFSET_S, is_virtual_fleet, split_virtual_id
+
+# Downsampled copies of `telemetry` at 10 s, 1 min and 15 min.
+#
+# Each level holds, per trip and bucket, the row count and min/max/mean/count
+# of every channel. The 10 s level is aggregated from `telemetry` and each
+# coarser level from the one below it, so a 15 min bucket is built from 15
+# rows rather than 900. The simulator extends the pyramid as its `sim_logs`
+# clock advances; `telemetry_pyramid` records which buckets of each level are
+# complete, and reads fall back to a finer level (or `telemetry`) outside it.
+
+# buckets are aligned to the same origin as date_bin below
+ORIGIN = dt.datetime(2000, 1, 1)
+
+# channel -> expression over `telemetry`. Flags are summarised as 0/1, so
+# their mean is the fraction of time they were set
+CHANNELS: Dict[str, str] = {
+    "electric_power_demand": "electric_power_demand",
+    "temperature_ambient": "temperature_ambient",
+    "traction_brake_pressure": "traction_brake_pressure",
+    "traction_traction_force": "traction_traction_force",
+    "gnss_altitude": "gnss_altitude",
+    "itcs_number_of_passengers": "itcs_number_of_passengers",
+    "odometry_articulation_angle": "odometry_articulation_angle",
+    "odometry_steering_angle": "odometry_steering_angle",
+    "odometry_vehicle_speed": "odometry_vehicle_speed",
+    "odometry_wheel_speed_fl": "odometry_wheel_speed_fl",
+    "odometry_wheel_speed_fr": "odometry_wheel_speed_fr",
+    "odometry_wheel_speed_ml": "odometry_wheel_speed_ml",
+    "odometry_wheel_speed_mr": "odometry_wheel_speed_mr",
+    "odometry_wheel_speed_rl": "odometry_wheel_speed_rl",
+    "odometry_wheel_speed_rr": "odometry_wheel_speed_rr",
+    "status_door_is_open": "status_door_is_open::int",
+    "status_grid_is_available": "status_grid_is_available::int",
+    "status_halt_brake_is_active": "status_halt_brake_is_active::int",
+    "status_park_brake_is_active": "status_park_brake_is_active::int",
+}
+
+STATS = ("min", "max", "mean", "count")
+
+
+@dataclass(frozen=True)
+class PyramidLevel:
+    table: str
+    stride_s: int
+
+    @property
+    def stride(self) -> dt.timedelta:
+        return dt.timedelta(seconds=self.stride_s)
+
+
+# finest first
+LEVELS = (
+    PyramidLevel("telemetry_10s", 10),
+    PyramidLevel("telemetry_1m", 60),
+    PyramidLevel("telemetry_15m", 900),
+)
+
+
+class ChannelSummary(TypedDict):
+    min: Optional[float]
+    max: Optional[float]
+    mean: Optional[float]
+    count: int
+
+
+class TelemetrySummary(TypedDict):
+    resolution_s: int  # 0 when read from `telemetry`
+    rows: int
+    channels: Dict[str, ChannelSummary]
+
+
+class ReadTelemetrySummaryParams(TypedDict):
+    trip_id: int
+    time_from: dt.datetime
+    time_to: dt.datetime
+    # how far the summarised range may extend past the window, in seconds
+    precision_s: int
+
+
+class ReadTelemetryBucketsParams(TypedDict):
+    trip_id: int
+    time_from: dt.datetime
+    time_to: dt.datetime
+    # the coarsest bucket size wanted, in seconds
+    resolution_s: int
+
+
+def floor_bucket(time: dt.datetime, stride: dt.timedelta) -> dt.datetime:
+    return time - (time - ORIGIN) % stride
+
+
+def ceil_bucket(time: dt.datetime, stride: dt.timedelta) -> dt.datetime:
+    floored = floor_bucket(time, stride)
+    return floored if floored == time else floored + stride
+
+
+def _columns() -> List[str]:
+    return [f"{ch}_{stat}" for ch in CHANNELS for stat in STATS]
+
+
+def _bin(stride_s: int, column: str) -> str:
+    return f"date_bin('{stride_s} seconds', {column}, TIMESTAMP '{ORIGIN}')"
+
+
+def _raw_aggregates() -> List[str]:
+    """min/max/mean/count of every channel over `telemetry` rows"""
+    return [
+        f"min(({expr})::DOUBLE PRECISION) AS {ch}_min, "
+        f"max(({expr})::DOUBLE PRECISION) AS {ch}_max, "
+        f"avg(({expr})::DOUBLE PRECISION) AS {ch}_mean, "
+        f"count({expr}) AS {ch}_count"
+        for ch, expr in CHANNELS.items()
+    ]
+
+
+def _merged_aggregates() -> List[str]:
+    """min/max/mean/count of every channel over pyramid buckets"""
+    return [
+        f"min({ch}_min) AS {ch}_min, "
+        f"max({ch}_max) AS {ch}_max, "
+        f"sum({ch}_mean * {ch}_count) / NULLIF(sum({ch}_count), 0) AS {ch}_mean, "
+        f"coalesce(sum({ch}_count), 0) AS {ch}_count"
+        for ch in CHANNELS
+    ]
+
+
+def CreatePyramidTables(conn: PGConnection) -> None:
+    columns = ",\n".join(
+        f"{column} {'BIGINT' if column.endswith('_count') else 'DOUBLE PRECISION'}"
+        for column in _columns()
+    )
+    query = """
+        CREATE TABLE IF NOT EXISTS telemetry_pyramid (
+            level TEXT PRIMARY KEY,
+            built_from TIMESTAMP NOT NULL,
+            built_until TIMESTAMP NOT NULL
+        );
+    """
+    for level in LEVELS:
+        query += f"""
+            CREATE TABLE IF NOT EXISTS {level.table} (
+                trip_id BIGINT NOT NULL,
+                bucket TIMESTAMP NOT NULL,
+                count BIGINT NOT NULL,
+                {columns},
+                PRIMARY KEY (trip_id, bucket)
+            );
+            CREATE INDEX IF NOT EXISTS {level.table}_bucket_idx
+                ON {level.table} (bucket);
+        """
+
+    with conn.cursor() as cur:
+        cur.execute(query)
+        conn.commit()
+
+
+def _build_query(level: PyramidLevel, source: Optional[PyramidLevel]) -> str:
+    """Upsert the buckets of `level` in [lo, hi) from the level below"""
+    if source is None:
+        table, time_column, count = "telemetry", "time", "count(*)"
+        aggregates = _raw_aggregates()
+    else:
+        table, time_column, count = source.table, "bucket", "sum(count)"
+        aggregates = _merged_aggregates()
+    columns = _columns()
+    return f"""
+        INSERT INTO {level.table} (trip_id, bucket, count, {", ".join(columns)})
+        SELECT
+            trip_id,
+            {_bin(level.stride_s, time_column)},
+            {count},
+            {", ".join(aggregates)}
+        FROM {table}
+        WHERE {time_column} >= %(lo)s AND {time_column} < %(hi)s
+        GROUP BY 1, 2
+        ON CONFLICT (trip_id, bucket) DO UPDATE SET
+            count = EXCLUDED.count,
+            {", ".join(f"{column} = EXCLUDED.{column}" for column in columns)};
+
+        INSERT INTO telemetry_pyramid (level, built_from, built_until)
+        VALUES ('{level.table}', %(built_from)s, %(built_until)s)
+        ON CONFLICT (level) DO UPDATE SET
+            built_from = LEAST(telemetry_pyramid.built_from, EXCLUDED.built_from),
+            built_until = GREATEST(telemetry_pyramid.built_until, EXCLUDED.built_until);
+    """
+
+
+def UpdatePyramid(
+    conn: PGConnection, time_from: dt.datetime, time_to: dt.datetime
+) -> None:
+    """
+    Rebuild every bucket overlapping [time_from, time_to) at each level.
+    Buckets are recomputed whole, so repeating a range is harmless and a
+    bucket the range only partly covers is completed by the next update
+    """
+    with conn.cursor() as cur:
+        source = None
+        for level in LEVELS:
+            cur.execute(
+                _build_query(level, source),
+                {
+                    "lo": floor_bucket(time_from, level.stride),
+                    "hi": ceil_bucket(time_to, level.stride),
+                    # a bucket is complete once everything below it is
+                    "built_from": ceil_bucket(time_from, level.stride),
+                    "built_until": floor_bucket(time_to, level.stride),
+                },
+            )
+            source = level
+        conn.commit()
+
+
+def ReadPyramidProgress(
+    conn: PGConnection,
+) -> Dict[str, tuple[dt.datetime, dt.datetime]]:
+    with conn.cursor() as cur:
+        cur.execute("SELECT level, built_from, built_until FROM telemetry_pyramid")
+        return {
+            level: (built_from, built_until) for level, built_from, built_until in cur
+        }
+
+
+def choose_level(
+    time_from: dt.datetime,
+    time_to: dt.datetime,
+    max_stride_s: int,
+    progress: Dict[str, tuple[dt.datetime, dt.datetime]],
+    exact_edges: bool = True,
+) -> Optional[PyramidLevel]:
+    """
+    The coarsest level whose buckets are no wider than `max_stride_s` (or,
+    when `exact_edges`, line up with the window exactly) and are built for
+    the whole window. None when only `telemetry` can answer
+    """
+    for level in reversed(LEVELS):
+        aligned = (
+            floor_bucket(time_from, level.stride) == time_from
+            and floor_bucket(time_to, level.stride) == time_to
+        )
+        if level.stride_s > max_stride_s and not (exact_edges and aligned):
+            continue
+        built = progress.get(level.table)
+        if built is None:
+            continue
+        built_from, built_until = built
+        if built_from <= floor_bucket(
+            time_from, level.stride
+        ) and built_until >= ceil_bucket(time_to, level.stride):
+            return level
+    return None
+
+
+def _real_params(
+    trip_id: int, time_from: dt.datetime, time_to: dt.datetime
+) -> Dict[str, Any]:
+    # replica r of a trip sees the real telemetry shifted forward in time
+    offset = dt.timedelta(0)
+    if is_virtual_fleet():
+        replica, trip_id = split_virtual_id(trip_id)
+        offset = dt.timedelta(seconds=replica * VIRTUAL_FLEET_OFFSET_S)
+    return {
+        "trip_id": int(trip_id),
+        "time_from": time_from - offset,
+        "time_to": time_to - offset,
+        "offset": offset,
+    }
+
+
+def ReadTelemetrySummary(
+    params: ReadTelemetrySummaryParams, conn: PGConnection
+) -> TelemetrySummary:
+    """
+    Min/max/mean/count per channel over a trip's window, from the coarsest
+    pyramid level whose buckets overrun the window by at most `precision_s`
+    """
+    query_params = _real_params(
+        params["trip_id"], params["time_from"], params["time_to"]
+    )
+    level = choose_level(
+        query_params["time_from"],
+        query_params["time_to"],
+        params["precision_s"],
+        ReadPyramidProgress(conn),
+    )
+
+    if level is None:
+        query = f"""
+            SELECT count(*), {", ".join(_raw_aggregates())}
+            FROM telemetry
+            WHERE trip_id = %(trip_id)s
+                AND time >= %(time_from)s AND time < %(time_to)s
+        """
+    else:
+        query = f"""
+            SELECT coalesce(sum(count), 0), {", ".join(_merged_aggregates())}
+            FROM {level.table}
+            WHERE trip_id = %(trip_id)s
+                AND bucket >= %(lo)s AND bucket < %(hi)s
+        """
+        query_params.update(
+            lo=floor_bucket(query_params["time_from"], level.stride),
+            hi=ceil_bucket(query_params["time_to"], level.stride),
+        )
+
+    with conn.cursor() as cur:
+        cur.execute(query, query_params)
+        row = cur.fetchone()
+
+    values = list(row)[1:]
+    channels: Dict[str, ChannelSummary] = {}
+    for ii, ch in enumerate(CHANNELS):
+        lo, hi, mean, count = values[ii * 4 : ii * 4 + 4]
+        channels[ch] = ChannelSummary(min=lo, max=hi, mean=mean, count=int(count))
+    return TelemetrySummary(
+        resolution_s=0 if level is None else level.stride_s,
+        rows=int(row[0]),
+        channels=channels,
+    )
+
+
+def ReadTelemetryBuckets(
+    params: ReadTelemetryBucketsParams, conn: PGConnection
+) -> List[Dict[str, Any]]:
+    """
+    A trip's telemetry as buckets of `trip_id`, `bucket`, `count` and
+    `<channel>_<stat>` columns, from the coarsest level no coarser than
+    `resolution_s`. Bucketed from `telemetry` when no level fits
+    """
+    from psycopg2.extras import RealDictCursor
+
+    query_params = _real_params(
+        params["trip_id"], params["time_from"], params["time_to"]
+    )
+    level = choose_level(
+        query_params["time_from"],
+        query_params["time_to"],
+        params["resolution_s"],
+        ReadPyramidProgress(conn),
+        exact_edges=False,
+    )
+    columns = ", ".join(_columns())
+
+    if level is None:
+        stride_s = max(int(params["resolution_s"]), 1)
+        query = f"""
+            SELECT
+                trip_id,
+                {_bin(stride_s, "time")} + %(offset)s AS bucket,
+                count(*) AS count,
+                {", ".join(_raw_aggregates())}
+            FROM telemetry
+            WHERE trip_id = %(trip_id)s
+                AND time >= %(time_from)s AND time < %(time_to)s
+            GROUP BY trip_id, 2
+            ORDER BY 2
+        """
+    else:
+        query = f"""
+            SELECT trip_id, bucket + %(offset)s AS bucket, count, {columns}
+            FROM {level.table}
+            WHERE trip_id = %(trip_id)s
+                AND bucket >= %(lo)s AND bucket < %(hi)s
+            ORDER BY bucket
+        """
+        query_params.update(
+            lo=floor_bucket(query_params["time_from"], level.stride),
+            hi=ceil_bucket(query_params["time_to"], level.stride),
+        )
+
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(query, query_params)
+        rows = [dict(row) for row in cur]
+    # report the ids the caller asked for
+    for row in rows:
+        row["trip_id"] = params["trip_id"]
+    return rows
@@ -0,0 +1,118 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+STATIONARY_SPEED = 0.1  # m/s
+NO_STOP = "-"
+
+
+def run_lengths(codes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Start and (exclusive) end index of each run of equal values"""
+    if len(codes) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    boundaries = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+    starts = np.concatenate(([0], boundaries))
+    ends = np.concatenate((boundaries, [len(codes)]))
+    return starts, ends
+
+
+@dataclass
+class StopVisits:
+    """One entry per contiguous run of rows stationary at the same stop"""
+
+    stop_names: np.ndarray  # distinct stop names, indexed by stop_code
+    stop_code: np.ndarray
+    start: np.ndarray  # row index of the first row of the visit
+    end: np.ndarray  # row index one past the last row of the visit
+    dwell_s: np.ndarray  # seconds stationary with the doors open
+    boardings: np.ndarray  # change in passenger count over the visit
+
+    def __len__(self) -> int:
+        return len(self.stop_code)
+
+    def select(self, mask: np.ndarray) -> "StopVisits":
+        return StopVisits(
+            stop_names=self.stop_names,
+            stop_code=self.stop_code[mask],
+            start=self.start[mask],
+            end=self.end[mask],
+            dwell_s=self.dwell_s[mask],
+            boardings=self.boardings[mask],
+        )
+
+    def per_stop(self) -> Dict[str, Dict[str, Any]]:
+        """Dwell and boardings aggregated per stop name"""
+        n_stops = len(self.stop_names)
+        visits = np.bincount(self.stop_code, minlength=n_stops)
+        dwell = np.bincount(self.stop_code, weights=self.dwell_s, minlength=n_stops)
+        boardings = np.bincount(
+            self.stop_code, weights=self.boardings, minlength=n_stops
+        )
+        return {
+            str(self.stop_names[code]): {
+                "visits": int(visits[code]),
+                "dwell_s": float(dwell[code]),
+                "boardings": float(boardings[code]),
+            }
+            for code in np.flatnonzero(visits)
+        }
+
+
+def at_stop(df: pd.DataFrame) -> np.ndarray:
+    """
+    Rows stationary with a stop name. The name stays set between stops, and
+    "-" is ZTBus' name for no stop
+    """
+    names = df["itcs_stop_name"]
+    named = (names.notna() & (names != NO_STOP)).to_numpy(dtype=bool)
+    stationary = df["odometry_vehicle_speed"].fillna(0).to_numpy() < STATIONARY_SPEED
+    return named & stationary
+
+
+def segment_stop_visits(df: pd.DataFrame, dt_s: np.ndarray) -> StopVisits:
+    """
+    Split a time-ordered frame of one trip into stop visits, weighting each
+    row by `dt_s` (see `timebase.Timebase`).
+
+    Stop names are dictionary-encoded once, visits are the runs of equal
+    codes among the rows `at_stop`, and per-visit dwell is read off a
+    cumulative sum of the door-open time, so the whole frame is handled in
+    one pass. Rows driving, or without a stop name, do not belong to any
+    visit.
+    """
+    codes, stop_names = pd.factorize(df["itcs_stop_name"], use_na_sentinel=True)
+    codes = np.where(at_stop(df), codes, -1)
+    starts, ends = run_lengths(codes)
+    keep = codes[starts] >= 0 if len(starts) else np.zeros(0, dtype=bool)
+    starts, ends = starts[keep], ends[keep]
+
+    if len(starts) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return StopVisits(
+            stop_names=np.asarray(stop_names),
+            stop_code=empty,
+            start=empty,
+            end=empty,
+            dwell_s=np.empty(0),
+            boardings=np.empty(0),
+        )
+
+    door_open = df["status_door_is_open"].fillna(False).to_numpy(dtype=bool)
+    passengers = df["itcs_number_of_passengers"].fillna(0).to_numpy(dtype=np.float64)
+
+    # visits are summed as differences of one cumulative sum, which skips
+    # rows between visits
+    cumulative = np.concatenate(([0.0], np.cumsum(door_open * dt_s)))
+    dwell_s = cumulative[ends] - cumulative[starts]
+
+    return StopVisits(
+        stop_names=np.asarray(stop_names),
+        stop_code=codes[starts],
+        start=starts,
+        end=ends,
+        dwell_s=dwell_s,
+        boardings=passengers[ends - 1] - passengers[starts],
+    )
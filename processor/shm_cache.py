@@ -0,0 +1,440 @@
+import os
+import json
+import math
+import time
+import fcntl
+import atexit
+import logging
+import tempfile
+import datetime as dt
+from contextlib import contextmanager
+from dataclasses import dataclass
+from multiprocessing import resource_tracker, shared_memory
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+    cast,
+)
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from columnar import Arrays
+
+LOGGER = logging.getLogger(__name__)
+
+# (trip_id, time_from, time_to)
+WindowKey = Tuple[int, dt.datetime, dt.datetime]
+# the rows a loader returns; a shared window decodes to rows of the same shape
+R = TypeVar("R", bound=List[Any])
+
+# Layout of the segment, all header fields are int64:
+#
+#   meta   MAGIC, LAYOUT_VERSION, slots, slot_bytes
+#   index  one row of INDEX_FIELDS per slot
+#   slots  `slots` payloads of `slot_bytes`, each page aligned
+#
+# A payload is the length of a JSON directory of arrays (name, dtype, shape,
+# offset), the directory, then the array data from the next aligned offset,
+# so readers map the columns straight out of the segment.
+MAGIC = 0x4F524341534D4331
+LAYOUT_VERSION = 1
+META_FIELDS = 4
+INDEX_FIELDS = 8
+STATE, OWNER, TRIP_ID, TIME_FROM, TIME_TO, LENGTH, LAST_USED, _ = range(INDEX_FIELDS)
+
+FREE = 0
+LOADING = 1
+READY = 2
+
+PAGE = 4096
+ALIGN = 64
+
+_EPOCH = dt.datetime(1970, 1, 1)
+
+
+@dataclass
+class SharedCacheStats:
+    hits: int = 0
+    misses: int = 0
+    waits: int = 0
+    stores: int = 0
+    too_large: int = 0
+    evictions: int = 0
+    stale_claims: int = 0
+
+
+def _us(time: dt.datetime) -> int:
+    if time.tzinfo is not None:
+        time = time.astimezone(dt.timezone.utc).replace(tzinfo=None)
+    return (time - _EPOCH) // dt.timedelta(microseconds=1)
+
+
+def _align(offset: int, alignment: int) -> int:
+    return -(-offset // alignment) * alignment
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def pack(arrays: "Arrays") -> Tuple[bytes, List[Tuple[int, Any]]]:
+    """
+    The directory of a payload and the (offset in the payload, array) pairs
+    that follow it
+    """
+    entries = []
+    chunks = []
+    offset = 0
+    for name, array in arrays.items():
+        offset = _align(offset, ALIGN)
+        entries.append((name, array.dtype.str, list(array.shape), offset))
+        chunks.append((offset, array))
+        offset += array.nbytes
+    directory = json.dumps(entries).encode()
+    base = _data_start(len(directory))
+    return directory, [(base + offset, array) for offset, array in chunks]
+
+
+def _data_start(directory_bytes: int) -> int:
+    return _align(8 + directory_bytes, ALIGN)
+
+
+class SharedTelemetryCache:
+    """
+    Node-local cache of telemetry windows shared by every processor process
+    on the host, in one named shared memory segment of fixed-size slots.
+
+    A window is stored column-wise (see `columnar`) and read in place: a
+    worker attaches to the columns of a window another worker fetched
+    instead of querying Postgres again. The index is guarded by an `flock`
+    on a lock file. Readers hold it shared while they use a window, so a
+    slot is only evicted (least recently used first) or rewritten while
+    nobody reads it. A worker fetching a window marks its slot as loading,
+    and other workers missing on that window wait for it rather than issuing
+    the same query.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        slots: int = 256,
+        slot_bytes: int = 512 * 1024,
+        wait_ms: int = 5000,
+        lock_dir: Optional[str] = None,
+    ) -> None:
+        import numpy as np
+
+        self.name = name
+        self.slots = slots
+        self.slot_bytes = _align(slot_bytes, PAGE)
+        self.wait = wait_ms / 1000.0
+        self.stats = SharedCacheStats()
+        if lock_dir is None:
+            lock_dir = (
+                "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+            )
+        self.lock_path = os.path.join(lock_dir, f"{name}.lock")
+
+        self._index_offset = META_FIELDS * 8
+        self._data_offset = _align(self._index_offset + slots * INDEX_FIELDS * 8, PAGE)
+        with self._locked(fcntl.LOCK_EX):
+            self._open()
+        self._check_layout()
+        self._index = np.ndarray(
+            (slots, INDEX_FIELDS),
+            dtype=np.int64,
+            buffer=self._buf,
+            offset=self._index_offset,
+        )
+        atexit.register(self.close)
+
+    def _open(self) -> None:
+        # caller holds the lock exclusively, so only one process creates it
+        size = self._data_offset + self.slots * self.slot_bytes
+        try:
+            shm = shared_memory.SharedMemory(self.name, create=True, size=size)
+            created = True
+        except FileExistsError:
+            shm = shared_memory.SharedMemory(self.name)
+            created = False
+        # the segment belongs to the node rather than the worker that created
+        # it, so it must not be unlinked when that worker exits
+        resource_tracker.unregister(shm._name, "shared_memory")  # type: ignore[attr-defined]
+        self._shm = shm
+        if created:
+            meta = self._buf[: self._index_offset].cast("q")
+            for field, value in enumerate(self._meta()):
+                meta[field] = value
+            meta.release()
+
+    @property
+    def _buf(self) -> memoryview:
+        buf = self._shm.buf
+        if buf is None:
+            raise ValueError(f"Shared memory segment {self.name} is closed")
+        return buf
+
+    def _meta(self) -> Tuple[int, ...]:
+        return (MAGIC, LAYOUT_VERSION, self.slots, self.slot_bytes)
+
+    def _check_layout(self) -> None:
+        meta = self._buf[: self._index_offset].cast("q")
+        found = tuple(meta)
+        meta.release()
+        if found != self._meta():
+            self._shm.close()
+            raise ValueError(
+                f"Shared memory segment {self.name} has layout {found}, "
+                f"expected {self._meta()}: unlink it or use another name"
+            )
+
+    @contextmanager
+    def _locked(self, operation: int) -> Iterator[None]:
+        # a descriptor per acquisition, so threads of one process exclude
+        # each other as well as other processes
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            fcntl.flock(fd, operation)
+            yield
+        finally:
+            os.close(fd)
+
+    def _find(self, key: WindowKey) -> Optional[int]:
+        index = self._index
+        matches = (
+            (index[:, STATE] != FREE)
+            & (index[:, TRIP_ID] == int(key[0]))
+            & (index[:, TIME_FROM] == _us(key[1]))
+            & (index[:, TIME_TO] == _us(key[2]))
+        ).nonzero()[0]
+        return int(matches[0]) if len(matches) else None
+
+    def _stale(self, slot: int) -> bool:
+        started = int(self._index[slot, LAST_USED])
+        if time.monotonic_ns() - started > self.wait * 1e9:
+            return True
+        return not _alive(int(self._index[slot, OWNER]))
+
+    @contextmanager
+    def attach(self, key: WindowKey) -> Iterator[Optional["Arrays"]]:
+        """
+        The window's columns as arrays mapped from shared memory, or None.
+        They are only valid inside the block, which keeps the slot from
+        being evicted while it is read
+        """
+        import numpy as np
+
+        with self._locked(fcntl.LOCK_SH):
+            slot = self._find(key)
+            if slot is None or self._index[slot, STATE] != READY:
+                yield None
+                return
+            # racing readers may both update this, either value will do
+            self._index[slot, LAST_USED] = time.monotonic_ns()
+            start = self._data_offset + slot * self.slot_bytes
+            payload = self._buf[start : start + int(self._index[slot, LENGTH])]
+            length = int.from_bytes(payload[:8], "little")
+            base = _data_start(length)
+            arrays = {}
+            for name, dtype, shape, offset in json.loads(
+                bytes(payload[8 : 8 + length])
+            ):
+                count = math.prod(shape)
+                if count == 0:
+                    arrays[name] = np.empty(shape, dtype=dtype)
+                    continue
+                arrays[name] = np.frombuffer(
+                    payload, dtype=dtype, count=count, offset=base + offset
+                ).reshape(shape)
+            yield arrays
+
+    def get(self, key: WindowKey) -> Optional[List[Dict[str, Any]]]:
+        from columnar import decode
+
+        with self.attach(key) as arrays:
+            if arrays is None:
+                return None
+            rows = decode(arrays)
+        self.stats.hits += 1
+        return rows
+
+    def get_frame(self, key: WindowKey) -> Optional["pd.DataFrame"]:
+        """
+        The window as a DataFrame built from the attached columns, without
+        decoding it into rows first
+        """
+        from columnar import to_frame
+
+        with self.attach(key) as arrays:
+            if arrays is None:
+                return None
+            df = to_frame(arrays)
+        self.stats.hits += 1
+        return df
+
+    def get_or_load(self, key: WindowKey, loader: Callable[[], R]) -> R:
+        """
+        The window from shared memory, or loaded and stored for the other
+        workers. Waits up to `wait_ms` for a window another worker is loading
+        """
+        deadline = time.monotonic() + self.wait
+        waited = False
+        while True:
+            cached = self.get(key)
+            if cached is not None:
+                return cast(R, cached)
+            with self._locked(fcntl.LOCK_EX):
+                slot = self._find(key)
+                state = None if slot is None else int(self._index[slot, STATE])
+                if state == READY:
+                    # stored between the read and the lock
+                    continue
+                loading = (
+                    slot is not None and state == LOADING and not self._stale(slot)
+                )
+                claimed = None if loading else self._claim(key, slot)
+            if loading and time.monotonic() < deadline:
+                if not waited:
+                    self.stats.waits += 1
+                    waited = True
+                time.sleep(0.002)
+                continue
+            break
+
+        self.stats.misses += 1
+        try:
+            rows = loader()
+        except BaseException:
+            if claimed is not None:
+                with self._locked(fcntl.LOCK_EX):
+                    if self._owns(claimed, key):
+                        self._index[claimed, STATE] = FREE
+            raise
+        if claimed is not None:
+            self._store(claimed, key, rows)
+        return rows
+
+    def _claim(self, key: WindowKey, stale: Optional[int]) -> Optional[int]:
+        """
+        Mark a slot as loading the window: the window's own slot when its
+        loader went away, else a free slot, else the least recently used one
+        """
+        import numpy as np
+
+        # caller holds the lock exclusively
+        states = self._index[:, STATE]
+        if stale is not None:
+            self.stats.stale_claims += 1
+            slot = stale
+        elif (states == FREE).any():
+            slot = int((states == FREE).argmax())
+        elif (states == READY).any():
+            last_used = np.where(
+                states == READY, self._index[:, LAST_USED], np.iinfo(np.int64).max
+            )
+            slot = int(last_used.argmin())
+            self.stats.evictions += 1
+        else:
+            # every slot is being loaded: fetch without caching
+            return None
+        self._index[slot] = (
+            LOADING,
+            os.getpid(),
+            int(key[0]),
+            _us(key[1]),
+            _us(key[2]),
+            0,
+            time.monotonic_ns(),
+            0,
+        )
+        return slot
+
+    def _owns(self, slot: int, key: WindowKey) -> bool:
+        entry = self._index[slot]
+        return bool(
+            entry[STATE] == LOADING
+            and entry[OWNER] == os.getpid()
+            and entry[TRIP_ID] == int(key[0])
+            and entry[TIME_FROM] == _us(key[1])
+            and entry[TIME_TO] == _us(key[2])
+        )
+
+    def _store(self, slot: int, key: WindowKey, rows: List[Any]) -> None:
+        import numpy as np
+        from columnar import encode
+
+        directory, arrays = pack(encode(rows))
+        end = max([8 + len(directory)] + [o + a.nbytes for o, a in arrays])
+        with self._locked(fcntl.LOCK_EX):
+            if not self._owns(slot, key):
+                # taken over as stale while loading
+                return
+            if end > self.slot_bytes:
+                self.stats.too_large += 1
+                self._index[slot, STATE] = FREE
+                return
+            start = self._data_offset + slot * self.slot_bytes
+            buf = self._buf
+            buf[start : start + 8] = len(directory).to_bytes(8, "little")
+            buf[start + 8 : start + 8 + len(directory)] = directory
+            slot_data = np.ndarray(
+                (self.slot_bytes,), dtype=np.uint8, buffer=buf, offset=start
+            )
+            for offset, array in arrays:
+                if array.nbytes:
+                    slot_data[offset : offset + array.nbytes] = (
+                        np.ascontiguousarray(array).reshape(-1).view(np.uint8)
+                    )
+            self._index[slot, LENGTH] = end
+            self._index[slot, LAST_USED] = time.monotonic_ns()
+            self._index[slot, STATE] = READY
+        self.stats.stores += 1
+
+    def evict_trip(self, trip_id: int) -> None:
+        """Drop every window stored for a trip"""
+        with self._locked(fcntl.LOCK_EX):
+            index = self._index
+            ended = (index[:, STATE] == READY) & (index[:, TRIP_ID] == int(trip_id))
+            index[ended, STATE] = FREE
+
+    def close(self) -> None:
+        if not hasattr(self, "_index"):
+            return
+        del self._index
+        try:
+            self._shm.close()
+        except BufferError:
+            # arrays from `attach` are still referenced; the mapping goes
+            # with the process
+            pass
+
+    def unlink(self) -> None:
+        """Remove the segment; processes still attached keep their mapping"""
+        shared_memory.SharedMemory(self.name).unlink()
+        try:
+            os.unlink(self.lock_path)
+        except FileNotFoundError:
+            pass
+
+
+shared_cache: Optional[SharedTelemetryCache] = None
+if os.environ.get("SHM_CACHE", "false").lower() == "true":
+    shared_cache = SharedTelemetryCache(
+        name=os.environ.get("SHM_CACHE_NAME", "orca-telemetry"),
+        slots=int(os.environ.get("SHM_CACHE_SLOTS", "256")),
+        slot_bytes=int(os.environ.get("SHM_CACHE_SLOT_KB", "512")) * 1024,
+        wait_ms=int(os.environ.get("SHM_CACHE_WAIT_MS", "5000")),
+    )
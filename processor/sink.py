@@ -0,0 +1,274 @@
+import io
+import os
+import csv
+import time
+import atexit
+import logging
+import functools
+import threading
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple, TypeVar
+
+import psycopg2
+from orca_python import ExecutionParams
+from db import PostgresPool, db_pool
+from psycopg2.extensions import connection as PGConnection
+from memo import Result, json_dumps
+
+LOGGER = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Result])
+
+ResultRow = Tuple[str, str, str, str, str, str, str, str]
+
+COLUMNS = (
+    "algorithm",
+    "version",
+    "window_name",
+    "window_version",
+    "time_from",
+    "time_to",
+    "metadata",
+    "result",
+)
+
+
+@dataclass
+class SinkStats:
+    rows_written: int = 0
+    rows_dropped: int = 0
+    batches_retried: int = 0
+    batches_split: int = 0
+    flushes: int = 0
+    flush_seconds_total: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        if self.flush_seconds_total == 0:
+            return 0.0
+        return self.rows_written / self.flush_seconds_total
+
+
+def CreateAlgorithmResultsTable(conn: PGConnection) -> None:
+    query = """
+        CREATE TABLE IF NOT EXISTS algorithm_results (
+            algorithm TEXT NOT NULL,
+            version TEXT NOT NULL,
+            window_name TEXT NOT NULL,
+            window_version TEXT NOT NULL,
+            time_from TIMESTAMP NOT NULL,
+            time_to TIMESTAMP NOT NULL,
+            metadata JSONB NOT NULL,
+            result JSONB NOT NULL
+        );
+    """
+
+    with conn.cursor() as cur:
+        cur.execute(query)
+        conn.commit()
+
+
+class ResultSink:
+    """
+    Buffers algorithm results and writes them to `algorithm_results` in
+    batches with `COPY ... FROM STDIN`.
+
+    A batch is written when it reaches `max_rows` (on the recording thread,
+    which bounds memory to one batch), when its oldest row is older than
+    `max_latency`, or on exit. A batch that loses its connection is tried
+    up to `max_retries` times, and a batch Postgres rejects is split in half
+    until the rows it rejects are isolated, dropped and counted.
+    """
+
+    def __init__(
+        self,
+        pool: PostgresPool,
+        max_rows: int = 5000,
+        max_latency_ms: int = 5000,
+        max_retries: int = 3,
+    ) -> None:
+        self.pool = pool
+        self.max_rows = max_rows
+        self.max_latency = max_latency_ms / 1000.0
+        self.max_retries = max_retries
+        self.stats = SinkStats()
+
+        self._buffer: List[ResultRow] = []
+        self._oldest: Optional[float] = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._flusher: Optional[threading.Thread] = None
+        self._table_created = False
+        self._closed = False
+        atexit.register(self.close)
+
+    def record(
+        self, algorithm: str, version: str, params: ExecutionParams, result: Result
+    ) -> None:
+        window = params.window
+        try:
+            row: ResultRow = (
+                algorithm,
+                version,
+                window.name,
+                window.version,
+                window.time_from.isoformat(),
+                window.time_to.isoformat(),
+                json_dumps(window.metadata, sort_keys=True),
+                json_dumps(result.value),
+            )
+        except (TypeError, ValueError) as e:
+            # a row the JSONB columns would reject would fail its whole batch
+            LOGGER.error(f"Dropping unserialisable {algorithm}_{version} result: {e}")
+            self.stats.rows_dropped += 1
+            return
+        with self._lock:
+            self._buffer.append(row)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            full = len(self._buffer) >= self.max_rows
+            if not full:
+                self._ensure_flusher()
+                self._wakeup.notify()
+        if full:
+            try:
+                self.flush()
+            except Exception as e:
+                LOGGER.error(f"Result flush failed: {e}")
+
+    def recording(self, algorithm: str, version: str) -> Callable[[F], F]:
+        """Record every result the algorithm computes"""
+
+        def inner(fn: F) -> F:
+            @functools.wraps(fn)
+            def wrapper(params: ExecutionParams) -> Result:
+                result = fn(params)
+                self.record(algorithm, version, params, result)
+                return result
+
+            return wrapper  # type: ignore[return-value]
+
+        return inner
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                rows, self._buffer = self._buffer, []
+                self._oldest = None
+            if not rows:
+                return
+
+            start = time.perf_counter()
+            written = self.stats.rows_written
+            try:
+                self._write(rows)
+            finally:
+                elapsed = time.perf_counter() - start
+                self.stats.flushes += 1
+                self.stats.flush_seconds_total += elapsed
+            LOGGER.info(
+                f"Wrote {self.stats.rows_written - written} of {len(rows)} results "
+                f"in {elapsed * 1000:.1f}ms "
+                f"({self.stats.rows_per_second:.0f} rows/s overall)"
+            )
+
+    def _write(self, rows: List[ResultRow]) -> None:
+        attempts = 0
+        while True:
+            try:
+                self._copy(rows)
+                self.stats.rows_written += len(rows)
+                return
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                # the connection was lost: the batch itself may be fine
+                attempts += 1
+                if attempts >= self.max_retries:
+                    self.stats.rows_dropped += len(rows)
+                    raise
+                self.stats.batches_retried += 1
+                LOGGER.warning(f"Retrying {len(rows)} results ({attempts}): {e}")
+                time.sleep(0.1 * 2**attempts)
+            except psycopg2.Error as e:
+                if len(rows) == 1:
+                    algorithm, version = rows[0][:2]
+                    LOGGER.error(f"Dropping {algorithm}_{version} result: {e}")
+                    self.stats.rows_dropped += 1
+                    return
+                self.stats.batches_split += 1
+                half = len(rows) // 2
+                try:
+                    self._write(rows[:half])
+                except Exception:
+                    self.stats.rows_dropped += len(rows) - half
+                    raise
+                self._write(rows[half:])
+                return
+
+    def _copy(self, rows: List[ResultRow]) -> None:
+        buf = io.StringIO()
+        csv.writer(buf).writerows(rows)
+        buf.seek(0)
+
+        with self.pool.connection() as conn:
+            try:
+                if not self._table_created:
+                    CreateAlgorithmResultsTable(conn)
+                    self._table_created = True
+                with conn.cursor() as cur:
+                    cur.copy_expert(
+                        f"COPY algorithm_results ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                        buf,
+                    )
+                conn.commit()
+            except Exception:
+                # the pooled connection is reused, so leave no aborted transaction
+                if not conn.closed:
+                    conn.rollback()
+                raise
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._wakeup.notify()
+        try:
+            self.flush()
+        except Exception as e:
+            LOGGER.error(f"Failed to flush results on close: {e}")
+
+    def _ensure_flusher(self) -> None:
+        # caller holds self._lock
+        if self._flusher is None:
+            self._flusher = threading.Thread(
+                target=self._run_flusher, name="result-sink", daemon=True
+            )
+            self._flusher.start()
+
+    def _run_flusher(self) -> None:
+        while True:
+            with self._lock:
+                while not self._closed and self._oldest is None:
+                    self._wakeup.wait()
+                if self._closed:
+                    return
+                assert self._oldest is not None
+                remaining = self._oldest + self.max_latency - time.monotonic()
+                if remaining > 0:
+                    self._wakeup.wait(remaining)
+                    continue
+            try:
+                self.flush()
+            except Exception as e:
+                LOGGER.error(f"Background result flush failed: {e}")
+
+
+result_sink: Optional[ResultSink] = None
+if os.environ.get("RESULT_SINK", "false").lower() == "true":
+    result_sink = ResultSink(
+        db_pool,
+        max_rows=int(os.environ.get("RESULT_SINK_BATCH_SIZE", "5000")),
+        max_latency_ms=int(os.environ.get("RESULT_SINK_MAX_LATENCY_MS", "5000")),
+        max_retries=int(os.environ.get("RESULT_SINK_MAX_RETRIES", "3")),
+    )
@@ -0,0 +1,63 @@
+import sys
+import time
+import logging
+import functools
+import importlib
+import threading
+from typing import Any, Callable, TypeVar
+
+# imported first by main.py so that everything after it counts towards startup
+STARTED = time.perf_counter()
+
+LOGGER = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+_first_window_seen = False
+_first_window_lock = threading.Lock()
+
+
+def elapsed_ms() -> float:
+    return (time.perf_counter() - STARTED) * 1000
+
+
+def mark(stage: str) -> None:
+    """Log how long after startup a stage was reached"""
+    LOGGER.info(f"Startup: {stage} after {elapsed_ms():.1f}ms")
+
+
+def warm_imports(*modules: str) -> threading.Thread:
+    """
+    Import modules on a background thread.
+    Keeps them off the registration path while still loading them before
+    the first window arrives in the common case
+    """
+
+    def run() -> None:
+        start = time.perf_counter()
+        for module in modules:
+            if module not in sys.modules:
+                importlib.import_module(module)
+        LOGGER.info(
+            f"Startup: warmed {', '.join(modules)} in {(time.perf_counter() - start) * 1000:.1f}ms"
+        )
+
+    thread = threading.Thread(target=run, name="warm-imports", daemon=True)
+    thread.start()
+    return thread
+
+
+def first_window(fn: F) -> F:
+    """Log the time to the first algorithm invocation"""
+
+    @functools.wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        global _first_window_seen
+        if not _first_window_seen:
+            with _first_window_lock:
+                if not _first_window_seen:
+                    _first_window_seen = True
+                    mark(f"first window ({fn.__name__})")
+        return fn(*args, **kwargs)
+
+    return wrapper  # type: ignore[return-value]
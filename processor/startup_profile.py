@@ -0,0 +1,94 @@
+"""
+Report where the processor's cold start goes.
+
+Runs `python -X importtime -c "import main"` in a fresh interpreter and breaks
+the import cost down by top level package. Time to first window is logged by
+the processor itself (`Startup: first window after ...`).
+
+    python startup_profile.py [--top 15] [--budget-ms 1500]
+
+Exits non-zero when the import of `main` exceeds the budget.
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+import subprocess
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+# the SDK validates these at import time; importing main never dials them
+DEFAULT_ENV = {
+    "ORCA_CORE": "localhost:50051",
+    "PROCESSOR_ADDRESS": "localhost:50052",
+    "ZTBUS_ADDR": "localhost",
+    "ZTBUS_DB": "ztbus",
+    "ZTBUS_USER": "ztbus",
+    "ZTBUS_PASS": "",
+    "ZTBUS_PORT": "5432",
+}
+
+
+def run_importtime(module: str = "main") -> Tuple[float, str]:
+    env = {**DEFAULT_ENV, **os.environ}
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=HERE,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{proc.stderr}")
+    return wall_ms, proc.stderr
+
+
+def top_level_costs(importtime: str) -> Dict[str, float]:
+    """Import time in ms per top level package, summed over its modules' self time"""
+    costs: Dict[str, float] = defaultdict(float)
+    for line in importtime.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match is None:
+            continue
+        self_us, _, _, name = match.groups()
+        costs[name.split(".")[0]] += int(self_us) / 1000
+    return costs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    wall_ms, importtime = run_importtime()
+    costs = top_level_costs(importtime)
+    total_ms = sum(costs.values())
+
+    rows: List[Tuple[str, float]] = sorted(
+        costs.items(), key=lambda kv: kv[1], reverse=True
+    )
+    print(f"{'package':<32}{'ms':>10}{'share':>8}")
+    for name, ms in rows[: args.top]:
+        print(f"{name:<32}{ms:>10.1f}{ms / total_ms:>8.1%}")
+    print(f"{'total imports':<32}{total_ms:>10.1f}")
+    print(f"{'interpreter wall time':<32}{wall_ms:>10.1f}")
+
+    for heavy in ("pandas", "numpy", "frozendict"):
+        if heavy in costs:
+            print(f"warning: {heavy} is imported eagerly by main")
+
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print(f"import of main took {total_ms:.1f}ms, budget {args.budget_ms:.1f}ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import threading
+import datetime as dt
+from dataclasses import dataclass, field
+from typing import Any, Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+NOMINAL_DT_S = 1.0
+MAX_GAP_S = 5.0
+
+
+@dataclass
+class Timebase:
+    """
+    Sample spacing of a time-ordered frame.
+
+    `dt_s[i]` is the time sample i stands for: the step to the next sample,
+    0 for a duplicate timestamp, and `NOMINAL_DT_S` when the step is a gap
+    (longer than `MAX_GAP_S`), so a gap is not integrated as if the last
+    value held throughout. The last sample stands for the time up to the end
+    of the window, capped at `NOMINAL_DT_S`.
+    """
+
+    t_s: np.ndarray  # seconds since the first sample
+    dt_s: np.ndarray
+    step_s: np.ndarray  # raw step from the previous sample, NaN for the first
+    gap: np.ndarray  # the step to the next sample is a gap
+    duplicate: np.ndarray  # same timestamp as the previous sample
+
+    @property
+    def duration_s(self) -> float:
+        return float(self.dt_s.sum())
+
+
+def compute_timebase(
+    times: pd.Series, time_to: Optional[dt.datetime] = None
+) -> Timebase:
+    t_ns = pd.to_datetime(times).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    n = len(t_ns)
+    if n == 0:
+        empty = np.empty(0)
+        return Timebase(
+            t_s=empty,
+            dt_s=empty,
+            step_s=empty,
+            gap=np.zeros(0, dtype=bool),
+            duplicate=np.zeros(0, dtype=bool),
+        )
+
+    t_s = (t_ns - t_ns[0]) / 1e9
+    forward = np.diff(t_s)
+    gap = np.zeros(n, dtype=bool)
+    gap[:-1] = forward > MAX_GAP_S
+
+    dt_s = np.empty(n)
+    dt_s[:-1] = np.where(gap[:-1], NOMINAL_DT_S, forward)
+    if time_to is None:
+        dt_s[-1] = NOMINAL_DT_S
+    else:
+        tail = (np.datetime64(time_to, "ns").astype(np.int64) - t_ns[-1]) / 1e9
+        dt_s[-1] = min(max(tail, 0.0), NOMINAL_DT_S)
+
+    step_s = np.concatenate(([np.nan], forward))
+    duplicate = np.concatenate(([False], forward == 0))
+    return Timebase(t_s=t_s, dt_s=dt_s, step_s=step_s, gap=gap, duplicate=duplicate)
+
+
+def grouped_dt_s(
+    t_ns: np.ndarray, last: np.ndarray, time_to: Optional[dt.datetime] = None
+) -> np.ndarray:
+    """
+    `Timebase.dt_s` of several series at once. `t_ns` holds the series one
+    after another, each sorted by time, and `last` marks the last sample of
+    each series
+    """
+    n = len(t_ns)
+    dt_s = np.empty(n)
+    if n == 0:
+        return dt_s
+    forward = np.diff(t_ns) / 1e9
+    dt_s[:-1] = np.where(forward > MAX_GAP_S, NOMINAL_DT_S, forward)
+    if time_to is None:
+        dt_s[last] = NOMINAL_DT_S
+    else:
+        tail = (np.datetime64(time_to, "ns").astype(np.int64) - t_ns[last]) / 1e9
+        dt_s[last] = np.clip(tail, 0.0, NOMINAL_DT_S)
+    return dt_s
+
+
+def derivative(values: np.ndarray, timebase: Timebase) -> np.ndarray:
+    """
+    Backward difference quotient per sample.
+    NaN for the first sample, duplicates and samples after a gap
+    """
+    step = timebase.step_s
+    prev_gap = np.concatenate(([False], timebase.gap[:-1]))
+    valid = (step > 0) & ~prev_gap
+    out = np.full(len(values), np.nan)
+    if len(values) > 1:
+        diff = np.concatenate(([np.nan], np.diff(values)))
+        np.divide(diff, step, out=out, where=valid)
+    return out
+
+
+@dataclass
+class WindowFrame:
+    """
+    Telemetry of one window sorted by time, with its timebase computed once
+    and shared by every metric. `df` is shared: metrics must not modify it
+    """
+
+    df: pd.DataFrame
+    timebase: Timebase
+    _grid: Optional[pd.DataFrame] = field(default=None, repr=False)
+    _grid_lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    def grid_1hz(self) -> pd.DataFrame:
+        """
+        The frame reindexed onto a 1 Hz grid, built on first use.
+        Duplicates keep their last sample, and values are carried forward
+        for at most `MAX_GAP_S` seconds so gaps stay empty
+        """
+        with self._grid_lock:
+            if self._grid is None:
+                self._grid = resample_1hz(self.df)
+            return self._grid
+
+
+def build_window_frame(
+    rows: Sequence[Mapping[str, Any]], time_to: Optional[dt.datetime] = None
+) -> WindowFrame:
+    return window_frame(pd.DataFrame(rows), time_to)
+
+
+def window_frame(
+    df: pd.DataFrame, time_to: Optional[dt.datetime] = None
+) -> WindowFrame:
+    """A frame of a window's telemetry, sorted in place"""
+    if not df.empty:
+        df.sort_values("time", inplace=True, kind="stable")
+        df.reset_index(drop=True, inplace=True)
+        timebase = compute_timebase(df["time"], time_to)
+    else:
+        timebase = compute_timebase(pd.Series([], dtype="datetime64[ns]"))
+    return WindowFrame(df=df, timebase=timebase)
+
+
+def resample_1hz(df: pd.DataFrame) -> pd.DataFrame:
+    if df.empty:
+        return df
+    indexed = df.set_index(pd.to_datetime(df["time"]))
+    indexed = indexed[~indexed.index.duplicated(keep="last")]
+    grid = pd.date_range(
+        indexed.index[0].floor("s"), indexed.index[-1].ceil("s"), freq="1s"
+    )
+    limit = int(MAX_GAP_S / NOMINAL_DT_S)
+    return indexed.reindex(indexed.index.union(grid)).ffill(limit=limit).reindex(grid)
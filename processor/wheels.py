@@ -0,0 +1,182 @@
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+WHEELS = ("fl", "fr", "ml", "mr", "rl", "rr")
+WHEEL_COLUMNS = tuple(f"odometry_wheel_speed_{wheel}" for wheel in WHEELS)
+SPEED_COLUMN = "odometry_vehicle_speed"
+
+# the wheel columns are angular speeds [rad/s] and the vehicle speed is linear
+# [m/s]; wheel speeds are scaled by the rolling radius before they are
+# compared. The default is a 275/70 R22.5 tyre; set WHEEL_RADIUS_M=1 for
+# data whose wheel columns are already linear speeds
+DEFAULT_WHEEL_RADIUS_M = 0.478
+
+# (left, right) wheel indices per axle
+AXLES: Dict[str, Tuple[int, int]] = {"front": (0, 1), "middle": (2, 3), "rear": (4, 5)}
+
+# ratios are only meaningful once the bus is moving
+MIN_SPEED_MS = 1.0
+SLIP_THRESHOLD = 0.15
+IMBALANCE_THRESHOLD = 0.10
+ODOMETRY_THRESHOLD = 0.10
+
+# inputs of the derived channels: the six wheel speeds and the vehicle speed
+N_INPUTS = len(WHEELS) + 1
+SPEED = len(WHEELS)
+
+
+@dataclass(frozen=True)
+class DerivedChannel:
+    """
+    A ratio of two linear combinations of the inputs
+    (the six linear wheel speeds followed by the vehicle speed, all in m/s)
+    """
+
+    name: str
+    numerator: Tuple[float, ...]
+    denominator: Tuple[float, ...]
+    threshold: float
+
+
+def _basis(**weights: float) -> Tuple[float, ...]:
+    coefficients = [0.0] * N_INPUTS
+    for name, weight in weights.items():
+        index = SPEED if name == "speed" else WHEELS.index(name)
+        coefficients[index] = weight
+    return tuple(coefficients)
+
+
+def default_channels() -> List[DerivedChannel]:
+    channels = [
+        # slip ratio: (wheel - vehicle) / vehicle
+        DerivedChannel(
+            f"slip_{wheel}",
+            _basis(**{wheel: 1.0, "speed": -1.0}),
+            _basis(speed=1.0),
+            SLIP_THRESHOLD,
+        )
+        for wheel in WHEELS
+    ]
+    channels += [
+        # left/right imbalance: (left - right) / mean(left, right)
+        DerivedChannel(
+            f"imbalance_{axle}",
+            _basis(**{WHEELS[left]: 1.0, WHEELS[right]: -1.0}),
+            _basis(**{WHEELS[left]: 0.5, WHEELS[right]: 0.5}),
+            IMBALANCE_THRESHOLD,
+        )
+        for axle, (left, right) in AXLES.items()
+    ]
+    # odometry consistency: mean wheel speed against the reported speed
+    channels.append(
+        DerivedChannel(
+            "odometry_deviation",
+            _basis(**{wheel: 1 / len(WHEELS) for wheel in WHEELS}, speed=-1.0),
+            _basis(speed=1.0),
+            ODOMETRY_THRESHOLD,
+        )
+    )
+    return channels
+
+
+class ChannelMatrix:
+    """
+    Evaluates a set of derived channels with two matrix products and one
+    division per window, so adding channels barely changes the cost.
+    The rolling radius is folded into the wheel coefficients, so the
+    angular wheel speeds are converted to m/s without an extra pass.
+    """
+
+    def __init__(
+        self,
+        channels: List[DerivedChannel],
+        wheel_radius_m: float = DEFAULT_WHEEL_RADIUS_M,
+    ) -> None:
+        self.channels = channels
+        self.names = [channel.name for channel in channels]
+        self.wheel_radius_m = wheel_radius_m
+        scale = np.ones((N_INPUTS, 1))
+        scale[:SPEED] = wheel_radius_m
+        self.numerators = np.array([c.numerator for c in channels]).T * scale
+        self.denominators = np.array([c.denominator for c in channels]).T * scale
+        self.thresholds = np.array([c.threshold for c in channels])
+
+    def evaluate(self, inputs: np.ndarray) -> np.ndarray:
+        """(n x 7) inputs -> (n x channels) values, NaN where undefined"""
+        numerators = inputs @ self.numerators
+        denominators = inputs @ self.denominators
+        out = np.full(numerators.shape, np.nan)
+        np.divide(
+            numerators,
+            denominators,
+            out=out,
+            where=np.abs(denominators) >= MIN_SPEED_MS,
+        )
+        return out
+
+
+def wheel_inputs(df: pd.DataFrame) -> np.ndarray:
+    """
+    The wheel speeds [rad/s] and vehicle speed [m/s] stacked into one
+    (n x 7) array
+    """
+    return df[list(WHEEL_COLUMNS) + [SPEED_COLUMN]].to_numpy(dtype=np.float64)
+
+
+@dataclass
+class WheelDynamics:
+    names: List[str]
+    mean: np.ndarray  # per channel, over valid samples
+    max_abs: np.ndarray
+    flagged_fraction: np.ndarray  # share of valid time above the threshold
+    valid_s: float
+
+    def as_dict(self) -> Dict[str, object]:
+        def per_channel(values: np.ndarray) -> Dict[str, Optional[float]]:
+            return {
+                name: None if np.isnan(value) else float(value)
+                for name, value in zip(self.names, values)
+            }
+
+        return {
+            "mean": per_channel(self.mean),
+            "max_abs": per_channel(self.max_abs),
+            "flagged_fraction": per_channel(self.flagged_fraction),
+            "valid_s": self.valid_s,
+            "anomalies": [
+                name
+                for name, fraction in zip(self.names, self.flagged_fraction)
+                if fraction > 0
+            ],
+        }
+
+
+def wheel_dynamics(
+    inputs: np.ndarray, dt_s: np.ndarray, matrix: ChannelMatrix
+) -> WheelDynamics:
+    values = matrix.evaluate(inputs)
+    valid = ~np.isnan(values)
+    weights = np.where(valid, dt_s[:, None], 0.0)
+    valid_s = weights.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        filled = np.where(valid, values, 0.0)
+        mean = (filled * weights).sum(axis=0) / valid_s
+        flagged = (np.abs(filled) > matrix.thresholds) & valid
+        flagged_fraction = (flagged * weights).sum(axis=0) / valid_s
+    max_abs = np.where(
+        valid.any(axis=0), np.abs(filled).max(axis=0, initial=0.0), np.nan
+    )
+    return WheelDynamics(
+        names=matrix.names,
+        mean=mean,
+        max_abs=max_abs,
+        flagged_fraction=flagged_fraction,
+        valid_s=float(dt_s[valid.any(axis=1)].sum()),
+    )
+
+
+wheel_radius_m = float(os.environ.get("WHEEL_RADIUS_M") or DEFAULT_WHEEL_RADIUS_M)
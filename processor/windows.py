@@ -3,6 +3,7 @@ from orca_python import WindowType, MetadataField
 trip_id = MetadataField(name="trip_id", description="Unique identifier of the trip")
 bus_id = MetadataField(name="bus_id", description="Unique identifier of the bus")
 route_id = MetadataField(name="route_id", description="Unique identifier for the route")
+stop_name = MetadataField(name="stop_name", description="Name of the stop")
 
 EveryMinute = WindowType(
     name="EveryMinute", version="1.0.0", description="Triggered every minute"
@@ -35,3 +36,10 @@ ParkBrakeApplied = WindowType(
     description="When the park brake is applied",
     metadataFields=[trip_id, bus_id, route_id],
 )
+
+StopVisit = WindowType(
+    name="StopVisit",
+    version="1.0.0",
+    description="A contiguous stay of a bus at one stop",
+    metadataFields=[trip_id, bus_id, route_id, stop_name],
+)
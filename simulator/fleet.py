@@ -0,0 +1,58 @@
+import os
+from psycopg2.extensions import connection as PGConnection
+
+# Replays the real trips as a larger virtual fleet for scale testing.
+#
+# Replica r of a trip or bus gets the id `real_id + r * VIRTUAL_ID_STRIDE` and
+# sees the real telemetry shifted forward in time by
+# `r * VIRTUAL_FLEET_OFFSET_S` seconds. Replica 0 is the real fleet. The
+# simulator owns the `virtual_fleet` table; the processor rewrites its reads
+# through it when VIRTUAL_FLEET_SIZE > 1.
+
+VIRTUAL_ID_STRIDE = 1_000_000
+VIRTUAL_FLEET_SIZE = int(os.environ.get("VIRTUAL_FLEET_SIZE", "1"))
+VIRTUAL_FLEET_OFFSET_S = int(os.environ.get("VIRTUAL_FLEET_OFFSET_S", "3600"))
+
+
+def is_virtual_fleet() -> bool:
+    return VIRTUAL_FLEET_SIZE > 1
+
+
+def fleet_tag() -> str:
+    """Names the fleet reads are rewritten through, for keying cached reads"""
+    if not is_virtual_fleet():
+        return "real"
+    return f"virtual{VIRTUAL_FLEET_SIZE}x{VIRTUAL_FLEET_OFFSET_S}s"
+
+
+def split_virtual_id(virtual_id: int) -> tuple[int, int]:
+    """Return (replica, real_id) for a virtual trip or bus id"""
+    return divmod(int(virtual_id), VIRTUAL_ID_STRIDE)
+
+
+def CreateVirtualFleetTable(
+    conn: PGConnection,
+    size: int = VIRTUAL_FLEET_SIZE,
+    offset_s: int = VIRTUAL_FLEET_OFFSET_S,
+) -> None:
+    query = """
+        CREATE TABLE IF NOT EXISTS virtual_fleet (
+            replica INTEGER PRIMARY KEY,
+            id_offset BIGINT NOT NULL,
+            time_offset INTERVAL NOT NULL
+        );
+        TRUNCATE virtual_fleet;
+        INSERT INTO virtual_fleet (replica, id_offset, time_offset)
+        SELECT
+            r,
+            r::BIGINT * %(stride)s,
+            make_interval(secs => r::DOUBLE PRECISION * %(offset_s)s)
+        FROM generate_series(0, %(size)s - 1) AS r;
+    """
+
+    with conn.cursor() as cur:
+        cur.execute(
+            query,
+            {"stride": VIRTUAL_ID_STRIDE, "offset_s": offset_s, "size": max(size, 1)},
+        )
+        conn.commit()
@@ -1,12 +1,19 @@
+import logging
 import datetime as dt
-from orca_python import EmitWindow, Window
+from dataclasses import asdict
+from orca_python import Window
 import psycopg2.extras
 from fastapi import FastAPI, Depends
 from typing import TypedDict, Generator, List
 from db import db_pool
+from emitter import window_emitter
+from fleet import CreateVirtualFleetTable
+from pyramid import CreatePyramidTables, UpdatePyramid
 from psycopg2.extensions import connection as PGConnection
 from windows import EveryMinute
 
+LOGGER = logging.getLogger(__name__)
+
 
 class ReadSimlogRow(TypedDict):
     id: int
@@ -38,14 +45,17 @@ app = FastAPI()
 
 @app.on_event("startup")
 def on_startup() -> None:
-    # Create the table on startup
+    # Create the tables on startup
     with db_pool.connection() as conn:
         CreateSimLogsTable(conn)
+        CreateVirtualFleetTable(conn)
+        CreatePyramidTables(conn)
 
 
 @app.on_event("shutdown")
 def on_shutdown() -> None:
-    # Close pool when app stops
+    # Flush any buffered windows and close pool when app stops
+    window_emitter.close()
     db_pool.close_pool()
 
 
@@ -59,6 +69,11 @@ def health() -> dict[str, str]:
     return {"status": "ok"}
 
 
+@app.get("/stats")
+def stats() -> dict[str, float]:
+    return asdict(window_emitter.stats)
+
+
 def _helper(conn: PGConnection) -> None:
     query = """
         SELECT
@@ -100,8 +115,17 @@ def _helper(conn: PGConnection) -> None:
         cur.execute(insert_query, params)
         conn.commit()
 
-    # Emit the window
-    EmitWindow(
+    # extend the downsampled telemetry up to the new clock before announcing
+    # it, so trip-level reads find the final minute built. Readers fall back
+    # to finer data otherwise, so a failure only costs read speed
+    try:
+        UpdatePyramid(conn, start_time, end_time)
+    except Exception as e:
+        conn.rollback()
+        LOGGER.error(f"Failed to update the telemetry pyramid: {e}")
+
+    # Queue the window - flushed in batches by the emitter
+    window_emitter.emit(
         Window(
             time_from=params["start_time"],
             time_to=params["end_time"],
@@ -114,16 +138,19 @@ def _helper(conn: PGConnection) -> None:
 
 @app.post("/")
 def FindAndEmitMinuteWindow(conn: PGConnection = Depends(get_db_conn)) -> None:
-    _helper(conn)
+    with window_emitter.batch():
+        _helper(conn)
 
 
 if __name__ == "__main__":
     import schedule
     import time
 
-    # Initialize table if running as script
+    # Initialize tables if running as script
     with db_pool.connection() as conn:
         CreateSimLogsTable(conn)
+        CreateVirtualFleetTable(conn)
+        CreatePyramidTables(conn)
 
     def scheduled_helper():
         """Wrapper function that gets its own connection"""
@@ -138,4 +165,5 @@ if __name__ == "__main__":
             time.sleep(0.1)  # Small sleep to prevent busy waiting
     except KeyboardInterrupt:
         print("Shutting down...")
+        window_emitter.close()
         db_pool.close_pool()